@@ -12,12 +12,14 @@
 
 import curses
 import sqlite3
-import time
 
 import npyscreen
 
 import bsWidgets as bs
 import config
+import eventLog
+import numeralSequence
+import textSearch
 
 DATEFORMAT = config.dateFormat
 DBTABLENAME = "'bookstore.Author'"
@@ -100,12 +102,14 @@ class AuthorForm(npyscreen.FormBaseNew):
 
     def exitAuthor(self, modified):
         "Exit record form."
+        if self.current_option == "Create":
+            numeralSequence.release(DBTABLENAME, self.newNumeral)   # back to the block if it wasn't used
         if modified:    # modify grid if needed
             self.update_fileRow()
             self.selectorForm.update_grid()
             self.backup_fields()
 
-        # To unlock the database (for Create) we must disconnect and re-connect:
+        # To end the transaction left open by Update or Delete, we disconnect and re-connect:
         config.conn.close()
         self.parentApp.connect_database()
 
@@ -113,34 +117,20 @@ class AuthorForm(npyscreen.FormBaseNew):
         config.parentApp.setNextForm("AUTHORSELECTOR")
         config.parentApp.switchFormNow()
 
-    def get_last_numeral(self):
-        "Get the last numeral from the database."
-        cur = config.conn.cursor()
-        sqlQuery = "SELECT Numeral FROM " + DBTABLENAME + " ORDER BY Numeral DESC LIMIT 1"
-        cur.execute(sqlQuery)
-        try:
-            numeral = cur.fetchone()[0]
-        except TypeError:   # there are no rows
-            numeral = 0
-        config.conn.commit()
-        return numeral
-
     def set_createMode():
         "Setting the author form to create a new record."
         global form
         conn = config.conn
-        while True:     # for Creation, we must set the locking here
+        while True:     # a numeral nobody else gets: no need to lock the database while the form is open
             try:
-                conn.isolation_level = 'EXCLUSIVE'  # Database locking: SQLite only allows a single writer per database
-                conn.execute('PRAGMA locking_mode = EXCLUSIVE')
-                conn.execute('BEGIN EXCLUSIVE TRANSACTION')     # exclusive access starts here. Nothing else can r/w the DB.
+                form.newNumeral = numeralSequence.next_numeral(conn, DBTABLENAME)
                 break
             except sqlite3.OperationalError:
                 bs.notify_OK("\n    Database is locked, please wait.", "Message")
         form.current_option = "Create"
         form.numeralFld.editable = True
         form.numeralFld.maximum_string_length = 3
-        form.numeralFld.value = str(form.get_last_numeral() + 1)
+        form.numeralFld.value = str(form.newNumeral)
         form.nameFld.editable = True
         form.nameFld.value = ""
         form.addressFld.editable = True
@@ -277,6 +267,7 @@ class AuthorForm(npyscreen.FormBaseNew):
         self.selectorForm.grid.set_highlight_row(int(self.numeralFld.value))
         self.exitAuthor(modified=False)
 
+    @eventLog.timed("delete")
     def delete_author(self):
         "Button based Delete function for D=Delete."
         conn = config.conn
@@ -341,7 +332,7 @@ class AuthorForm(npyscreen.FormBaseNew):
     def deleteCancelbtn_function(self):
         "Cancel button function under Delete mode."
         bs.notify("\n   Record was NOT deleted", title="Message", form_color='STANDOUT', wrap=True, wide=False)
-        time.sleep(0.4)     # let it be seen
+        bs.pause(0.4)     # let it be seen
         self.exitAuthor(modified=False)
 
     def while_editing(self, *args, **keywords):
@@ -414,16 +405,17 @@ class AuthorForm(npyscreen.FormBaseNew):
         self.statusLine.display()
         curses.beep()
 
+    @eventLog.timed("saveCreated")
     def save_created_author(self):
         "Button based Save function for C=Create."
 
         conn = config.conn
         cur = conn.cursor()
-        sqlQuery = "INSERT INTO " + DBTABLENAME + " (numeral,name,address,bio,url) VALUES (?,?,?,?,?)"
-        values = (self.numeralFld.value, self.nameFld.value, self.addressFld.value, self.bioFld.value, self.urlFld.value)
+        sqlQuery = "INSERT INTO " + DBTABLENAME + " (numeral,name,name_norm,address,bio,url) VALUES (?,?,?,?,?,?)"
+        values = (self.numeralFld.value, self.nameFld.value, textSearch.normalize(self.nameFld.value), self.addressFld.value, \
+            self.bioFld.value, self.urlFld.value)
         cur.execute(sqlQuery, values)
         conn.commit()
-        conn.isolation_level = None     # free the multiuser lock
         config.fileRow[0] = cur.lastrowid
         bs.notify("\n       Record created", title="Message", form_color='STANDOUT', wrap=True, wide=False)
 
@@ -438,6 +430,7 @@ class AuthorForm(npyscreen.FormBaseNew):
         config.fileRows.append(new_record)
         self.exitAuthor(modified=True)
 
+    @eventLog.timed("saveUpdated")
     def save_updated_author(self):
         "Button based Save function for U=Update."
 
@@ -451,8 +444,9 @@ class AuthorForm(npyscreen.FormBaseNew):
             cur.execute(sqlQuery, values)
             conn.commit()
 
-        sqlQuery = "UPDATE " + DBTABLENAME + " SET numeral=?, name=?, address=?, bio=?, url=? WHERE id=?"
-        values = (self.numeralFld.value, self.nameFld.value, self.addressFld.value, self.bioFld.value, self.urlFld.value, config.fileRow[0])
+        sqlQuery = "UPDATE " + DBTABLENAME + " SET numeral=?, name=?, name_norm=?, address=?, bio=?, url=? WHERE id=?"
+        values = (self.numeralFld.value, self.nameFld.value, textSearch.normalize(self.nameFld.value), self.addressFld.value, \
+            self.bioFld.value, self.urlFld.value, config.fileRow[0])
         try:
             cur.execute(sqlQuery, values)
             conn.commit()
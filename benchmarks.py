@@ -0,0 +1,629 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     benchmarks.py - Performance benchmark suite
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Every benchmark runs over scratch copies of the Data directory.
+#   python benchmarks.py startup [--runs N]     --> "python main.py" to first form paint
+#   python benchmarks.py importtime             --> -X importtime breakdown of the startup imports
+#   python benchmarks.py render                 --> terminal bytes written per grid keystroke
+#   python benchmarks.py similar                --> trigram index build and lookup of author names
+#   python benchmarks.py duplicates [--authors N] --> duplicate author clusters over N synthetic authors
+#   python benchmarks.py numerals [--creators N] --> concurrent record creation: exclusive lock vs numeral sequence
+#   python benchmarks.py backup [--megabytes N] --> writer latency during one-go and stepped online backups
+#   python benchmarks.py mirror [--books N]     --> book selector open and Find, on disk vs MEMORY_MIRROR
+#   python benchmarks.py tuning [--books N]     --> page size, cache, mmap, temp_store sweep, and recommended values
+#   python benchmarks.py api [--concurrency 1,2,4,...] --> HTTP read API requests per second and p99 latency
+#   python benchmarks.py daemon [--clerks N] --> save latency of N clerks editing books, direct vs database daemon
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import urllib.parse
+
+import config
+import database
+import dbBackup
+import dbDaemon
+import dbMigrations
+import duplicateAuthors
+import headlessDriver
+import numeralSequence
+import textSearch
+import trigramIndex
+
+
+def print_stats(title, values, unit="ms"):
+    print("  %-28s min %8.1f   median %8.1f   max %8.1f %s" % \
+        (title, min(values), statistics.median(values), max(values), unit))
+
+def bench_startup(args):
+    "Time from launching 'python main.py' until its first form is painted."
+    times, memory = [], []
+    for n in range(args.runs):
+        driver = headlessDriver.HeadlessDriver(command=["main.py"])
+        try:
+            times.append(driver.start() * 1000)
+            memory.append((driver.child_rss() or 0) / 1024)
+        finally:
+            driver.stop()
+    print("\nStartup: python main.py --> first form paint  (%d runs)" % args.runs)
+    print_stats("time to first paint", times)
+    print_stats("resident memory", memory, "MiB")
+
+def bench_importtime(args):
+    "Import-time breakdown (python -X importtime) of what main.py imports before the first form."
+    repoPath = os.path.dirname(os.path.abspath(__file__))
+    totals = {}
+    for n in range(args.runs):
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], \
+            cwd=repoPath, capture_output=True, text=True)
+        for line in result.stderr.splitlines():
+            # import time: self [us] | cumulative | imported package
+            if not line.startswith("import time:") or "imported package" in line:
+                continue
+            selfTime, cumulative, name = line[len("import time:"):].split("|")
+            name = name.rstrip()[1:]    # nested imports keep their extra indentation
+            totals.setdefault(name, []).append((int(selfTime), int(cumulative)))
+    modules = {name: (statistics.median(t[0] for t in times), statistics.median(t[1] for t in times)) \
+        for name, times in totals.items()}
+    mainImports = {name.strip(): v for name, v in modules.items() if name.startswith("  ") and not name.startswith("   ")}
+    print("\nImport time of 'import main'  (median of %d runs, microseconds)" % args.runs)
+    print("  total: %d us in %d modules" % (sum(v[0] for v in modules.values()), len(modules)))
+    print("  %-30s %10s %10s" % ("imported by main.py", "self", "cumulative"))
+    for name, (selfTime, cumulative) in sorted(mainImports.items(), key=lambda i: -i[1][1])[:15]:
+        print("  %-30s %10d %10d" % (name, selfTime, cumulative))
+    heavy = [name.strip() for name in modules if name.strip() in ("icu", "numpy")]
+    print("  heavy modules imported at startup: " + (", ".join(heavy) or "none"))
+
+def bench_render(args):
+    "Terminal output per keystroke while moving around the selector grids, as an SSH session would carry it."
+    keys = headlessDriver.press("DOWN", 20) + headlessDriver.press("PGDN", 5) + headlessDriver.press("UP", 20) + \
+        headlessDriver.press("RIGHT") + headlessDriver.press("DOWN", 20) + headlessDriver.press("LEFT")
+    for name, option in (("book grid", "1"), ("author grid", "2")):
+        results = []
+        for n in range(args.runs):
+            firstPaint, stepResults = headlessDriver.run_scenario(name, [option] + keys)
+            results += stepResults[1:]
+        print("\nRender: %s  (%d runs)" % (name, args.runs))
+        print("  %-10s %10s %10s %10s" % ("key", "bytes/key", "p50 ms", "p95 ms"))
+        for step, s in headlessDriver.summarize(results).items():
+            print("  %-10s %10d %10.2f %10.2f" % (step, s["bytes"], s["p50"], s["p95"]))
+
+def bench_similar(args):
+    "Trigram index over the author names, grown to thousands with misspelt copies, and similar-name lookups."
+    conn = sqlite3.connect("file:" + config.dataPath + config.dbname + "?mode=ro", uri=True)
+    names = [row[0] for row in conn.execute("SELECT name FROM 'bookstore.Author'")]
+    conn.close()
+    variants = [lambda n: n, textSearch.normalize, lambda n: n.split(",")[0], lambda n: n[:-2], lambda n: n.replace("e", "a", 1)]
+    corpus = []
+    for copy in range(4):
+        for variant in variants:
+            for name in names:
+                corpus.append((len(corpus), variant(name) + (" %d" % copy if copy else "")))
+    builds, lookups = [], []
+    for n in range(args.runs):
+        start = time.perf_counter()
+        index = trigramIndex.TrigramIndex(corpus)
+        builds.append((time.perf_counter() - start) * 1000)
+        for name in names:
+            start = time.perf_counter()
+            index.search(textSearch.normalize(name)[:-1])
+            lookups.append((time.perf_counter() - start) * 1000)
+    print("\nSimilar names: trigram index of %d names  (%d runs)" % (len(corpus), args.runs))
+    print_stats("index build", builds)
+    print_stats("lookup", lookups)
+
+def bench_duplicates(args):
+    "Blocking-key clustering of duplicate authors over a synthetic in-memory author table."
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE 'bookstore.author' (numeral INTEGER, name TEXT, name_norm TEXT)")
+    conn.execute("CREATE TABLE 'bookstore.book_author' (author_num INTEGER)")
+    def names():
+        for n in range(args.authors):
+            surname, given = "Sánchez%d Gómez" % (n // 4), "Ramón%d" % (n // 4)
+            name = (surname + ", " + given, surname.upper() + ", " + given[0] + ".", \
+                given + " " + surname, surname + ", " + given + " " + str(n))[n % 4]    # 3 duplicates every 4
+            yield n + 1, name, textSearch.normalize(name)
+    conn.executemany("INSERT INTO 'bookstore.author' VALUES (?,?,?)", names())
+    times = []
+    for n in range(args.runs):
+        start = time.perf_counter()
+        clusters = duplicateAuthors.find_clusters(conn)
+        times.append(time.perf_counter() - start)
+    print("\nDuplicate authors: %d authors, %d clusters found  (%d runs)" % (args.authors, len(clusters), args.runs))
+    print_stats("find clusters", times, "s")
+
+def numeral_creator(filename, locked, records, think, start, results):
+    "One clerk creating authors, with the form open think seconds each time. Sends its (numeral, seconds) list."
+    conn = database.connect(filename)
+    conn.execute("PRAGMA busy_timeout = 60000")
+    created = []
+    start.wait()
+    for n in range(records):
+        begin = time.perf_counter()
+        if locked:      # the old way: the whole database is locked while the Create form is open
+            conn.execute("BEGIN EXCLUSIVE")
+            numeral = conn.execute("SELECT Numeral FROM 'bookstore.Author' ORDER BY Numeral DESC LIMIT 1").fetchone()[0] + 1
+        else:
+            numeral = numeralSequence.next_numeral(conn, "'bookstore.Author'")
+        time.sleep(think)
+        conn.execute("INSERT INTO 'bookstore.Author' (numeral, name, address, bio, url) VALUES (?,?,?,?,?)", \
+            (numeral, "Benchmark author %d-%d" % (os.getpid(), n), "", "", ""))
+        conn.commit()
+        created.append((numeral, time.perf_counter() - begin))
+    results.put(created)
+
+def bench_numerals(args):
+    "Concurrent creators of new records: numerals under an exclusive lock vs reserved from the sequence table."
+    tempdir = tempfile.mkdtemp(prefix="bookstore-bench-")
+    try:
+        print("\nNumerals: %d concurrent creators, %d records each, form open %.0f ms  (%d runs)" % \
+            (args.creators, args.records, args.think * 1000, args.runs))
+        for title, locked in (("exclusive lock", True), ("numeral sequence", False)):
+            walls, latencies, unique = [], [], True
+            for run in range(args.runs):
+                filename = os.path.join(tempdir, "bench.db")
+                shutil.copyfile(config.dataPath + config.dbname, filename)
+                dbMigrations.migrate(database.connect(filename))
+                start, results = multiprocessing.Event(), multiprocessing.Queue()
+                creators = [multiprocessing.Process(target=numeral_creator, \
+                    args=(filename, locked, args.records, args.think, start, results)) for n in range(args.creators)]
+                for p in creators:
+                    p.start()
+                begin = time.perf_counter()
+                start.set()
+                created = [row for p in creators for row in results.get()]
+                walls.append(time.perf_counter() - begin)
+                for p in creators:
+                    p.join()
+                latencies += [seconds * 1000 for numeral, seconds in created]
+                unique = unique and len({numeral for numeral, seconds in created}) == len(created)
+            print("  " + title + ":  " + ("all numerals unique" if unique else "DUPLICATE NUMERALS"))
+            print_stats("total time", walls, "s")
+            print_stats("one creation", latencies)
+    finally:
+        shutil.rmtree(tempdir)
+
+def backup_writer(filename, stop, results):
+    "A clerk saving a record every few milliseconds. Sends the list of commit times, in seconds."
+    conn = database.connect(filename)
+    conn.execute("PRAGMA busy_timeout = 60000")
+    times, n = [], 0
+    while not stop.is_set():
+        begin = time.perf_counter()
+        conn.execute("UPDATE 'bookstore.Author' SET bio = ? WHERE numeral = 1", ("bio %d" % n,))
+        conn.commit()
+        times.append(time.perf_counter() - begin)
+        n += 1
+        time.sleep(0.005)
+    results.put(times)
+
+def bench_backup(args):
+    "Commit latency of a concurrent writer while the database is backed up in one go, and in small steps."
+    tempdir = tempfile.mkdtemp(prefix="bookstore-bench-")
+    try:
+        filename = os.path.join(tempdir, "bench.db")
+        shutil.copyfile(config.dataPath + config.dbname, filename)
+        conn = database.connect(filename)
+        bio = "x" * 1000
+        conn.executemany("INSERT INTO 'bookstore.Author' (numeral, name, address, bio, url) VALUES (?,?,?,?,?)", \
+            ((100000 + n, "Padding author %d" % n, "", bio, "") for n in range(args.megabytes * 1000)))
+        conn.commit()
+        conn.close()
+        print("\nBackup: %d MB database, a writer committing every 5 ms  (%d runs)" % \
+            (os.path.getsize(filename) // 1024 // 1024, args.runs))
+        variants = (("one go", -1, 0, "delete"), ("stepped", config.backupPages, config.backupPause, "delete"), \
+            ("stepped, WAL mode", config.backupPages, config.backupPause, "wal"))
+        for title, pages, pause, journalMode in variants:
+            conn = sqlite3.connect(filename)
+            conn.execute("PRAGMA journal_mode = " + journalMode)
+            conn.close()
+            durations, stalls, commits, restarts = [], [], [], 0
+            for run in range(args.runs):
+                stop, results = multiprocessing.Event(), multiprocessing.Queue()
+                writer = multiprocessing.Process(target=backup_writer, args=(filename, stop, results))
+                writer.start()
+                time.sleep(0.2)
+                result = dbBackup.backup(filename, os.path.join(tempdir, "Backups"), pages, pause, keep=1)
+                time.sleep(0.2)
+                stop.set()
+                commits += [seconds * 1000 for seconds in results.get()]
+                writer.join()
+                durations.append(result["seconds"])
+                stalls.append(result["longest_step"] * 1000)
+                restarts += result["restarts"]
+            print("  " + title + (" (%d pages per step, %.0f ms pause)" % (pages, pause * 1000) if pages > 0 else "") + \
+                (", %d restarts" % restarts if restarts else ""))
+            print_stats("backup time", durations, "s")
+            print_stats("longest step", stalls)
+            print_stats("writer commit", commits)
+    finally:
+        shutil.rmtree(tempdir)
+
+FIND_LITERALS = ["fontana", "garcia", "title:mar", "publisher:salvat", "zzz"]
+
+# the book listing query, with every filter at '%' (see bookListing.generateListing)
+LISTING_QUERY = "SELECT 'bookstore.Book'.book_title, 'bookstore.Author'.name, 'bookstore.Book'.year, " \
+    "'bookstore.Publisher'.name, 'bookstore.Warehouse'.code, 'bookstore.Book'.genre_id FROM 'bookstore.Book_author' " \
+    "INNER JOIN 'bookstore.Book' ON 'bookstore.Book'.numeral = 'bookstore.Book_author'.book_num " \
+    "INNER JOIN 'bookstore.Author' ON 'bookstore.Author'.numeral = 'bookstore.Book_author'.author_num " \
+    "INNER JOIN 'bookstore.Publisher' ON 'bookstore.Publisher'.numeral = 'bookstore.Book'.publisher_num " \
+    "LEFT JOIN 'bookstore.Book_warehouse' ON 'bookstore.Book_warehouse'.book_num = 'bookstore.Book_author'.book_num " \
+    "LEFT JOIN 'bookstore.Warehouse' ON 'bookstore.Warehouse'.numeral = 'bookstore.Book_warehouse'.warehouse_num " \
+    "WHERE 'bookstore.Book'.book_title LIKE '%' AND 'bookstore.Author'.name LIKE '%' " \
+    "GROUP BY 'bookstore.Book'.book_title, 'bookstore.Book'.publisher_num, 'bookstore.Book_warehouse'.warehouse_num " \
+    "ORDER BY 'bookstore.Book'.book_title"
+
+def book_database(filename, books, padding=0):
+    "Migrated copy of the database with its books repeated up to about books, padding bytes more of description each."
+    shutil.copyfile(config.dataPath + config.dbname, filename)
+    conn = database.connect(filename)
+    dbMigrations.migrate(conn)
+    rows = conn.execute("SELECT * FROM 'bookstore.book'").fetchall()
+    authors = conn.execute("SELECT * FROM 'bookstore.book_author'").fetchall()
+    warehouses = conn.execute("SELECT * FROM 'bookstore.book_warehouse'").fetchall()
+    for copy in range(1, books // len(rows)):
+        base = 100000 * copy
+        conn.executemany("INSERT INTO 'bookstore.book' (numeral, book_title, title_norm, original_title, description, isbn, year, " \
+            "publisher_num, creation_date, genre_id, cover_type, price) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)", \
+            ((base + b[1], b[2] + " %d" % copy, textSearch.normalize(b[2] + " %d" % copy), b[3], b[4] + "x" * padding) + tuple(b[5:12]) \
+                for b in rows))
+        conn.executemany("INSERT INTO 'bookstore.book_author' (book_num, author_num, is_main_author) VALUES (?,?,?)", \
+            ((base + a[1], a[2], a[3]) for a in authors))
+        conn.executemany("INSERT INTO 'bookstore.book_warehouse' (book_num, warehouse_num, bookshelf, stock) VALUES (?,?,?,?)", \
+            ((base + w[1], w[2], w[3], w[4]) for w in warehouses))
+    conn.commit()
+    count = conn.execute("SELECT count(*) FROM 'bookstore.book'").fetchone()[0]
+    conn.close()
+    return count
+
+def book_selector():
+    "The book selector methods that read the database, without the screen."
+    import bookSelector
+    form = types.SimpleNamespace(set_up_title=lambda filerows, full_set: None)
+    for name in ("readDBTable", "convert_rows", "find_query", "get_author_name", "get_publisher_name", "DBtoScreenDate", "date_warning"):
+        setattr(form, name, getattr(bookSelector.BookSelectForm, name).__get__(form))
+    return form
+
+def bench_mirror(args):
+    "Book selector open (the whole grid) and Find queries, reading the database file vs its in-memory mirror."
+    tempdir = tempfile.mkdtemp(prefix="bookstore-bench-")
+    saved = config.conn, config.MEMORY_MIRROR
+    try:
+        filename = os.path.join(tempdir, "bench.db")
+        count = book_database(filename, args.books)
+        form = book_selector()
+        print("\nMemory mirror: %d books  (%d runs)" % (count, args.runs))
+        for mirror in (False, True):
+            config.MEMORY_MIRROR = mirror
+            config.conn = database.connect(filename)
+            database._mirrorStamp = database._mirrorVersion = None    # another file
+            start = time.perf_counter()
+            database.reader()
+            load = (time.perf_counter() - start) * 1000
+            opens, finds = [], []
+            for run in range(args.runs):
+                start = time.perf_counter()
+                form.readDBTable()
+                opens.append((time.perf_counter() - start) * 1000)
+                for literal in FIND_LITERALS:
+                    sqlQuery, values, likeColumns = form.find_query(literal)
+                    start = time.perf_counter()
+                    database.reader().execute(sqlQuery, values).fetchall()     # not through the Find cache
+                    finds.append((time.perf_counter() - start) * 1000)
+            other = database.connect(filename)
+            refreshes = []
+            for run in range(args.runs):
+                other.execute("UPDATE 'bookstore.book' SET price = price + 1 WHERE numeral = 1")
+                other.commit()
+                start = time.perf_counter()
+                database.reader()
+                refreshes.append((time.perf_counter() - start) * 1000)
+            other.close()
+            print("  " + ("in-memory mirror (loaded in %.1f ms)" % load if mirror else "on disk"))
+            print_stats("selector open", opens)
+            print_stats("Find", finds)
+            print_stats("after another's commit", refreshes)
+            config.conn.close()
+    finally:
+        config.conn, config.MEMORY_MIRROR = saved
+        shutil.rmtree(tempdir)
+
+
+def tuning_workloads(filename, form, runs):
+    "Medians in ms of the book selector open, the Finds and the listing, each run on a new connection as after a form exit."
+    selector, find, listing = [], [], []
+    for run in range(runs):
+        config.conn = database.connect(filename)
+        start = time.perf_counter()
+        form.readDBTable()
+        selector.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        for literal in FIND_LITERALS:
+            sqlQuery, values, likeColumns = form.find_query(literal)
+            config.conn.execute(sqlQuery, values).fetchall()
+        find.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        config.conn.execute(LISTING_QUERY).fetchall()
+        listing.append((time.perf_counter() - start) * 1000)
+        config.conn.close()
+    return statistics.median(selector), statistics.median(find), statistics.median(listing)
+
+def bench_tuning(args):
+    "Page size, page cache, memory mapping, temp_store and statement cache swept over the selector, Find and listing."
+    tempdir = tempfile.mkdtemp(prefix="bookstore-bench-")
+    settings = ("pageSize", "pageCacheKB", "mmapSize", "tempStore", "statementCache")
+    saved = config.conn, config.MEMORY_MIRROR, [getattr(config, name) for name in settings]
+    try:
+        base = os.path.join(tempdir, "bench.db")
+        count = book_database(base, args.books, padding=1000)
+        form = book_selector()
+        config.MEMORY_MIRROR = False
+        print("\nTuning: %d books, %d MB  (%d runs, medians in ms; 5 Finds together)" % \
+            (count, os.path.getsize(base) // 1024 // 1024, args.runs))
+        print("  %6s %10s %9s %11s %6s   %9s %9s %9s %9s" % \
+            ("page", "cache KiB", "mmap MiB", "temp_store", "stmts", "selector", "Find", "listing", "total"))
+        results = []
+        def measure(filename, pageSize, cacheKB, mmapSize, tempStore, statementCache):
+            config.pageCacheKB, config.mmapSize, config.tempStore, config.statementCache = cacheKB, mmapSize, tempStore, statementCache
+            times = tuning_workloads(filename, form, args.runs)
+            results.append((sum(times), (pageSize, cacheKB, mmapSize, tempStore, statementCache), filename))
+            print("  %6d %10d %9d %11s %6d   %9.1f %9.1f %9.1f %9.1f" % \
+                ((pageSize, cacheKB, mmapSize // 1024 // 1024, tempStore, statementCache) + times + (sum(times),)))
+        def page_copy(pageSize):
+            filename = os.path.join(tempdir, "page-%d.db" % pageSize)
+            if not os.path.exists(filename):
+                shutil.copyfile(base, filename)
+                conn = sqlite3.connect(filename)
+                conn.execute("PRAGMA page_size = %d" % pageSize)
+                conn.execute("VACUUM")
+                conn.close()
+            return filename
+        current = saved[2]
+        measure(page_copy(current[0]), *current)    # the current settings first: what to beat
+        for pageSize in (4096, 8192, 16384):
+            filename = page_copy(pageSize)
+            for cacheKB in (2000, 16384, 65536):
+                for mmapSize in (0, 256 * 1024 * 1024):
+                    measure(filename, pageSize, cacheKB, mmapSize, "DEFAULT", 128)
+        total, (pageSize, cacheKB, mmapSize, tempStore, statementCache), filename = min(results)
+        for tempStore in ("DEFAULT", "MEMORY"):     # then the rest, over the best of the above
+            for statementCache in (32, 128, 512):
+                measure(filename, pageSize, cacheKB, mmapSize, tempStore, statementCache)
+        total, (pageSize, cacheKB, mmapSize, tempStore, statementCache), filename = min(results)
+        if total > results[0][0] * 0.9:
+            print("  nothing is 10% faster than the current settings (the first line): keep them")
+            return
+        print("  recommended in config.py (mmapSize only if the database is on a local disk):")
+        print("    pageCacheKB = %d\n    mmapSize = %d\n    pageSize = %d\n    tempStore = \"%s\"\n    statementCache = %d" % \
+            (cacheKB, mmapSize, pageSize, tempStore, statementCache))
+    finally:
+        config.conn, config.MEMORY_MIRROR, values = saved
+        for name, value in zip(settings, values):
+            setattr(config, name, value)
+        shutil.rmtree(tempdir)
+
+def api_urls(filename, count):
+    "A storefront mix of API requests: list pages at any depth, book records and Finds."
+    conn = sqlite3.connect(filename)
+    numerals = [row[0] for row in conn.execute("SELECT numeral FROM 'bookstore.book'")]
+    conn.close()
+    rand = random.Random(0)
+    urls = []
+    for n in range(count):
+        kind = n % 4
+        if kind == 0:
+            urls.append("/books?after=%d&limit=50" % rand.choice(numerals))
+        elif kind == 1:
+            urls.append("/books/%d" % rand.choice(numerals))
+        elif kind == 2:
+            urls.append("/authors?limit=50")
+        else:
+            urls.append("/find?" + urllib.parse.urlencode({"q": rand.choice(FIND_LITERALS), "limit": 50}))
+    return urls
+
+def api_load(port, urls, concurrency, etags=None):
+    "GET the urls with concurrency clients. Returns (requests per second, [latencies in ms], statuses)."
+    latencies, statuses, lock = [], {}, threading.Lock()
+    def client(share):
+        for url in share:
+            headers = {"If-None-Match": etags[url]} if etags and url in etags else {}
+            start = time.perf_counter()
+            connection = http.client.HTTPConnection("127.0.0.1", port)
+            connection.request("GET", url, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            connection.close()
+            with lock:
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[response.status] = statuses.get(response.status, 0) + 1
+                if etags is not None and response.status == 200:
+                    etags[url] = response.getheader("ETag")
+    threads = [threading.Thread(target=client, args=(urls[n::concurrency],)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(urls) / (time.perf_counter() - start), latencies, statuses
+
+def bench_api(args):
+    "Requests per second and latency of the HTTP read API (httpApi.py) at several client concurrencies."
+    tempdir = tempfile.mkdtemp(prefix="bookstore-bench-")
+    server = None
+    try:
+        filename = os.path.join(tempdir, "bench.db")
+        books = book_database(filename, args.books)
+        with socket.socket() as s:      # a free port
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+        repoPath = os.path.dirname(os.path.abspath(__file__))
+        server = subprocess.Popen([sys.executable, "httpApi.py", "--db", filename, "--port", str(port), \
+            "--workers", str(args.workers)], cwd=repoPath, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        server.stdout.readline()    # "Serving ..."
+        urls = api_urls(filename, args.requests)
+        api_load(port, urls[:100], 4)   # warm up: connections of the pool opened, pages cached
+        print("\nHTTP API: %d books, %d workers, %d requests per level (list pages, book records, Finds)" % \
+            (books, args.workers, len(urls)))
+        print("  %-12s %10s %9s %9s   %-28s" % ("clients", "req/s", "p50 ms", "p99 ms", "revalidated (If-None-Match)"))
+        for concurrency in [int(c) for c in args.concurrency.split(",")]:
+            rate, latencies, statuses = api_load(port, urls, concurrency)
+            etags = {}
+            api_load(port, urls, concurrency, etags)    # the clients learn the ETags...
+            rate304, latencies304, statuses304 = api_load(port, urls, concurrency, etags)   # ...and revalidate
+            p99 = lambda values: statistics.quantiles(values, n=100)[98]
+            errors = sum(count for status, count in statuses.items() if status != 200)
+            print("  %-12d %10.0f %9.1f %9.1f   %6.0f req/s, p99 %.1f ms, %d%% 304%s" % (concurrency, rate, \
+                statistics.median(latencies), p99(latencies), rate304, p99(latencies304), \
+                100 * statuses304.get(304, 0) // len(urls), (", %d errors" % errors) if errors else ""))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(tempdir)
+
+def daemon_clerk(filename, socketPath, lockAtOpen, edits, think, start, results):
+    """One clerk editing books: Update form open think seconds, then Save (the book price and its stock).
+    Sends its (waits to open, saves) in ms, and the edits that failed."""
+    if socketPath is None:
+        conn = database.connect(filename)
+        conn.execute("PRAGMA busy_timeout = 60000")
+    else:
+        conn = dbDaemon.connect(socketPath)
+    numerals = [row[0] for row in conn.execute("SELECT numeral FROM 'bookstore.book'")]
+    rng = random.Random(os.getpid())
+    opens, saves, errors = [], [], 0
+    start.wait()
+    for n in range(edits):
+        numeral = rng.choice(numerals)
+        try:
+            begin = time.perf_counter()
+            if lockAtOpen:      # as set_updateMode() does: the database is locked while the form is open
+                conn.isolation_level = 'EXCLUSIVE'
+                conn.execute('BEGIN EXCLUSIVE TRANSACTION')
+            price = conn.execute("SELECT price FROM 'bookstore.book' WHERE numeral = ?", (numeral,)).fetchone()[0]
+            opened = time.perf_counter()
+            time.sleep(think)
+            saving = time.perf_counter()
+            conn.execute("UPDATE 'bookstore.book' SET price = ? WHERE numeral = ?", (price + 1, numeral))
+            conn.execute("UPDATE 'bookstore.book_warehouse' SET stock = stock + 1 WHERE book_num = ?", (numeral,))
+            conn.commit()
+            opens.append((opened - begin) * 1000)
+            saves.append((time.perf_counter() - saving) * 1000)
+        except sqlite3.OperationalError:
+            conn.rollback()
+            errors += 1
+    conn.close()
+    results.put((opens, saves, errors))
+
+def bench_daemon(args):
+    "Clerks editing books at the same time: each terminal on the file vs all of them through the database daemon."
+    tempdir = tempfile.mkdtemp(prefix="bookstore-bench-")
+    try:
+        print("\nDatabase daemon: %d clerks, %d edits each, form open %.0f ms  (%d runs)" % \
+            (args.clerks, args.records, args.think * 1000, args.runs))
+        p99 = lambda values: statistics.quantiles(values, n=100)[98]
+        modes = (("direct, locked at form open", False, True), ("direct, locked at Save", False, False),
+            ("database daemon", True, True))
+        for title, daemon, lockAtOpen in modes:
+            opens, saves, walls, errors, groups = [], [], [], 0, []
+            for run in range(args.runs):
+                filename = os.path.join(tempdir, "bench.db")
+                shutil.copyfile(config.dataPath + config.dbname, filename)
+                dbMigrations.migrate(database.connect(filename))
+                server, socketPath = None, None
+                if daemon:
+                    socketPath = os.path.join(tempdir, "daemon.sock")
+                    server = subprocess.Popen([sys.executable, "dbDaemon.py", "--db", filename, "--socket", socketPath], \
+                        cwd=os.path.dirname(os.path.abspath(__file__)), stdout=subprocess.PIPE, text=True)
+                    server.stdout.readline()    # "Serving ..."
+                try:
+                    start, results = multiprocessing.Event(), multiprocessing.Queue()
+                    clerks = [multiprocessing.Process(target=daemon_clerk, \
+                        args=(filename, socketPath, lockAtOpen, args.records, args.think, start, results)) for n in range(args.clerks)]
+                    for p in clerks:
+                        p.start()
+                    time.sleep(0.5)     # every clerk connected
+                    begin = time.perf_counter()
+                    start.set()
+                    for p in clerks:
+                        clerkOpens, clerkSaves, clerkErrors = results.get()
+                        opens += clerkOpens
+                        saves += clerkSaves
+                        errors += clerkErrors
+                    walls.append(time.perf_counter() - begin)
+                    for p in clerks:
+                        p.join()
+                    if daemon:
+                        conn = dbDaemon.connect(socketPath)
+                        transactions, commits = conn.stats()
+                        conn.close()
+                        groups.append(transactions / max(commits, 1))
+                finally:
+                    if server is not None:
+                        server.terminate()
+                        server.wait()
+            edits = args.clerks * args.records
+            print("  " + title + ":  %.0f edits/s%s%s" % (edits * args.runs / sum(walls), \
+                (", %.1f saves per COMMIT" % statistics.mean(groups)) if groups else "", \
+                (", %d FAILED" % errors) if errors else ""))
+            for name, values in (("wait to open the form", opens), ("save", saves)):
+                print_stats(name, values)
+                print("  %-28s p99 %8.1f ms" % ("", p99(values)))
+    finally:
+        shutil.rmtree(tempdir)
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "importtime": bench_importtime,
+    "render": bench_render,
+    "similar": bench_similar,
+    "duplicates": bench_duplicates,
+    "numerals": bench_numerals,
+    "backup": bench_backup,
+    "mirror": bench_mirror,
+    "tuning": bench_tuning,
+    "api": bench_api,
+    "daemon": bench_daemon,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bookstore performance benchmarks.")
+    parser.add_argument("benchmarks", nargs="*", default=list(BENCHMARKS), help=", ".join(BENCHMARKS))
+    parser.add_argument("--runs", type=int, default=5, help="repetitions of each measure")
+    parser.add_argument("--authors", type=int, default=500000, help="synthetic authors for the duplicates benchmark")
+    parser.add_argument("--creators", type=int, default=10, help="concurrent creators for the numerals benchmark")
+    parser.add_argument("--records", type=int, default=20, help="records created (or edited) by each of them")
+    parser.add_argument("--clerks", type=int, default=20, help="clerks editing books at once, for the daemon benchmark")
+    parser.add_argument("--books", type=int, default=20000, help="books for the mirror, tuning and api benchmarks")
+    parser.add_argument("--workers", type=int, default=config.apiWorkers, help="worker threads of the API server")
+    parser.add_argument("--concurrency", default="1,2,4,8,16", help="concurrent API clients, for each level")
+    parser.add_argument("--requests", type=int, default=2000, help="API requests at each concurrency level")
+    parser.add_argument("--megabytes", type=int, default=50, help="database size for the backup benchmark")
+    parser.add_argument("--think", type=float, default=0.01, help="seconds the Create form stays open")
+    args = parser.parse_args()
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            print("Unknown benchmark: " + name)
+            sys.exit(2)
+        BENCHMARKS[name](args)
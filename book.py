@@ -12,20 +12,32 @@
 
 import curses
 import decimal
-import locale
 import sqlite3
-import time
 from decimal import Decimal
 
-import icu
 import npyscreen
 
 import bsWidgets as bs
 import config
+import eventLog
+import numeralSequence
+import textSearch
+import trigramIndex
 
 DATEFORMAT = config.dateFormat
 DBTABLENAME = "'bookstore.book'"
 
+_warehouseMap = (None, {}, {})     # (database stamp, code --> numeral, numeral --> code)
+
+def warehouse_map(conn):
+    "Warehouse code --> numeral and numeral --> code dictionaries, up to date with the database."
+    global _warehouseMap
+    stamp = (id(conn), conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+    if _warehouseMap[0] != stamp:
+        rows = conn.execute("SELECT code, numeral FROM 'bookstore.warehouse'").fetchall()
+        _warehouseMap = (stamp, dict(rows), {numeral: code for code, numeral in rows})
+    return _warehouseMap[1], _warehouseMap[2]
+
 global form
 
 helpText =  "The book form is a typical record selector form.\n\n" +\
@@ -163,7 +175,7 @@ class BookForm(npyscreen.FormBaseNew):
         for row in filerows:
             author_list.append((row[0],))    # authors = [('literal',)]
         # We need PyICU (=icu) to order unicode strings in Spanish, Catalan, French...
-        collator = icu.Collator.createInstance(icu.Locale(locale.getlocale()[0]))
+        collator = bs.get_collator()
         aux_list = [i[0] for i in author_list]
         aux_list.sort(key=collator.getSortKey)
         author_list = [(i,) for i in aux_list]
@@ -183,7 +195,7 @@ class BookForm(npyscreen.FormBaseNew):
             publisher_list.append(name)
             publisher_dict[name] = numeral 
         # We need PyICU (=icu) to order unicode strings in spanish+catalan
-        collator = icu.Collator.createInstance(icu.Locale(locale.getlocale()[0]))
+        collator = bs.get_collator()
         aux_list = [i for i in publisher_list]
         aux_list.sort(key=collator.getSortKey)
 
@@ -198,46 +210,60 @@ class BookForm(npyscreen.FormBaseNew):
         cur.execute("SELECT code FROM 'bookstore.Warehouse' ORDER BY code")
         filerows = cur.fetchall()
         # We need PyICU (=icu) to order unicode strings in spanish+catalan
-        collator = icu.Collator.createInstance(icu.Locale(locale.getlocale()[0]))
+        collator = bs.get_collator()
         aux_list = [i[0] for i in filerows]
         aux_list.sort(key=collator.getSortKey)
         wh_list = [(i,) for i in aux_list]
         return wh_list
 
     def get_book_warehouses(self):
-        "Read all the warehouses of this book."
+        "Read all the warehouses of this book: a string enumerating their codes."
         conn = config.conn
         cur = conn.cursor()
         book_num = self.numeralFld.value
-        sqlQuery = "SELECT warehouse_num FROM 'bookstore.book_warehouse' WHERE book_num=? ORDER BY warehouse_num"
+        sqlQuery = "SELECT warehouse_num, code FROM 'bookstore.book_warehouse' " \
+            "LEFT JOIN 'bookstore.warehouse' ON 'bookstore.warehouse'.numeral = warehouse_num " \
+            "WHERE book_num=? ORDER BY warehouse_num"
         cur.execute(sqlQuery, (book_num,) )
-        filerows = cur.fetchall()
-        warehousesField = self.set_warehouses_field(filerows)
-        return warehousesField
-
-    def set_warehouses_field(self, filerows):
-        "Sets a string enumerating the warehouse(s) code(s) of this book."
-        conn = config.conn
-        cur = conn.cursor()
-        whList = []
-        count = 0
-        for wh in filerows:
-            sqlQuery = "SELECT code FROM 'bookstore.warehouse' WHERE numeral=? ORDER BY numeral"
-            cur.execute(sqlQuery, ( str(wh[0]),) )
-            try:
-                filerow = cur.fetchone()
-                whList.append(filerow)
-            except TypeError:
-                bs.notify_OK("\n     Publisher of numeral " + str(wh[0]) + " was not found. ", "Message")
-
-        fieldString = ""
-        for wh in whList:
-            if count > 0:
-                fieldString += ", "
-            count += 1
-            fieldString += wh[0]
-        
-        return fieldString
+        codes = []
+        for warehouse_num, code in cur.fetchall():
+            if code == None:
+                bs.notify_OK("\n     Warehouse of numeral " + str(warehouse_num) + " was not found. ", "Message")
+            else:
+                codes.append(code)
+        return ", ".join(codes)
+
+    def warehouse_changes(self):
+        "Warehouse numerals to add to and to remove from this book, as (added, removed), or None if cancelled."
+        codeToNumeral, numeralToCode = warehouse_map(config.conn)
+        new = set()
+        for wh in self.warehousesFld.value.split(","):
+            wh = wh.strip()
+            if wh == "":    # clean up the list for extra commas
+                continue
+            if wh not in codeToNumeral:    # warehouse does not exist, we don't create it at this point.
+                message = "\n   Warehouse '" + wh + "' was not found. Create it beforehand."
+                bs.notify_OK(message, title="", wrap=True, editw = 1,)
+                continue
+            new.add(codeToNumeral[wh])
+        sqlQuery = "SELECT warehouse_num FROM 'bookstore.book_warehouse' WHERE book_num=?"
+        old = {row[0] for row in config.conn.execute(sqlQuery, (int(self.numeralFld.value),))}
+        removed = sorted(old - new)
+        for warehouse_num in removed:
+            message = "\n   Select OK to delete warehouse '" + numeralToCode.get(warehouse_num, str(warehouse_num)) + "' for this book."
+            if not bs.notify_ok_cancel(message, title="", wrap=True, editw = 1,):
+                bs.notify_OK("\n  Nothing was deleted.", "Message")
+                return None
+        return sorted(new - old), removed
+
+    def save_warehouse_changes(self, cur, changes):
+        "Apply the warehouse changes to the book_warehouse intermediate table. The caller commits."
+        added, removed = changes
+        book_num = int(self.numeralFld.value)
+        sqlQuery = "INSERT INTO 'bookstore.book_warehouse' (book_num, warehouse_num, bookshelf, stock) VALUES (?,?,?,?)"
+        cur.executemany(sqlQuery, [(book_num, warehouse_num, None, None) for warehouse_num in added])
+        sqlQuery = "DELETE FROM 'bookstore.book_warehouse' WHERE book_num=? AND warehouse_num=?"
+        cur.executemany(sqlQuery, [(book_num, warehouse_num) for warehouse_num in removed])
 
     def backup_fields(self):
         "Fill backup variables"
@@ -286,39 +312,28 @@ class BookForm(npyscreen.FormBaseNew):
 
     def exitBook(self, modified):
         "Exit record form."
+        if self.current_option == "Create":
+            numeralSequence.release(DBTABLENAME, self.newNumeral)   # back to the block if it wasn't used
         if modified:    # modify grid if needed
             self.update_fileRow()
             self.selectorForm.update_grid()
             self.backup_fields()
         self.selectorForm.grid.update()
 
-        # To unlock the database (for Create) we must disconnect and re-connect:
+        # To end the transaction left open by Update or Delete, we disconnect and re-connect:
         config.conn.close()
         self.parentApp.connect_database()
 
         config.parentApp.setNextForm("BOOKSELECTOR")
         config.parentApp.switchFormNow()
 
-    def get_last_numeral(self, table_name):
-        "Get the last numeral in the table."
-        cur = config.conn.cursor()
-        sqlQuery = "SELECT Numeral FROM " + table_name + " ORDER BY Numeral DESC LIMIT 1"
-        cur.execute(sqlQuery)
-        try:
-            numeral = cur.fetchone()[0]
-        except TypeError:   # there are no rows
-            numeral = 0
-        return numeral
-
     def set_createMode():
         "Setting the book form to create a new record."
         global form
         conn = config.conn
-        while True:     # for Creation, we must set the locking here
+        while True:     # a numeral nobody else gets: no need to lock the database while the form is open
             try:
-                conn.isolation_level = 'EXCLUSIVE'  # Database locking: SQLite only allows a single writer per database
-                conn.execute('PRAGMA locking_mode = EXCLUSIVE')
-                conn.execute('BEGIN EXCLUSIVE TRANSACTION')     # exclusive access starts here. Nothing else can r/w the DB.
+                form.newNumeral = numeralSequence.next_numeral(conn, DBTABLENAME)
                 break
             except sqlite3.OperationalError:
                 bs.notify_OK("\n    Database is locked, please wait.", "Message")
@@ -326,7 +341,7 @@ class BookForm(npyscreen.FormBaseNew):
         form.current_option = "Create"
         form.numeralFld.editable = True
         form.numeralFld.maximum_string_length = 6
-        form.numeralFld.value = str(form.get_last_numeral(DBTABLENAME) + 1)
+        form.numeralFld.value = str(form.newNumeral)
         form.bookTitleFld.editable = True
         form.bookTitleFld.value = ""
         form.originalTitleFld.editable = True
@@ -540,6 +555,7 @@ class BookForm(npyscreen.FormBaseNew):
         self.selectorForm.grid.set_highlight_row(int(self.numeralFld.value))
         self.exitBook(modified=False)
 
+    @eventLog.timed("delete")
     def delete_book(self):
         "Button based Delete function for D=Delete."
 
@@ -598,7 +614,7 @@ class BookForm(npyscreen.FormBaseNew):
     def deleteCancelbtn_function(self):
         "Cancel button function under Delete mode."
         bs.notify("\n   Record was NOT deleted", title="Message", form_color='STANDOUT', wrap=True, wide=False)
-        time.sleep(0.4)     # let it be seen
+        bs.pause(0.4)     # let it be seen
         self.exitBook(modified=False)
 
     def while_editing(self, *args, **keywords):
@@ -742,24 +758,53 @@ class BookForm(npyscreen.FormBaseNew):
                 return p[0]     # = publisher.numeral
         # not found:
         # it can be a typo error:
-        message = "\n  Publisher was not found. Create it as a new one?"
-        if not bs.notify_ok_cancel(message, title="", wrap=True, editw = 1,):
+        similar = self.choose_similar_name("'bookstore.publisher'", self.publisherFld, "Publisher")
+        if similar is False:
             return None
-        num = self.get_last_numeral("'bookstore.publisher'") + 1
+        elif similar is not None:   # it was a typo of an existing publisher
+            return similar
         conn = config.conn
         cur = conn.cursor()
-        sqlQuery = "INSERT INTO 'bookstore.publisher' (numeral,name,address,phone,url) VALUES (?,?,?,?,?)"
-        values = (num, self.publisherFld.value, "", "", "")  # some fields are filled empty
+        num = numeralSequence.next_numeral(conn, "'bookstore.publisher'")
+        sqlQuery = "INSERT INTO 'bookstore.publisher' (numeral,name,name_norm,address,phone,url) VALUES (?,?,?,?,?,?)"
+        values = (num, self.publisherFld.value, textSearch.normalize(self.publisherFld.value), "", "", "")  # some fields are filled empty
         cur.execute(sqlQuery, values)
         conn.commit()
         bs.notify_OK("\n      A new publisher was created.\n      Remember to fulfill all the data in its file.", "Message")
         return num
 
+    def choose_similar_name(self, table, field, kind):
+        "Name not found: offers the most similar ones. Returns the numeral chosen, None to create a new one, False to cancel."
+        similar = trigramIndex.suggest(config.conn, table.strip("'"), field.value)
+        if len(similar) == 0:
+            message = "\n   " + kind + " was not found. Create it as a new one?"
+            return None if bs.notify_ok_cancel(message, title="", wrap=True, editw = 1,) else False
+        values = [s[2] for s in similar] + ["<Create new " + kind.lower() + ">"]
+        choice = bs.choose_from_list(values, title=kind + " not found. Did you mean...")
+        if choice == None:      # Escape
+            return False
+        if choice == len(similar):
+            return None
+        field.value = similar[choice][2]
+        field.update(clear=True)
+        return similar[choice][1]
+
+    @eventLog.timed("saveCreated")
     def save_created_book(self):
         "Button based Save function for C=Create."
 
         conn = config.conn
         cur = conn.cursor()
+        # Publisher and warehouses checked first: nothing of the book is written until they are right
+        publisher_num = self.get_publisher_num()    # Publisher is a direct reference to another table
+        if publisher_num == None:
+            return  # back to form
+        warehouseChanges = ([], [])
+        if self.warehousesFld.value != self.bu_warehouses:
+            warehouseChanges = self.warehouse_changes()     # warehouses existence check
+            if warehouseChanges == None:
+                return  # back to form
+
         # Check if author exists, to create intermediate book_author table:
         try:
             sqlQuery = "SELECT id, numeral, name FROM 'bookstore.author' WHERE name=?"
@@ -767,70 +812,39 @@ class BookForm(npyscreen.FormBaseNew):
             row = cur.fetchone()
             self.author_numeral = row[1]
         except TypeError:   # author does not exist
-            message = "\n   Author was not found. Create it as a new one?"
-            if bs.notify_ok_cancel(message, title="", wrap=True, editw = 1,):
-                self.author_numeral = self.get_last_numeral("'bookstore.author'") + 1
-                sqlQuery = "INSERT INTO 'bookstore.author' (numeral, name, address, bio, url) VALUES (?,?,?,?,?)"
-                values = (int(self.author_numeral), self.authorFld.value, "", "", "")  # some fields are filled empty
+            similar = self.choose_similar_name("'bookstore.author'", self.authorFld, "Author")
+            if similar is None:
+                self.author_numeral = numeralSequence.next_numeral(conn, "'bookstore.author'")
+                sqlQuery = "INSERT INTO 'bookstore.author' (numeral, name, name_norm, address, bio, url) VALUES (?,?,?,?,?,?)"
+                values = (int(self.author_numeral), self.authorFld.value, textSearch.normalize(self.authorFld.value), "", "", "")  # some fields are filled empty
                 cur.execute(sqlQuery, values)
                 conn.commit()
                 bs.notify_OK("\n      A new author was created.\n      Remember to fulfill all the data in its file.", "Message")
-            else:
+            elif similar is False:
                 bs.notify_OK("\n      Getting back to book form.\n      Choose or enter a valid author.", "Message")
                 return
-
-        # creation of book_author intermediate table
-        sqlQuery = "INSERT INTO 'bookstore.book_author' (book_num, author_num, is_main_author) VALUES (?,?,?)"
-        values = (int(self.numeralFld.value), int(self.author_numeral), 1)
-        cur.execute(sqlQuery, values)
-        conn.commit()
-        conn.isolation_level = None     # free the multiuser lock
+            else:   # it was a typo of an existing author
+                self.author_numeral = similar
 
         # Create the book record
-        
-        publisher_num = self.get_publisher_num()    # Publisher is a direct reference to another table
-        if publisher_num == None:
-            return  # back to form
         DBcreationDate = self.screenToDBDate(self.creationDateFld.value, self.creationDateFld.format)
         genre = int(self.genreFld.value[0])   # initial only
         cover_type = int(self.coverTypeFld.value[0])   # initial only
         price = self.priceFld.value.replace(",", ".")   # here, no matter config.decimal_symbol
         price = float(Decimal(price))
-        columns = " (numeral,book_title,original_title,description,isbn,year,publisher_num,creation_date,genre_id,cover_type,price) "
-        sqlQuery = "INSERT INTO " + DBTABLENAME + columns + " VALUES (?,?,?,?,?,?,?,?,?,?,?)"
-        values = (int(self.numeralFld.value), self.bookTitleFld.value, self.originalTitleFld.value, self.descriptionFld.value, \
-            self.isbnFld.value, int(self.yearFld.value), publisher_num, DBcreationDate, genre, cover_type, price)
+        columns = " (numeral,book_title,title_norm,original_title,description,isbn,year,publisher_num,creation_date,genre_id,cover_type,price) "
+        sqlQuery = "INSERT INTO " + DBTABLENAME + columns + " VALUES (?,?,?,?,?,?,?,?,?,?,?,?)"
+        values = (int(self.numeralFld.value), self.bookTitleFld.value, textSearch.normalize(self.bookTitleFld.value), self.originalTitleFld.value, \
+            self.descriptionFld.value, self.isbnFld.value, int(self.yearFld.value), publisher_num, DBcreationDate, genre, cover_type, price)
+        cur.execute("BEGIN")    # the book, its author and its warehouses, together
         cur.execute(sqlQuery, values)
-        conn.commit()
         config.fileRow[0] = cur.lastrowid
+        sqlQuery = "INSERT INTO 'bookstore.book_author' (book_num, author_num, is_main_author) VALUES (?,?,?)"
+        cur.execute(sqlQuery, (int(self.numeralFld.value), int(self.author_numeral), 1))
+        self.save_warehouse_changes(cur, warehouseChanges)
+        conn.commit()
         bs.notify("\n       Record created", title="Message", form_color='STANDOUT', wrap=True, wide=False)
 
-        # Manage book warehouses:
-        # warehouses existence check and update of book_warehouse intermediate table:
-        if self.warehousesFld.value != self.bu_warehouses:
-            whList = list(self.warehousesFld.value.split(","))
-            for wh in whList:
-                if wh == "":    # clean up the list for extra commas
-                    continue
-                try:
-                    sqlQuery = "SELECT numeral, code FROM 'bookstore.warehouse' WHERE code=?"
-                    cur.execute(sqlQuery, (wh.strip(),) )
-                    row = cur.fetchone()
-                    warehouse_num = row[0]  # jumps to except if does not exist
-                    # Create the book_warehouse if it doesn't exist:
-                    sqlQuery = "SELECT * FROM 'bookstore.book_warehouse' WHERE book_num=? AND warehouse_num=?"
-                    cur.execute(sqlQuery, (self.numeralFld.value, str(warehouse_num),) )
-                    row = cur.fetchone()
-                    if row == None:   # book_warehouse does not exist, create it
-                        sqlQuery = "INSERT INTO 'bookstore.book_warehouse' (book_num, warehouse_num, bookshelf, stock) VALUES (?,?,?,?)"
-                        values = (int(self.numeralFld.value), int(warehouse_num), None, None)
-                        cur.execute(sqlQuery, values)
-                        conn.commit()
-                except TypeError:   # warehouse does not exist, we don't create it at this point.
-                    message = "\n   Warehouse '" + wh + "' was not found. Create it beforehand."
-                    bs.notify_OK(message, title="", wrap=True, editw = 1,)
-                    continue
-
         # update config.fileRows:
         new_record = []
         new_record.append(config.fileRow[0])
@@ -849,6 +863,7 @@ class BookForm(npyscreen.FormBaseNew):
         config.fileRows.append(new_record)
         self.exitBook(modified=True)
 
+    @eventLog.timed("saveUpdated")
     def save_updated_book(self):
         "Button based Save function for U=Update."
 
@@ -883,17 +898,19 @@ class BookForm(npyscreen.FormBaseNew):
                 row = cur.fetchone()
                 self.author_numeral = row[1]
             except TypeError:   # author does not exist
-                message = "\n   Author was not found. Create it as a new one?"
-                if bs.notify_ok_cancel(message, title="", wrap=True, editw = 1,):
-                    self.author_numeral = self.get_last_numeral("'bookstore.author'") + 1
-                    sqlQuery = "INSERT INTO 'bookstore.author' (numeral, name, address, bio, url) VALUES (?,?,?,?,?)"
-                    values = (self.author_numeral, self.authorFld.value, "", "", "")  # some fields are filled empty
+                similar = self.choose_similar_name("'bookstore.author'", self.authorFld, "Author")
+                if similar is None:
+                    self.author_numeral = numeralSequence.next_numeral(conn, "'bookstore.author'")
+                    sqlQuery = "INSERT INTO 'bookstore.author' (numeral, name, name_norm, address, bio, url) VALUES (?,?,?,?,?,?)"
+                    values = (self.author_numeral, self.authorFld.value, textSearch.normalize(self.authorFld.value), "", "", "")  # some fields are filled empty
                     cur.execute(sqlQuery, values)
                     conn.commit()
                     bs.notify_OK("\n      A new author was created.\n      Remember to fulfill all the data in its file.", "Message")
-                else:
+                elif similar is False:
                     bs.notify_OK("\n      Getting back to book form.\n      Choose or enter a valid author.", "Message")
                     return
+                else:   # it was a typo of an existing author
+                    self.author_numeral = similar
             # update of book_author intermediate table
             try:
                 columns = "book_num=?, author_num=?, is_main_author=?"
@@ -919,61 +936,25 @@ class BookForm(npyscreen.FormBaseNew):
         genre = int(self.genreFld.value[0])   # initial only
         cover_type = int(self.coverTypeFld.value[0])   # initial only
 
-        # Manage book warehouses:
-        # warehouses existence check and update of book_warehouse intermediate table
+        # Manage book warehouses: existence check, and deletions confirmed before anything is written
+        warehouseChanges = None
         if self.warehousesFld.value != self.bu_warehouses:
-            whList = list(self.warehousesFld.value.split(","))
-            for wh in whList:
-                if wh == "":    # clean up the list for extra commas
-                    continue
-                try:
-                    sqlQuery = "SELECT numeral, code FROM 'bookstore.warehouse' WHERE code=?"
-                    cur.execute(sqlQuery, ( wh.strip(),) )
-                    row = cur.fetchone()
-                    warehouse_num = row[0]  # jumps to except if does not exist
-                    # Create the book_warehouse if it doesn't exist:
-                    sqlQuery = "SELECT * FROM 'bookstore.book_warehouse' WHERE book_num=? AND warehouse_num=?"
-                    cur.execute(sqlQuery, (self.numeralFld.value, str(warehouse_num),) )
-                    row = cur.fetchone()
-                    if row == None:   # book_warehouse does not exist, create it
-                        sqlQuery = "INSERT INTO 'bookstore.book_warehouse' (book_num, warehouse_num, bookshelf, stock) VALUES (?,?,?,?)"
-                        values = (int(self.numeralFld.value), int(warehouse_num), None, None)
-                        cur.execute(sqlQuery, values)
-                        conn.commit()
-                except TypeError:   # warehouse does not exist, we don't create it at this point.
-                    message = "\n   Warehouse '" + wh + "' was not found. Create it beforehand."
-                    bs.notify_OK(message, title="", wrap=True, editw = 1,)
-                    continue
-            
-            # Deletion of erased book_warehouses:
-            diffList = self.make_differences_list(self.warehousesFld.value, self.bu_warehouses)
-            conn = config.conn
-            cur = conn.cursor()
-            for wh in diffList:
-                if wh[0] == "-":    # it's a deletion
-                    wh = wh[1:]
-
-                    message = "\n   Select OK to delete warehouse '" + wh + "' for this book."
-                    if not bs.notify_ok_cancel(message, title="", wrap=True, editw = 1,):
-                        bs.notify_OK("\n  Nothing was deleted.", "Message")
-                        return
-                    sqlQuery = "SELECT numeral FROM 'bookstore.warehouse' WHERE code=?"
-                    cur.execute(sqlQuery, (wh,) )
-                    row = cur.fetchone()                                        
-                    book_num = self.numeralFld.value
-                    warehouse_num = str(row[0])
-                    cur.execute("DELETE FROM 'bookstore.book_warehouse' WHERE book_num="+book_num+" AND warehouse_num="+warehouse_num)
-                    conn.commit()
+            warehouseChanges = self.warehouse_changes()
+            if warehouseChanges == None:
+                return  # back to form
 
         # Update the Book record
 
         price = self.priceFld.value.replace(",", ".")   # here, no matter config.decimal_symbol
         price = float(Decimal(price))
-        columns = "numeral=?, book_title=?, original_title=?, description=?, isbn=?, year=?, publisher_num=?, creation_date=?, genre_id=?, cover_type=?, price=?"
+        columns = "numeral=?, book_title=?, title_norm=?, original_title=?, description=?, isbn=?, year=?, publisher_num=?, creation_date=?, " \
+            "genre_id=?, cover_type=?, price=?"
         sqlQuery = "UPDATE " + DBTABLENAME + " SET " + columns + " WHERE id=?"
-        values = (int(self.numeralFld.value), self.bookTitleFld.value, self.originalTitleFld.value, self.descriptionFld.value, self.isbnFld.value, \
-            int(self.yearFld.value), publisher_num, DBcreationDate, genre, cover_type, price, config.fileRow[0])
+        values = (int(self.numeralFld.value), self.bookTitleFld.value, textSearch.normalize(self.bookTitleFld.value), self.originalTitleFld.value, \
+            self.descriptionFld.value, self.isbnFld.value, int(self.yearFld.value), publisher_num, DBcreationDate, genre, cover_type, price, config.fileRow[0])
         cur.execute(sqlQuery, values)
+        if warehouseChanges != None:
+            self.save_warehouse_changes(cur, warehouseChanges)     # in the same transaction
         conn.commit()
         bs.notify("\n       Record saved", title="Message", form_color='STANDOUT', wrap=True, wide=False)
         self.exitBook(modified=True)
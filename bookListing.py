@@ -11,19 +11,20 @@
 ##############################################################################
 
 import curses
-import locale
 import os
 import sqlite3
 import subprocess
 import textwrap
 from datetime import datetime
 
-import icu
 import npyscreen
 from npyscreen import fmForm, wgmultiline
 
+import bookQueries
 import bsWidgets as bs
 import config
+import database
+import eventLog
 
 REMEMBER_FILTERS = config.REMEMBER_FILTERS  # remember the last listing filter subset
 
@@ -36,6 +37,8 @@ if config.system_release == "10":   LF = ''     # Windows 8.1 notepad program ne
 
 helpText = "A listing utility for the book database.\n\n\
 * Searching is SQL LIKE-based. Filter fields must not be empty. First items in the filters must be ORs (|), then the NOTs (!=).\n\n\
+* Book, author, publisher and warehouse filters ignore accents and case: %garcia% finds García. \
+A filter beginning without '%', like Gal%, is the fastest: it uses an index.\n\n\
 * A text program will open the report and wait for you to close it to return to the program. \
 If config.SAVE_REPORTS=False, automatically deletes the reports after created in the /Reports folder.\n\n\
 * Filter syntax allows for:\n\n\
@@ -195,256 +198,24 @@ class BookListingForm(npyscreen.FormBaseNew):
             fieldList = non_duplicates_list
         return fieldList
     
-    def get_fieldLikeSentence(self, field):
-        "Returns a LIKE sentence for a specific field."
-        """
-        Filter fields cannot be empty. They can contain alphanumeric, percent, comma and dot.
-        First items in the filters must be the ORs, then the NOTs.\n\
-        Filter syntax:
-        %ab% | %cd%						-> (book_title LIKE '%ab%' OR book_title LIKE '%cd%')
-        != %ab%							-> (book_title NOT LIKE '%ab%')
-        %a% != %ab%						-> (book_title LIKE '%a%') AND (book_title NOT LIKE '%ab%') 
-        %ab% | %cd% != %def% 			-> (book_title LIKE '%ab%' OR book_title LIKE '%cd%') AND (book_title NOT LIKE '%def%')
-        %ab% | %cd% != %def% != %efg%	-> (book_title LIKE '%ab%' OR book_title LIKE '%cd%') AND (book_title NOT LIKE '%def%') AND (book_title NOT LIKE '%efg%')
-        != %ab% %cde% != %fg%			-> (book_title NOT LIKE '%ab% %cde%') AND (book_title NOT LIKE '%fg%')	-> Beware the lacking !=
-        """
-
-        if field.name == "Book filter:":
-            tablefld = "'bookstore.Book'.book_title"
-        elif field.name == "Author filter:":
-            tablefld = "'bookstore.Author'.name"
-        elif field.name == "Publisher filter:":
-            tablefld = "'bookstore.Publisher'.name"
-        elif field.name == "Book genre filter:":
-            tablefld = "'bookstore.Book'.genre_id"
-        elif field.name == "Warehouse filter:":
-            tablefld = "'bookstore.Warehouse'.code"
-
-        # First, we upper() the NOTs and ORs:
-        fvalue = field.value.replace("not", "NOT").replace("or", "OR")
-
-        # Get the NOT_list:
-        NOT_list = []
-        fieldList = fvalue.split("!=")
-        fieldList = fieldList[1:]   # There's a '!=' or something else: discarded
-        for elem in fieldList:
-            elem = elem.strip()
-            NOT_list.append(elem)
-        
-        # Get the OR_list:
-        OR_list = []
-        fieldList = fvalue.split("!=")
-        if fieldList[0] != "":  # Not begins by '!=', so it's OR
-            
-            fieldList = fieldList[0].split("|")  # get rid of NOTs and split
-
-            for elem in fieldList:
-                elem = elem.strip()
-                OR_list.append(elem)
-        
-        # Build the fieldLikeSentence
-        fieldLikeSentence = "("     # first parentheses
-
-        # OR part of fieldLikeSentence
-        if len(OR_list) > 0:
-            first_elem = True
-            for elem in OR_list:
-                if first_elem == False:
-                    fieldLikeSentence += " OR "
-                fieldLikeSentence += tablefld + " LIKE '" + elem + "'"
-                first_elem = False
-            fieldLikeSentence += ")"
-
-        # NOT part of fieldLikeSentence
-        if len(NOT_list) > 0:
-            if len(OR_list) > 0:
-                fieldLikeSentence += " AND ("
-            first_elem = True
-            for elem in NOT_list:
-                if first_elem == False:
-                    fieldLikeSentence += " AND ("
-                fieldLikeSentence += tablefld + " NOT LIKE '" + elem + "')"
-                first_elem = False
-
-        return fieldLikeSentence
-
+    @eventLog.timed("generateListing")
     def generateListing(self):
         "Search and list books."
-
-        conn = config.conn 
-        cur = conn.cursor()
-
-        flist = "'bookstore.Book'.book_title, 'bookstore.Author'.name, 'bookstore.Book'.year, 'bookstore.Publisher'.name, \
-            'bookstore.Warehouse'.code, 'bookstore.Book'.genre_id"
-        
-        bookLikeSentence = self.get_fieldLikeSentence(self.bookFilterFld)
-        if bookLikeSentence == False:
-            bs.notify_OK("\n   Syntax error in book filter.  \n","Message", form_color='STANDOUT', wrap=True, wide=False)
-            self.editw = self.get_editw_number("Book filter:") - 1
-            return
-        authorLikeSentence = self.get_fieldLikeSentence(self.authorFilterFld)
-        if authorLikeSentence == False:
-            bs.notify_OK("\n   Syntax error in author filter.  \n","Message", form_color='STANDOUT', wrap=True, wide=False)
-            self.editw = self.get_editw_number("Author filter:") - 1
-            return
-        publisherLikeSentence = self.get_fieldLikeSentence(self.publisherFilterFld)
-        if publisherLikeSentence == False:
-            bs.notify_OK("\n   Syntax error in publisher filter.  \n","Message", form_color='STANDOUT', wrap=True, wide=False)
-            self.editw = self.get_editw_number("Publisher filter:") - 1
-            return
-        genreLikeSentence = self.get_fieldLikeSentence(self.genreFilterFld)
-        if genreLikeSentence == False:
-            bs.notify_OK("\n   Syntax error in genre filter.  \n","Message", form_color='STANDOUT', wrap=True, wide=False)
-            self.editw = self.get_editw_number("Book genre filter:") - 1
-            return
-        warehouseLikeSentence = self.get_fieldLikeSentence(self.warehouseFilterFld)
-        if warehouseLikeSentence == False:
-            bs.notify_OK("\n   Syntax error in warehouse filter.  \n","Message", form_color='STANDOUT', wrap=True, wide=False)
-            self.editw = self.get_editw_number("Warehouse filter:") - 1
-            return
-
-        if self.warehouseFilterFld.value == "%":
-            warehouseLikeSentence = warehouseLikeSentence[:-1] + " OR 'bookstore.Warehouse'.code IS NULL)"  # adjustment for books with no warehouses
-        else:
-            warehouseLikeSentence = warehouseLikeSentence[:-1] + ")"
-
-        # To distinguish between lines with same title, different publisher:
-        groupSentence = " GROUP BY 'bookstore.Book'.book_title, 'bookstore.Book'.publisher_num, 'bookstore.Book_warehouse'.warehouse_num"
-
-        orderSentence = " ORDER BY "
-        
-        if self.orderFld.value == "Book title":
-            orderBy = "book title"
-            orderSentence += "'bookstore.Book'.book_title"
-        elif self.orderFld.value == "Author and title":
-            orderBy = "author"
-            orderSentence += "'bookstore.Author'.name, 'bookstore.Book'.book_title"
-        elif self.orderFld.value == "Publisher and title":
-            orderBy = "publisher"
-            orderSentence += "'bookstore.Publisher'.name, 'bookstore.Book'.book_title"
-        elif self.orderFld.value == "Genre and title":
-            orderBy = "genre"
-            orderSentence += "'bookstore.Book'.genre_id, 'bookstore.Book'.book_title"
-        elif self.orderFld.value == "Warehouse and title":
-            orderBy = "warehouse"
-            orderSentence += "'bookstore.Warehouse'.code, 'bookstore.Book'.book_title"
-        else:
-            orderBy = "book title"
-
-        sqlQuery = "SELECT "+flist+" FROM 'bookstore.Book_author' \
-            INNER JOIN 'bookstore.Book' ON 'bookstore.Book'.numeral = 'bookstore.Book_author'.book_num \
-            INNER JOIN 'bookstore.Author' ON 'bookstore.Author'.numeral = 'bookstore.Book_author'.author_num \
-            INNER JOIN 'bookstore.Publisher' ON 'bookstore.Publisher'.numeral = 'bookstore.Book'.publisher_num \
-            LEFT JOIN 'bookstore.Book_warehouse' ON 'bookstore.Book_warehouse'.book_num = 'bookstore.Book_author'.book_num \
-            LEFT JOIN 'bookstore.Warehouse' ON 'bookstore.Warehouse'.numeral = 'bookstore.Book_warehouse'.warehouse_num \
-            WHERE " + bookLikeSentence + " AND " + authorLikeSentence + " AND " + publisherLikeSentence + \
-            " AND " +  genreLikeSentence + " AND " + warehouseLikeSentence + groupSentence + orderSentence
+        filters = {"book": self.bookFilterFld.value, "author": self.authorFilterFld.value,
+            "publisher": self.publisherFilterFld.value, "genre": self.genreFilterFld.value,
+            "warehouse": self.warehouseFilterFld.value}
+        sqlQuery, orderBy = bookQueries.listing_query(filters, self.orderFld.value)
 
         try:
-            cur.execute(sqlQuery)
-            conn.commit()
-            rows = cur.fetchall()
+            with database.snapshot(config.conn) as conn:    # consistent, and the clerks keep saving
+                rows = conn.execute(sqlQuery).fetchall()
         except sqlite3.OperationalError as e:
             bs.notify_OK("\n    sqlite3.OperationalError: \n"+str(e),"Message", form_color='STANDOUT', wrap=True, wide=False)
             return
 
-        report = ""
-
-        # Listing header
-        book_title = "Book title".ljust(34)
-        author = "Author".ljust(26)
-        year = "Year".ljust(6)
-        publisher = "Publisher".ljust(24)
-        warehouse = "Warehouse".ljust(24)
-        genre = "Genre".ljust(11)
-        header = book_title + author + year + publisher + warehouse + genre + CR + LF + "-" * 125 + CR + LF
-        
-        report += header
-
-        # Compress and combine same book with different warehouses
-        compress_dict = {}
-
-        for row in rows:
-
-            title = row[0]
-            author = row[1]
-            year = row[2]
-            publisher = row[3]
-            warehouse = row[4]
-            genre = row[5]
-
-            if orderBy == "book title":
-                index = title + "_" + publisher
-            elif orderBy == "author":
-                index = author + "_" + title + "_" + publisher
-            elif orderBy == "publisher":
-                index = publisher + "_" + title
-            elif orderBy == "genre":
-                index = str(genre) + "_" + title + "_" + publisher
-            elif orderBy == "warehouse":
-                index = warehouse
-                if index == None:
-                    index = "None_" + title + "_" + publisher
-                else:
-                    index = warehouse + "_" + title + "_" + publisher
-
-            if orderBy != "warehouse":  # can compress books by warehouse
-                try:
-                    if compress_dict[index]:
-                        try:
-                            wrhouse = compress_dict[index][4] + ", " + warehouse
-                        except TypeError:   # it's None
-                            wrhouse = ""
-                    new_row = (title, author, year, publisher, wrhouse, genre)
-                    compress_dict[index] = new_row
-                except KeyError:
-                    compress_dict[index] = row
-            else:
-                compress_dict[index] = row
-
-        rows = list(compress_dict.values())
-        
-        # ICU ordering of the ordering field
-        # We need PyICU (=icu) to order unicode strings in Spanish, Catalan, French...
-        collator = icu.Collator.createInstance(icu.Locale(locale.getlocale()[0]))
-
-        if orderBy == "book title":
-            index_list = [i[0] + "_" + i[3] for i in rows]
-        elif orderBy == "author":
-            index_list = [i[1] + "_" + i[0] + "_" + i[3] for i in rows]
-        elif orderBy == "publisher":
-            index_list = [i[3] + "_" + i[0] for i in rows]
-        elif orderBy == "genre":
-            index_list = [str(i[5]) + "_" + i[0] + "_" + i[3] for i in rows]
-        elif orderBy == "warehouse":
-            index_list = []
-            for i in rows:
-                if i[4] == None:
-                    index_list.append("None_" + i[0] + "_" + i[3])
-                else:
-                    index_list.append(i[4]+"_" + i[0] + "_" + i[3])
-
-        index_list.sort(key=collator.getSortKey)
-
-        new_rows = []
-        for item in index_list:
-            new_rows.append(compress_dict[item])
-
-        for row in new_rows:
-            book_title = row[0][:33].ljust(34)
-            author = row[1][:25].ljust(26)
-            year = str(row[2])[:6].ljust(6)
-            publisher = row[3][:23].ljust(24)
-            if row[4] != None:
-                warehouse = row[4][:23].ljust(24)
-            else:
-                warehouse = "".ljust(24)
-
-            genre = config.genreList[row[5] - 1].ljust(11)
-            
-            report += book_title + author + year + publisher + warehouse + genre + CR + LF
-        
-        report += "-" * 125 + CR + LF   # final line
+        # Compress and combine same book with different warehouses, in ICU order
+        rows = bookQueries.listing_rows(rows, orderBy)
+        report = "".join(line + CR + LF for line in bookQueries.listing_lines(rows))
 
         # Text file creation
         DataPath = config.dataPath + "Reports/"
@@ -0,0 +1,355 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     bookQueries.py - Book Find and book listing queries, without the screen
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# The Find of the book selector and the book listing used to be built inside their forms,
+# so nothing but the curses screen could run them. They are here now, free of npyscreen:
+# the forms (bookSelector, bookListing) and the command line (bookstore.py) run the very
+# same queries, and get the very same rows.
+#   Find:     find_query() / exact_query() --> find_rows()
+#   Listing:  like_sentence() --> listing_query() --> listing_rows() --> listing_lines()
+
+import datetime
+
+import config
+import findCache
+import findPlanner
+import textSearch
+from findPlanner import FindError
+
+FIELD_LIST = ["numeral","title","author","year","publisher","date","isbn"]  # Find fields
+# Find result columns: id, numeral, title, author, year, publisher, creation date, isbn
+FIND_COLUMNS = ["id", "numeral", "title", "author", "year", "publisher", "creation_date", "isbn"]
+FIND_SELECT = "SELECT 'bookstore.book'.id, 'bookstore.book'.numeral, 'bookstore.book'.book_title, 'bookstore.author'.name, \
+    'bookstore.book'.year, 'bookstore.publisher'.name, 'bookstore.book'.creation_date, 'bookstore.book'.isbn FROM 'bookstore.book'" + \
+    " INNER JOIN 'bookstore.book_author' ON 'bookstore.book_author'.book_num = 'bookstore.book'.numeral " + \
+    " INNER JOIN 'bookstore.author' ON 'bookstore.author'.numeral = 'bookstore.book_author'.author_num " + \
+    " INNER JOIN 'bookstore.publisher' ON 'bookstore.publisher'.numeral = 'bookstore.book'.publisher_num "
+EXACT_COLUMNS = {"numeral": "'bookstore.book'.numeral", "isbn": "'bookstore.book'.isbn_norm", "year": "'bookstore.book'.year"}
+
+# listing filter --> (column, normalised): the text filters go to the *_norm shadow columns (textSearch)
+FILTER_COLUMNS = {
+    "book": ("'bookstore.Book'.title_norm", True),
+    "author": ("'bookstore.Author'.name_norm", True),
+    "publisher": ("'bookstore.Publisher'.name_norm", True),
+    "genre": ("'bookstore.Book'.genre_id", False),
+    "warehouse": ("'bookstore.Warehouse'.code_norm", True),
+}
+# listing order --> (orderBy, ORDER BY columns)
+ORDERS = {
+    "Book title": ("book title", "'bookstore.Book'.book_title"),
+    "Author and title": ("author", "'bookstore.Author'.name, 'bookstore.Book'.book_title"),
+    "Publisher and title": ("publisher", "'bookstore.Publisher'.name, 'bookstore.Book'.book_title"),
+    "Genre and title": ("genre", "'bookstore.Book'.genre_id, 'bookstore.Book'.book_title"),
+    "Warehouse and title": ("warehouse", "'bookstore.Warehouse'.code, 'bookstore.Book'.book_title"),
+}
+LISTING_COLUMNS = ["title", "author", "year", "publisher", "warehouses", "genre"]
+LISTING_SELECT = "SELECT 'bookstore.Book'.book_title, 'bookstore.Author'.name, 'bookstore.Book'.year, 'bookstore.Publisher'.name, \
+    'bookstore.Warehouse'.code, 'bookstore.Book'.genre_id FROM 'bookstore.Book_author' \
+    INNER JOIN 'bookstore.Book' ON 'bookstore.Book'.numeral = 'bookstore.Book_author'.book_num \
+    INNER JOIN 'bookstore.Author' ON 'bookstore.Author'.numeral = 'bookstore.Book_author'.author_num \
+    INNER JOIN 'bookstore.Publisher' ON 'bookstore.Publisher'.numeral = 'bookstore.Book'.publisher_num \
+    LEFT JOIN 'bookstore.Book_warehouse' ON 'bookstore.Book_warehouse'.book_num = 'bookstore.Book_author'.book_num \
+    LEFT JOIN 'bookstore.Warehouse' ON 'bookstore.Warehouse'.numeral = 'bookstore.Book_warehouse'.warehouse_num "
+# To distinguish between lines with same title, different publisher:
+LISTING_GROUP = " GROUP BY 'bookstore.Book'.book_title, 'bookstore.Book'.publisher_num, 'bookstore.Book_warehouse'.warehouse_num"
+
+
+def full_year(year):
+    "Two-digit years: 70-99 are 19xx, 00-69 are 20xx."
+    if len(year) == 2:
+        if int(year) > 69:           # Hmm...
+            century = "19"
+        else:
+            century = "20"
+        year = century + year
+    return year
+
+def looks_like_a_date(literal, format, warn=None):
+    "Find-literal date check. Returns True/False. warn(message) is told about wrong separators."
+    isDate = False
+    if len(literal) == 8 or len(literal) == 10:
+        sep = format[2]
+        if literal[2] == sep and literal[5] == sep:
+            if format[0] == "d":
+                day = literal[:2]
+                month = literal[3:5]
+            elif format[0] == "m":
+                month = literal[:2]
+                day = literal[3:5]
+            year = literal[6:]
+            if day.isnumeric() and month.isnumeric() and year.isnumeric():
+                try:
+                    datetime.datetime(int(full_year(year)), int(month), int(day))
+                    isDate = True
+                except ValueError:
+                    pass
+        else:
+            if literal[2] in ["-","/"] and literal[5] in ["-", "/"] and warn is not None:    # Wrong separators
+                warn("Error in date separators.")
+    return isDate
+
+def screen_to_DB_date(literal, format):
+    "Converts a screen simple date into a DB timestamp. Date must be already checked."
+    if format[0] == "d":
+        day = literal[:2]
+        month = literal[3:5]
+    elif format[0] == "m":
+        month = literal[:2]
+        day = literal[3:5]
+    return full_year(literal[6:]) + "-" + month + "-" + day + " 00:00:00.000"
+
+def find_query(find_literal, dateFormat=config.dateFormat, warn=None):
+    "SQL query for a book Find literal: (sqlQuery, values, likeColumns). Raises FindError if it's wrong."
+    # Accepting:
+    #   - A literal without ":" (searches all the field/columns).
+    #   - A literal with ":" like in field:literal.
+    #   - Date literals with "/" or "-" separators.
+    #   - A literal with one comparator "=/</>" after field: as in field:<literal
+    field = False
+    if ":" in find_literal:     # like, simplifying
+        pos = find_literal.find(":")
+        field = find_literal[:pos]
+        literal = find_literal[pos+1:].strip()
+        if field.strip().lower() not in FIELD_LIST or literal == "":
+            raise FindError(" Find: Wrong field or literal")
+    else:
+        literal = find_literal
+
+    comparator = False
+    if literal[0] in ["=","<",">"]:
+        comparator = literal[0]
+        literal = literal[1:]
+    if comparator and not field:
+        raise FindError("Find: Must specify field: when using a comparator")
+
+    date_literal = None
+    if looks_like_a_date(literal, dateFormat, warn):    # Date check
+        date_literal = screen_to_DB_date(literal, dateFormat)
+    else:
+        if field in ["date"]:
+            raise FindError("Find: Error in date literal")
+
+    sqlQuery = FIND_SELECT
+
+    likeColumns = None  # result columns searched with LIKE %literal%: a longer literal can be refined from them
+    if field:
+        fieldColumn = FIELD_LIST.index(field.strip().lower()) + 1
+    if field == "numeral":
+        field = "'bookstore.book'.numeral"
+    elif field == "title":
+        field = "'bookstore.book'.title_norm"
+    elif field == "author":
+        field = "'bookstore.author'.name_norm"
+    elif field == "publisher":
+        field = "'bookstore.publisher'.name_norm"
+    elif field == "date":
+        field = "'bookstore.book'.creation_date"
+
+    if not comparator:
+        if field == False:  # no field specified, so search all fields
+            # Small trick for dates:
+            if date_literal:
+                if date_literal in "00:00:00.000":
+                    date_literal = "X"   # to not find it
+                whereStr = "WHERE 'bookstore.book'.creation_date LIKE ?" \
+                    " COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
+                literal = date_literal
+                likeColumns = (6,)
+            else:
+                whereStr = "WHERE 'bookstore.book'.numeral LIKE ?" \
+                    " OR 'bookstore.book'.title_norm LIKE ?" \
+                    " OR 'bookstore.author'.name_norm LIKE ?" \
+                    " OR 'bookstore.book'.year LIKE ?" \
+                    " OR 'bookstore.publisher'.name_norm LIKE ?" \
+                    " OR 'bookstore.book'.creation_date LIKE ?" \
+                    " OR 'bookstore.book'.isbn LIKE ?" \
+                    " COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
+                likeColumns = (1, 2, 3, 4, 5, 6, 7)
+        else:   # field != False
+            if date_literal:
+                literal = date_literal
+            whereStr = "WHERE " + field + " LIKE ? COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
+            likeColumns = (fieldColumn,)
+
+    elif comparator:
+        if date_literal:
+            literal = date_literal
+        whereStr = "WHERE " + field + " " + comparator + " ? COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
+
+    sqlQuery += whereStr
+
+    literal = textSearch.normalize(literal)     # for the *_norm columns; the others are ASCII
+    if comparator:
+        pass    # leave literal without percents
+    else:
+        literal = "%" + literal + "%"
+    values = ()
+    for i in range(sqlQuery.count("?")):    # setting the parameters for SQL
+        values += (literal,)
+    return sqlQuery, values, likeColumns
+
+def exact_query(find_literal):
+    "Indexed equality lookup if the literal is a whole ISBN, numeral or year: (sqlQuery, values), else None."
+    shape = findPlanner.exact_shape(find_literal, tuple(EXACT_COLUMNS))
+    if shape is None:
+        return None
+    field, value = shape
+    return FIND_SELECT + "WHERE " + EXACT_COLUMNS[field] + " = ? ORDER BY 'bookstore.book'.numeral", (value,)
+
+def find_rows(conn, find_literal, dateFormat=config.dateFormat, warn=None):
+    "Rows (FIND_COLUMNS) of a book Find: the exact match if there's one, else the substring search."
+    sqlQuery, values, likeColumns = find_query(find_literal, dateFormat, warn)
+    exact = exact_query(find_literal)
+    filerows = findCache.fetch(conn, *exact) if exact is not None else []
+    if not filerows:    # no exact match: the substring search
+        filerows = findCache.fetch(conn, sqlQuery, values)
+    return filerows
+
+def like_sentence(filter, value):
+    "Returns a LIKE sentence for a listing filter (a FILTER_COLUMNS key)."
+    """
+    Filter fields cannot be empty. They can contain alphanumeric, percent, comma and dot.
+    First items in the filters must be the ORs, then the NOTs.\n\
+    Filter syntax:
+    %ab% | %cd%						-> (book_title LIKE '%ab%' OR book_title LIKE '%cd%')
+    != %ab%							-> (book_title NOT LIKE '%ab%')
+    %a% != %ab%						-> (book_title LIKE '%a%') AND (book_title NOT LIKE '%ab%')
+    %ab% | %cd% != %def% 			-> (book_title LIKE '%ab%' OR book_title LIKE '%cd%') AND (book_title NOT LIKE '%def%')
+    %ab% | %cd% != %def% != %efg%	-> (book_title LIKE '%ab%' OR book_title LIKE '%cd%') AND (book_title NOT LIKE '%def%') AND (book_title NOT LIKE '%efg%')
+    != %ab% %cde% != %fg%			-> (book_title NOT LIKE '%ab% %cde%') AND (book_title NOT LIKE '%fg%')	-> Beware the lacking !=
+    """
+
+    # accents and case don't matter in the normalised columns, and a 'prefix%' pattern is an index range
+    tablefld, normalized = FILTER_COLUMNS[filter]
+
+    # First, we upper() the NOTs and ORs:
+    fvalue = value.replace("not", "NOT").replace("or", "OR")
+
+    # Get the NOT_list:
+    NOT_list = []
+    fieldList = fvalue.split("!=")
+    fieldList = fieldList[1:]   # There's a '!=' or something else: discarded
+    for elem in fieldList:
+        elem = elem.strip()
+        NOT_list.append(textSearch.normalize(elem) if normalized else elem)
+
+    # Get the OR_list:
+    OR_list = []
+    fieldList = fvalue.split("!=")
+    if fieldList[0] != "":  # Not begins by '!=', so it's OR
+
+        fieldList = fieldList[0].split("|")  # get rid of NOTs and split
+
+        for elem in fieldList:
+            elem = elem.strip()
+            OR_list.append(textSearch.normalize(elem) if normalized else elem)
+
+    # Build the fieldLikeSentence
+    fieldLikeSentence = "("     # first parentheses
+
+    # OR part of fieldLikeSentence
+    if len(OR_list) > 0:
+        first_elem = True
+        for elem in OR_list:
+            if first_elem == False:
+                fieldLikeSentence += " OR "
+            fieldLikeSentence += tablefld + " LIKE '" + elem + "'"
+            first_elem = False
+        fieldLikeSentence += ")"
+
+    # NOT part of fieldLikeSentence
+    if len(NOT_list) > 0:
+        if len(OR_list) > 0:
+            fieldLikeSentence += " AND ("
+        first_elem = True
+        for elem in NOT_list:
+            if first_elem == False:
+                fieldLikeSentence += " AND ("
+            fieldLikeSentence += tablefld + " NOT LIKE '" + elem + "')"
+            first_elem = False
+
+    return fieldLikeSentence
+
+def listing_query(filters, order="Book title"):
+    "SQL query of the book listing: (sqlQuery, orderBy). filters: FILTER_COLUMNS key --> filter text."
+    sentences = [like_sentence(filter, filters.get(filter, "%")) for filter in FILTER_COLUMNS]
+    if filters.get("warehouse", "%") == "%":
+        sentences[-1] = sentences[-1][:-1] + " OR 'bookstore.Warehouse'.code IS NULL)"  # adjustment for books with no warehouses
+    else:
+        sentences[-1] = sentences[-1][:-1] + ")"
+    orderBy, orderColumns = ORDERS.get(order, ORDERS["Book title"])
+    sqlQuery = LISTING_SELECT + "WHERE " + " AND ".join(sentences) + LISTING_GROUP + " ORDER BY " + orderColumns
+    return sqlQuery, orderBy
+
+def listing_index(row, orderBy):
+    "Ordering key of a listing row."
+    title, author, year, publisher, warehouse, genre = row
+    if orderBy == "book title":
+        return title + "_" + publisher
+    elif orderBy == "author":
+        return author + "_" + title + "_" + publisher
+    elif orderBy == "publisher":
+        return publisher + "_" + title
+    elif orderBy == "genre":
+        return str(genre) + "_" + title + "_" + publisher
+    elif orderBy == "warehouse":
+        if warehouse == None:
+            return "None_" + title + "_" + publisher
+        return warehouse + "_" + title + "_" + publisher
+
+def listing_rows(rows, orderBy):
+    "Rows of the listing query, the same book in several warehouses compressed in one, in ICU order."
+    compress_dict = {}
+    for row in rows:
+        index = listing_index(row, orderBy)
+        if orderBy != "warehouse":  # can compress books by warehouse
+            try:
+                if compress_dict[index]:
+                    try:
+                        wrhouse = compress_dict[index][4] + ", " + row[4]
+                    except TypeError:   # it's None
+                        wrhouse = ""
+                compress_dict[index] = row[:4] + (wrhouse, row[5])
+            except KeyError:
+                compress_dict[index] = row
+        else:
+            compress_dict[index] = row
+
+    # ICU ordering of the ordering field
+    collator = textSearch.get_collator()
+    return [compress_dict[index] for index in sorted(compress_dict, key=collator.getSortKey)]
+
+def genre_name(genre_id):
+    return config.genreList[genre_id - 1]
+
+def listing_lines(rows):
+    "Lines of the text listing: header, rows (from listing_rows()) and final line."
+    book_title = "Book title".ljust(34)
+    author = "Author".ljust(26)
+    year = "Year".ljust(6)
+    publisher = "Publisher".ljust(24)
+    warehouse = "Warehouse".ljust(24)
+    genre = "Genre".ljust(11)
+    yield book_title + author + year + publisher + warehouse + genre
+    yield "-" * 125
+    for row in rows:
+        book_title = row[0][:33].ljust(34)
+        author = row[1][:25].ljust(26)
+        year = str(row[2])[:6].ljust(6)
+        publisher = row[3][:23].ljust(24)
+        if row[4] != None:
+            warehouse = row[4][:23].ljust(24)
+        else:
+            warehouse = "".ljust(24)
+        genre = genre_name(row[5]).ljust(11)
+        yield book_title + author + year + publisher + warehouse + genre
+    yield "-" * 125   # final line
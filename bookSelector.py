@@ -25,17 +25,19 @@ from decimal import Decimal
 import sys
 
 import npyscreen
-import numpy
 
+import bookQueries
 import bsWidgets as bs
+import changeFeed
 import config
+import database
+import eventLog
 from book import BookForm
 from config import SCREENWIDTH as WIDTH
 
 REMEMBER_ROW = True    # remember the last row selected when coming from main menu
 REMEMBER_SUBSET = config.REMEMBER_SUBSET  # remember the last 'Find' result subset
 DATEFORMAT = config.dateFormat  # program-wide
-FIELD_LIST = ["numeral","title","author","year","publisher","date","isbn"]  # only screen fields, not DB
 DBTABLENAME = "'bookstore.book'"
 
 helpText =  "The book selector is a grid of database table rows (records).\n\n" +\
@@ -52,6 +54,9 @@ helpText =  "The book selector is a grid of database table rows (records).\n\n"
     "You can use '=', '<' and '>' after the ':' as well: Year:>1999 Year:=2004\n" +\
     "The search is based on the database LIKE statement, so a search for '7' will return the 7 and 17 Numerals. " +\
     "If you want the exact match use numeral:=7  An empty string search restores the grid with the whole recordset. " +\
+    "A whole ISBN (with or without hyphens), Numeral:17 or Year:2004 are first looked up as exact values; " +\
+    "if no such row exists, the usual string search is done. " +\
+    "Title, author and publisher are searched ignoring accents and case: garcia finds García. " +\
     "By default, the record grid 'remembers' the result of the last search. This behaviour can be changed by variable. "    
 
 
@@ -70,6 +75,8 @@ class BookSelectForm(npyscreen.FormBaseNew):
     def create(self):
         "The standard constructor will call the method .create(), which you should override to create the Form widgets."
         self.framed = False   # frameless form
+        self.changeFeed = changeFeed.GridFeed(self, DBTABLENAME)    # the other terminals' changes
+        self.keypress_timeout = changeFeed.TICK     # so while_waiting() gets called
         self.how_exited_handers[npyscreen.wgwidget.EXITED_ESCAPE] = self.exitBookSelector   # Escape exit
         
         # Form title - Screen title line
@@ -130,6 +137,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
     def getRowListForScreen(self, filerows):
         "Memory row list to screen row list for grid."
         if len(filerows) > 0:
+            import numpy    # heavy import, only when there are rows to show
             self.screenFileRows = numpy.array(filerows)  # I need numpy to...
             self.screenFileRows = self.screenFileRows[:, 1:]  # ...cut the first field ("id")
             return self.screenFileRows.tolist()          # and again to list
@@ -139,7 +147,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
 
     def readDBTable(self):
         "Reads the full table and returns a list of list-rows."
-        cur = config.conn.cursor()
+        cur = database.reader().cursor()
         while True:     # multiuser DB locking loop
             try:
                 cur.execute("SELECT * FROM " + DBTABLENAME + " ORDER BY numeral")
@@ -147,6 +155,12 @@ class BookSelectForm(npyscreen.FormBaseNew):
             except sqlite3.OperationalError:
                 bs.notify_OK("\n    Database is locked, please wait.", "Message")
         filerows = cur.fetchall()
+        rows = self.convert_rows(filerows)
+        self.set_up_title(filerows, full_set=True)
+        return rows # it's a list of lists
+
+    def convert_rows(self, filerows):
+        "Table rows to grid rows, the id included."
         rows = []        
         for row in filerows:
             id = row[0]
@@ -159,11 +173,16 @@ class BookSelectForm(npyscreen.FormBaseNew):
             isbn = row[5]
             cRow = [id, numeral, bookTitle, author, year, publisher, date, isbn]
             rows.append(cRow)    # included book.id
-        self.set_up_title(filerows, full_set=True)
-        return rows # it's a list of lists
+        return rows
     
+    def while_waiting(self):
+        "Called while no key is pressed."
+        self.changeFeed.tick()
+
+    @eventLog.timed("fillGrid")
     def fill_grid(self):
         "Read the DB table and put it into the grid."
+        self.changeFeed.reset(database.reader())   # the other terminals' changes, from now on
         config.fileRows = self.readDBTable()        # full row set: it's a list of lists
         self.screenFileRows = self.getRowListForScreen(config.fileRows)     # it's a list of lists
         self.grid.values = self.screenFileRows
@@ -209,7 +228,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Create"
         self.inputOpt.value = "C"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the C
+        bs.pause(0.1)     # shows the C
         # Disable option input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -227,7 +246,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Read"
         self.inputOpt.value = "R"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the R
+        bs.pause(0.1)     # shows the R
         # Disable option input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -265,7 +284,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Update"
         self.inputOpt.value = "U"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the U
+        bs.pause(0.1)     # shows the U
         # Disable option input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -303,7 +322,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Find"
         self.inputOpt.value = "F"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the F
+        bs.pause(0.1)     # shows the F
         # Disable option input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -341,7 +360,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Delete"
         self.inputOpt.value = "D"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the D
+        bs.pause(0.1)     # shows the D
         # Disable option input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -417,8 +436,6 @@ class BookSelectForm(npyscreen.FormBaseNew):
                     self.grid.ensure_cursor_on_display_up(None)
                 return True
             config.screenRow += 1
-        bs.notify("\n        Record not found", form_color='STANDOUT', wrap=True, wide=False)
-        time.sleep(0.6)     # let it be seen
         return False    # not found
 
     def exitBookSelector(self):
@@ -473,158 +490,39 @@ class BookSelectForm(npyscreen.FormBaseNew):
         self.inputOpt.how_exited = False    # don't touch it. Escape-exit issue.
         self.editw = 3             # go to the OptionField
 
-    def looks_like_a_date(self, literal, format):
-        "Find-literal date check. Returns True/False."
-        isDate = False
-        if len(literal) == 8 or len(literal) == 10:
-            sep = format[2]
-            if literal[2] == sep and literal[5] == sep:
-                if format[0] == "d":
-                    day = literal[:2]
-                    month = literal[3:5]
-                elif format[0] == "m":
-                    month = literal[:2]
-                    day = literal[3:5]
-                year = literal[6:]
-                if day.isnumeric() and month.isnumeric() and year.isnumeric():
-                    if len(year) == 2:
-                        if int(year) > 69:           # Hmm...
-                            century = "19"
-                        else:
-                            century = "20"
-                        year = century + year
-                    try:
-                        datetime.datetime(int(year), int(month), int(day))
-                        isDate = True
-                    except ValueError:
-                        pass
-            else:
-                if literal[2] in ["-","/"] and literal[5] in ["-", "/"]:    # Wrong separators
-                    bs.notify("\n    Error in date separators.", "Message")
-                    time.sleep(0.3)     # let it be seen
-        return isDate
-
-    def screenToDBdate(self, literal, format):
-        "Converts a screen simple date into a DB timestamp. Date must be already checked."
-        sep = format[2]
-        if format[0] == "d":
-            day = literal[:2]
-            month = literal[3:5]
-        elif format[0] == "m":
-            month = literal[:2]
-            day = literal[3:5]
-        year = literal[6:]
-        if len(year) == 2:
-            if int(year) > 69:           # Hmm...
-                century = "19"
-            else:
-                century = "20"
-            year = century + year
-        DBdate = year+"-"+month+"-"+day+" 00:00:00.000"
-        return DBdate
+    def date_warning(self, message):
+        "Something wrong in a Find literal, searched anyway."
+        bs.notify("\n    " + message, "Message")
+        bs.pause(0.3)     # let it be seen
+
+    def find_query(self, find_literal):
+        "SQL query for a Find literal: (sqlQuery, values, likeColumns). Raises bs.FindError if it's wrong."
+        return bookQueries.find_query(find_literal, DATEFORMAT, warn=self.date_warning)
 
+    def exact_query(self, find_literal):
+        "Indexed equality lookup if the literal is a whole ISBN, numeral or year: (sqlQuery, values), else None."
+        return bookQueries.exact_query(find_literal)
+
+    @eventLog.timed("findRows")
     def find_DB_rows(self, find_literal):
         "SQL-Based Find function: Executes SQL query for Find option."
-        # Accepting:
-        #   - A literal without ":" (searches all the field/columns).
-        #   - A literal with ":" like in field:literal.
-        #   - Date literals with "/" or "-" separators.
-        #   - A literal with one comparator "=/</>" after field: as in field:<literal
-        field = False
-        if ":" in find_literal:     # like, simplifying
-            pos = find_literal.find(":")
-            field_list = FIELD_LIST
-            field = find_literal[:pos]
-            literal = find_literal[pos+1:].strip()
-            if field.strip().lower() not in field_list or literal == "":
-                bs.notify_OK(" Find: Wrong field or literal", "Message")
-                return False
-        else:
-            literal = find_literal
-
-        comparator = False
-        if literal[0] in ["=","<",">"]:
-            comparator = literal[0]
-            literal = literal[1:]
-        if comparator and not field:
-            bs.notify_OK("Find: Must specify field: when using a comparator", "Message")
-            return False
-
-        date_literal = None
-        if self.looks_like_a_date(literal, DATEFORMAT):    # Date check
-            date_literal = self.screenToDBdate(literal, DATEFORMAT)
-        else:
-            if field in ["date"]:
-                bs.notify_OK("Find: Error in date literal", "Message")
-                return False
-
-        fieldStr = "'bookstore.book'.id, 'bookstore.book'.numeral, 'bookstore.book'.book_title, 'bookstore.author'.name, \
-            'bookstore.book'.year, 'bookstore.publisher'.name, 'bookstore.book'.creation_date, 'bookstore.book'.isbn"
-        sqlQuery = "SELECT " + fieldStr + " FROM " + DBTABLENAME + \
-            " INNER JOIN 'bookstore.book_author' ON 'bookstore.book_author'.book_num = 'bookstore.book'.numeral " + \
-            " INNER JOIN 'bookstore.author' ON 'bookstore.author'.numeral = 'bookstore.book_author'.author_num " + \
-            " INNER JOIN 'bookstore.publisher' ON 'bookstore.publisher'.numeral = 'bookstore.book'.publisher_num "
-            
-        if field == "numeral":
-            field = "'bookstore.book'.numeral"
-        elif field == "title":
-            field = "book_title"
-        elif field == "author":
-            field = "'bookstore.author'.name"
-        elif field == "publisher":
-            field = "'bookstore.publisher'.name"
-        elif field == "date":
-            field = "'bookstore.book'.creation_date"
-
-        if not comparator:
-            if field == False:  # no field specified, so search all fields
-                # Small trick for dates:
-                if date_literal:
-                    if date_literal in "00:00:00.000":
-                        date_literal = "X"   # to not find it
-                    whereStr = "WHERE 'bookstore.book'.creation_date LIKE ?" \
-                        " COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
-                    literal = date_literal
-                else:
-                    whereStr = "WHERE 'bookstore.book'.numeral LIKE ?" \
-                        " OR 'bookstore.book'.book_title LIKE ?" \
-                        " OR 'bookstore.author'.name LIKE ?" \
-                        " OR 'bookstore.book'.year LIKE ?" \
-                        " OR 'bookstore.publisher'.name LIKE ?" \
-                        " OR 'bookstore.book'.creation_date LIKE ?" \
-                        " OR 'bookstore.book'.isbn LIKE ?" \
-                        " COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
-            else:   # field != False
-                if date_literal:
-                    literal = date_literal
-                whereStr = "WHERE " + field + " LIKE ? COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
-
-        elif comparator:
-            if date_literal:
-                literal = date_literal
-            whereStr = "WHERE " + field + " " + comparator + " ? COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
-
-        sqlQuery += whereStr
-        
-        cur = config.conn.cursor()
         try:
-            if comparator:
-                pass    # leave literal without percents
-            else:
-                literal = "%" + literal + "%"
-            values = ()
-            for i in range(sqlQuery.count("?")):    # setting the parameters for SQL
-                values += (literal,)
-            cur.execute(sqlQuery, values)
-
+            filerows = bookQueries.find_rows(database.reader(), find_literal, DATEFORMAT, warn=self.date_warning)
+        except bs.FindError as e:
+            bs.notify_OK(str(e), "Message")
+            return False
         except sqlite3.OperationalError as e:   # some inputs like '\' 
             bs.notify_OK("\n    sqlite3.OperationalError: \n"+str(e),"Message", form_color='STANDOUT', wrap=True, wide=False)
-            return False            
-
-        filerows = cur.fetchall()
+            return False
         if len(filerows) == 0:
             bs.notify("\n    No matching records found","Message", form_color='STANDOUT', wrap=True, wide=False)
             return False
+        self.show_found_rows(filerows)
+        return True
+
+    def show_found_rows(self, filerows):
+        "Rows found by a Find query, to the grid."
+        self.changeFeed.fullSet = False
         rows = []        
         for row in filerows:
             id = row[0]
@@ -666,7 +564,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
 
     def get_author_name(self, book_num):
         "Returns author name."
-        cur = config.conn.cursor()
+        cur = database.reader().cursor()
         sqlQuery = "SELECT * FROM 'bookstore.book_author' WHERE book_num=?"
         try:
             cur.execute( sqlQuery, (str(book_num),) )
@@ -697,7 +595,7 @@ class BookSelectForm(npyscreen.FormBaseNew):
 
     def get_publisher_name(self, publisher_num):
         "Returns publisher name."
-        cur = config.conn.cursor()
+        cur = database.reader().cursor()
         sqlQuery = "SELECT name FROM 'bookstore.publisher' WHERE numeral=?"
         try:
             cur.execute(sqlQuery, (str(publisher_num),) )
@@ -0,0 +1,266 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     bookstore.py - Command line: Find, listing, export, import and check, without the screen
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Everything used to need the 80x25 screen and somebody in front of it. This is the same
+# program for batch jobs (cron, scripts): no npyscreen is imported, so it starts at once.
+# find and listing run the very queries of the book selector and the book listing
+# (bookQueries), check runs the rules of the integrity check (dbIntegrity). The reads come
+# from a point-in-time snapshot (database.snapshot), so the terminals keep saving.
+# The rows go to the standard output, or to a file, as text, CSV or JSONL (one JSON object
+# per line), row by row as they're read.
+#   python -m bookstore find garcia --format csv
+#   python -m bookstore listing --author "gar%" --order "Author and title" --output books.txt
+#   python -m bookstore export stock --format jsonl --output stock.jsonl
+#   python -m bookstore import author new_authors.csv
+#   python -m bookstore check
+# Exit codes, for cron: 0 done, 1 nothing found (or problems found by check), 2 wrong
+# command line, 3 database or file error. The errors go to the standard error.
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+
+import bookQueries
+import config
+import database
+import dbIntegrity
+import dbMigrations
+import dbSchema
+import eventLog
+import numeralSequence
+import textSearch
+from findPlanner import FindError
+
+EXIT_OK = 0
+EXIT_EMPTY = 1      # nothing found, or integrity problems
+EXIT_USAGE = 2      # as argparse does
+EXIT_ERROR = 3
+
+FORMATS = ["text", "csv", "jsonl"]
+
+# tables that can be exported and imported
+TABLES = ["author", "book", "book_author", "book_warehouse", "publisher", "warehouse"]
+
+# exports that are not a table: name --> (columns, query)
+EXPORTS = {
+    "stock": (["numeral", "title", "isbn", "warehouse", "bookshelf", "stock"],
+        "SELECT 'bookstore.book'.numeral, 'bookstore.book'.book_title, 'bookstore.book'.isbn, 'bookstore.warehouse'.code, "
+        "'bookstore.book_warehouse'.bookshelf, 'bookstore.book_warehouse'.stock FROM 'bookstore.book_warehouse' "
+        "INNER JOIN 'bookstore.book' ON 'bookstore.book'.numeral = 'bookstore.book_warehouse'.book_num "
+        "INNER JOIN 'bookstore.warehouse' ON 'bookstore.warehouse'.numeral = 'bookstore.book_warehouse'.warehouse_num "
+        "ORDER BY 'bookstore.book'.numeral, 'bookstore.warehouse'.code"),
+}
+
+
+class CommandError(Exception):
+    "The command could not be done. The message says why."
+    pass
+
+
+def table_columns(conn, table):
+    "Columns of a bookstore table, but the *_norm shadows (the triggers fill them): [(name, notnull)]."
+    shadows = [shadow for column, shadow in textSearch.NORM_COLUMNS.get("bookstore." + table, [])] + ["isbn_norm"]
+    return [(row[1], row[3]) for row in conn.execute("SELECT * FROM pragma_table_info(?)", ("bookstore." + table,))
+        if row[1] not in shadows]
+
+def write_rows(out, format, columns, rows):
+    "Write the rows as they come. Returns how many."
+    count = 0
+    if format == "csv":
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    elif format == "jsonl":
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + "\n")
+            count += 1
+    else:
+        out.write("\t".join(columns) + "\n")
+        for row in rows:
+            out.write("\t".join("" if value is None else str(value) for value in row) + "\n")
+            count += 1
+    return count
+
+def read_rows(filename, format):
+    "Rows of a CSV or JSONL file, as dicts."
+    with open(filename, newline="", encoding="utf-8") as f:
+        if format == "csv":
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+def input_format(filename, format):
+    "The --format given, or the one of the file extension."
+    if format is not None:
+        return format
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    if extension not in ("csv", "jsonl"):
+        raise CommandError("Unknown file format, use --format csv or jsonl: " + filename)
+    return extension
+
+def find(conn, args, out):
+    "Books of a Find literal, as the book selector finds them."
+    if not args.literal.strip():
+        raise CommandError("Empty Find literal")
+    warn = lambda message: print(message, file=sys.stderr)
+    try:
+        with database.snapshot(conn) as snap:
+            rows = bookQueries.find_rows(snap, args.literal, warn=warn)
+    except FindError as e:
+        raise CommandError(str(e).strip())
+    return write_rows(out, args.format, bookQueries.FIND_COLUMNS, rows)
+
+def listing(conn, args, out):
+    "The book listing, with the filters and order of the Book listing form."
+    filters = {"book": args.book, "author": args.author, "publisher": args.publisher, "genre": args.genre,
+        "warehouse": args.warehouse}
+    sqlQuery, orderBy = bookQueries.listing_query(filters, args.order)
+    with database.snapshot(conn) as snap:
+        rows = bookQueries.listing_rows(snap.execute(sqlQuery).fetchall(), orderBy)
+    if args.format == "text":
+        for line in bookQueries.listing_lines(rows):
+            out.write(line + "\n")
+        return len(rows)
+    rows = (row[:5] + (bookQueries.genre_name(row[5]),) for row in rows)
+    return write_rows(out, args.format, bookQueries.LISTING_COLUMNS, rows)
+
+def export(conn, args, out):
+    "A whole table, or one of EXPORTS."
+    with database.snapshot(conn) as snap:
+        if args.table in EXPORTS:
+            columns, query = EXPORTS[args.table]
+        else:
+            columns = [name for name, notnull in table_columns(snap, args.table)]
+            query = "SELECT " + ", ".join(columns) + " FROM 'bookstore." + args.table + "' ORDER BY id"
+        return write_rows(out, args.format, columns, snap.execute(query))
+
+def import_rows(conn, args, out):
+    "Rows of a file into a table, all of them or none. A row without numeral gets a new one."
+    columns = dict(table_columns(conn, args.table))
+    table = "bookstore." + args.table
+    verb = "INSERT OR REPLACE" if args.replace else "INSERT"
+    count = 0
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for line, row in enumerate(read_rows(args.file, input_format(args.file, args.format)), start=1):
+            unknown = [column for column in row if column not in columns]
+            if unknown:
+                raise CommandError("Row " + str(line) + ": unknown columns " + ", ".join(unknown))
+            # an empty CSV field is NULL, where NULL is allowed; a new id if there's none
+            row = {column: None if value == "" and not columns[column] else value for column, value in row.items()
+                if not (column == "id" and value in ("", None))}
+            if "numeral" in columns and row.get("numeral") in ("", None) and table in numeralSequence.TABLES:
+                row["numeral"] = numeralSequence.next_numeral(conn, table)
+            row = textSearch.with_shadows(table, row)
+            try:
+                conn.execute(verb + " INTO '" + table + "' (" + ", ".join(row) + ") VALUES (" + ",".join("?" * len(row)) + ")", \
+                    tuple(row.values()))
+            except sqlite3.IntegrityError as e:
+                raise CommandError("Row " + str(line) + ": " + str(e))
+            count += 1
+        conn.commit()
+    except (CommandError, sqlite3.Error, OSError, ValueError, csv.Error):
+        conn.rollback()
+        raise
+    print(str(count) + " rows imported into " + table, file=sys.stderr)
+    return count
+
+def check(conn, args, out):
+    "The integrity check: every problem, one per line."
+    count = 0
+    for message, fixable in dbIntegrity.check(conn, fix=args.fix):
+        out.write(message + (" (deleted)" if fixable and args.fix else "") + "\n")
+        count += 1
+    return EXIT_EMPTY if count else EXIT_OK
+
+COMMANDS = {
+    "find": find,
+    "listing": listing,
+    "export": export,
+    "import": import_rows,
+    "check": check,
+}
+
+def argument_parser():
+    parser = argparse.ArgumentParser(prog="python -m bookstore", description="Bookstore without the screen.",
+        epilog="Exit codes: 0 done, 1 nothing found or problems found, 2 wrong command line, 3 database or file error.")
+    parser.add_argument("--db", default=config.dataPath + config.dbname, help="database file")
+    commands = parser.add_subparsers(dest="command", required=True)
+    destination = argparse.ArgumentParser(add_help=False)
+    destination.add_argument("--output", help="file to write, instead of the standard output")
+    output = argparse.ArgumentParser(add_help=False, parents=[destination])
+    output.add_argument("--format", choices=FORMATS, default="text")
+
+    command = commands.add_parser("find", parents=[output], help="Find books, as the book selector does")
+    command.add_argument("literal", help="Find literal: garcia, title:mar, year:>1990, 12/03/22...")
+    command = commands.add_parser("listing", parents=[output], help="book listing, as the Book listing form")
+    for filter in bookQueries.FILTER_COLUMNS:
+        command.add_argument("--" + filter, default="%", help=filter + " filter (SQL LIKE syntax, | and !=)")
+    command.add_argument("--order", choices=list(bookQueries.ORDERS), default="Book title")
+    command = commands.add_parser("export", parents=[output], help="a whole table, or the stock by warehouse")
+    command.add_argument("table", choices=TABLES + list(EXPORTS))
+    command = commands.add_parser("import", help="rows of a CSV or JSONL file into a table, in one transaction")
+    command.add_argument("table", choices=TABLES)
+    command.add_argument("file")
+    command.add_argument("--format", choices=["csv", "jsonl"], help="by default, the file extension")
+    command.add_argument("--replace", action="store_true", help="rows with an existing id or numeral replace it")
+    command = commands.add_parser("check", parents=[destination], help="database referential integrity check")
+    command.add_argument("--fix", action="store_true", help="delete the duplicated book_author and book_warehouse rows")
+    return parser
+
+def main(argv=None):
+    "Run a command. Returns the exit code."
+    args = argument_parser().parse_args(argv)
+    eventLog.setup()
+    if not os.path.isfile(args.db):
+        print("Database not found: " + args.db, file=sys.stderr)
+        return EXIT_ERROR
+    out = None
+    try:
+        conn = database.connect(args.db)
+        dbMigrations.migrate(conn)      # as the program does at startup
+        differences = dbSchema.check_schema(conn)
+        if differences:
+            raise CommandError("Database schema is not the expected one: " + "; ".join(differences[:10]))
+        output = getattr(args, "output", None)
+        out = open(output, "w", newline="", encoding="utf-8") if output else sys.stdout
+        with eventLog.span("command", command=args.command):
+            result = COMMANDS[args.command](conn, args, out)
+    except CommandError as e:
+        print(e, file=sys.stderr)
+        return EXIT_ERROR
+    except BrokenPipeError:
+        raise
+    except (sqlite3.Error, OSError, ValueError, csv.Error) as e:
+        print(type(e).__name__ + ": " + str(e), file=sys.stderr)
+        return EXIT_ERROR
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    if args.command == "check":
+        return result
+    return EXIT_OK if result else EXIT_EMPTY
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except BrokenPipeError:     # | head: the reader had enough
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(EXIT_OK)
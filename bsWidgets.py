@@ -25,12 +25,15 @@ from npyscreen import wgwidget as widget
 
 import config
 #import inspect
+from findPlanner import FindError       # also raised without the screen
+from textSearch import get_collator
 from config import SCREENWIDTH as WIDTH
 
 ALLOW_NEW_INPUT = True
 EXITED_UP    = -1
 RAISEERROR   = 'RAISEERROR'
 EXITED_ESCAPE= 127
+NONBLOCKING_FEEDBACK = config.NONBLOCKING_FEEDBACK
 
 
 def notify_ok_cancel(message, title="", form_color='CURSOR_INVERSE', wrap=True, editw = 0,):
@@ -49,9 +52,34 @@ def notify_ok_cancel(message, title="", form_color='CURSOR_INVERSE', wrap=True,
     F.edit()
     return F.value
 
+def choose_from_list(values, title="", show_atx=20, show_aty=6, columns=44, lines=10):
+    "Display a list to choose from. Returns the index of the chosen value, or None if Escape pressed."
+    curses.flushinp()   # flush all keyboard input at this point
+    F = MyPopup(None, name=title, framed=True, show_atx=show_atx, show_aty=show_aty, columns=columns, lines=lines, shortcut_len=None)
+    selector = F.add_widget(MyMultiLine, values=values, value=0, return_exit=True, select_exit=True)
+    F.display()
+    selector.cursor_line = 0
+    selector.edit()
+    if selector.how_exited == EXITED_ESCAPE:
+        return None
+    return selector.value
+
+def choose_many_from_list(values, title="", show_atx=20, show_aty=6, columns=44, lines=10):
+    "Display a list with every value ticked, to untick some. Returns the indexes still ticked, or None if Escape pressed."
+    curses.flushinp()   # flush all keyboard input at this point
+    F = MyPopup(None, name=title, framed=True, show_atx=show_atx, show_aty=show_aty, columns=columns, lines=lines, shortcut_len=None)
+    selector = F.add_widget(MyMultiSelect, values=values, value=list(range(len(values))), return_exit=True)
+    F.display()
+    selector.cursor_line = 0
+    selector.edit()
+    if selector.how_exited == EXITED_ESCAPE:
+        return None
+    return sorted(selector.value)
+
 def notify(message, title="Message", form_color='STANDOUT', wrap=True, wide=False,):
     "Display a message for a time, then close it."
-    curses.flushinp()   # flush all keyboard input at this point
+    if not NONBLOCKING_FEEDBACK:
+        curses.flushinp()   # flush all keyboard input at this point
     message = npyscreen.utilNotify._prepare_message(message)
     if wide:
         F = MiniPopup(name=title, color=form_color)
@@ -64,7 +92,17 @@ def notify(message, title="Message", form_color='STANDOUT', wrap=True, wide=Fals
         message = npyscreen.utilNotify._wrap_message_lines(message, mlw_width)
     mlw.values = message
     F.display()
-    time.sleep(0.6)     # let it be seen
+    if NONBLOCKING_FEEDBACK:
+        feedback.show(0.6, F)   # cleared by a timer or by the next key; type-ahead goes on
+    else:
+        time.sleep(0.6)     # let it be seen
+
+def pause(seconds):
+    "Let the feedback just drawn be seen. Sleeps, unless NONBLOCKING_FEEDBACK."
+    if NONBLOCKING_FEEDBACK:
+        feedback.extend(seconds)
+    else:
+        time.sleep(seconds)
 
 def notify_OK(message, title="Message", form_color='STANDOUT', wrap=True, wide=False, editw = 0,):
     "Display a message until OK button is pressed."
@@ -86,10 +124,91 @@ def notify_OK(message, title="Message", form_color='STANDOUT', wrap=True, wide=F
     F.edit()
 
 
+class FeedbackScheduler():
+    """
+    Transient feedback (brief messages drawn over the active form) without blocking the keyboard.
+    While something is shown, the form gets a keypress_timeout so the application while_waiting()
+    can clear it on time; a key pressed before that clears it at once. If the application switches
+    to another form meanwhile (e.g. "Record saved" and back to the selector), the feedback goes
+    with it: drawn again over the new form, for the time it had left.
+    """
+    TICK = 1    # keypress_timeout while feedback is pending, in tenths of a second
+
+    def __init__(self):
+        self.form = None        # form the feedback was drawn over
+        self.deadline = None
+        self.savedTimeout = None
+        self.popup = None       # what was drawn, to draw it again over the next form
+        self.carried = None     # seconds left of a feedback carried over to the next form
+
+    def show(self, seconds, popup=None):
+        "Something was just drawn over the active form: clear it in some seconds."
+        form = getattr(config.parentApp, "_THISFORM", None)
+        if form is None:
+            time.sleep(seconds)     # no application running
+            return
+        if self.form is not form:
+            self.cancel()
+            self.attach(form)
+        self.popup = popup
+        self.deadline = max(self.deadline or 0, time.monotonic() + seconds)
+
+    def attach(self, form):
+        self.form = form
+        self.savedTimeout = form.keypress_timeout
+        form.keypress_timeout = self.TICK
+
+    def carry_over(self, form):
+        "The application switches to form, which repaints the whole screen: the feedback goes with it."
+        if self.deadline is None or self.popup is None or form is None:
+            self.cancel()
+            return
+        popup, seconds = self.popup, max(self.deadline - time.monotonic(), 0)
+        self.cancel()
+        self.attach(form)
+        self.popup, self.carried = popup, seconds
+        self.deadline = time.monotonic() + seconds  # if a key comes first, it's cleared anyway
+
+    def extend(self, seconds):
+        "More time for the pending feedback, if any."
+        if self.deadline is not None:
+            self.deadline += seconds
+
+    def tick(self):
+        "Called while waiting for keys."
+        if self.carried is not None and self.form is getattr(config.parentApp, "_THISFORM", None):
+            self.popup.display()    # the new form is on the screen now: draw it again over it
+            self.deadline = time.monotonic() + self.carried
+            self.carried = None
+        elif self.deadline is not None and time.monotonic() >= self.deadline:
+            self.clear()
+
+    def key_pressed(self):
+        if self.deadline is not None:
+            self.clear()
+
+    def cancel(self):
+        "Forget the pending feedback, e.g. because the whole screen gets repainted."
+        if self.form is not None:
+            self.form.keypress_timeout = self.savedTimeout
+        self.form = self.deadline = self.savedTimeout = self.popup = self.carried = None
+
+    def clear(self):
+        "Repaint the area covered by the feedback: only the changed cells go to the terminal."
+        form = self.form
+        self.cancel()
+        if form is not None and form is getattr(config.parentApp, "_THISFORM", None):
+            form.curses_pad.touchwin()
+            form.refresh()
+
+feedback = FeedbackScheduler()
+
+
 class NotEnoughSpaceForWidget(Exception):
     pass
 
 
+
 class MiniPopup(npyscreen.Popup):
     DEFAULT_LINES      = 12
     DEFAULT_COLUMNS    = 51
@@ -263,6 +382,7 @@ class MyTextfield(textbox.TextfieldBase):
         else:
             self.parent.curses_pad.timeout(-1)
             ch = self._get_ch()
+        feedback.key_pressed()  # a transient message goes away with the next key
 
         ch = self.filter_char(ch)
         if ch == False:     # Useless keys 
@@ -820,6 +940,9 @@ class MyGrid(MyGridColTitles):
         self.col_widths = col_widths
         self.col_margin = col_margin
         self.form.right_screen = False
+        self._painted = {}      # cell --> what it was last painted with
+        self._repaint = True    # next update() clears the grid area and repaints every cell
+        self._marker = None     # title underline, as read back from the pad after painting it
 
         super().__init__(screen, col_titles, col_margin, *args, **keywords)     # go to MyGridColTitles.__init__  
     
@@ -894,6 +1017,22 @@ class MyGrid(MyGridColTitles):
                     x_offset += (column_width + self.col_margin)
                 self._my_widgets.append(row)
 
+        if self.form.right_screen and self.parent.name == "BookSelector":
+            self.set_right_screen_layout()
+        self.force_repaint()
+
+    def set_right_screen_layout(self):
+        "Hacking grid right-screen column sizes: the first two cells of each row show the last two columns."
+        for row in self._my_widgets:
+            row[0].maximum_string_length = self.col_widths[-2]
+            row[1].maximum_string_length = self.col_widths[-1]
+            row[1].relx = self.col_widths[-2]
+
+    def force_repaint(self):
+        "The next update() repaints the whole grid, not only the changed cells."
+        self._painted = {}
+        self._repaint = True
+
     def h_scroll_left(self, inpt):
         "Adapted to full-line selection and bi-screen."
         if self.begin_col_display_at > 0:
@@ -902,10 +1041,9 @@ class MyGrid(MyGridColTitles):
             self.begin_col_display_at = 0
         if self.edit_cell[1] > 0:
             self.edit_cell[1] = self.edit_cell[1] - self.columns    # DV
-        self.form.right_screen = False    # meaning the screen on the right hand
-
-        # Hacking grid column sizes
-        self.make_contained_widgets()   # refresh screen
+        if self.form.right_screen:
+            self.form.right_screen = False    # meaning the screen on the right hand
+            self.make_contained_widgets()   # back to the left-screen column sizes
         self.on_select(inpt)
 
     def h_scroll_right(self, inpt):
@@ -916,13 +1054,9 @@ class MyGrid(MyGridColTitles):
         if number_of_displayed_columns < total_columns : # DV
             self.begin_col_display_at += self.columns   # increments first displayed column
             self.form.right_screen = True    # meaning the screen on the right hand
-
-            # Hacking grid right-screen column sizes
             if self.parent.name == "BookSelector":
-                for row in range(len(self._my_widgets)):
-                    self._my_widgets[row][0].maximum_string_length = self.col_widths[-2]
-                    self._my_widgets[row][1].maximum_string_length = self.col_widths[-1]
-                    self._my_widgets[row][1].relx = self.col_widths[-2]
+                self.set_right_screen_layout()
+            self.force_repaint()
 
         self.on_select(inpt)
     
@@ -984,34 +1118,66 @@ class MyGrid(MyGridColTitles):
                 selectorForm.delete_row()
 
     def update(self, clear=True):
-        "Adapted for bi-screen."
-        super(MyGrid, self).update(clear = True)    # goes to MyGridColTitles.update() and to SimpleGrid.update()
-        
-        _title_counter = 0
-        for title_cell in self._my_col_titles:
-            if self.parent.name == "BookSelector":
-                if self.form.right_screen:
-                    if title_cell.value.strip() in ["Date","ISBN/SKU"]:
-                        pass    # to the try
-                    elif title_cell.value.strip() == "":  # coming from the form, on the right-screen
-                        # Hacking grid right-screen column sizes
-                        for row in range(len(self._my_widgets)):
-                            self._my_widgets[row][0].maximum_string_length = self.col_widths[-2]
-                            self._my_widgets[row][1].maximum_string_length = self.col_widths[-1]
-                            self._my_widgets[row][1].relx = self.col_widths[-2]
-                            pass
-                    elif title_cell.value.strip() not in ["Numeral","Title"]:
-                        continue    # rest of left-screen fields
+        "Adapted for bi-screen. Only the cells whose contents have changed get repainted."
+        pad = self.parent.curses_pad
+        if self._marker is None or pad.inch(self.rely+1, self.relx) != self._marker:
+            self.force_repaint()    # the form has erased its pad since the last update
+        if self._repaint:
+            self.clear()
+        super(MyGrid, self).update(clear=False)    # goes to MyGridColTitles.update() and to SimpleGrid.update()
+        if not self._repaint:
+            return
+        self._repaint = False
+
+        for _title_counter, title_cell in enumerate(self._my_col_titles):
+            if self.form.right_screen and self.parent.name == "BookSelector" and _title_counter > 1:
+                break   # the right-hand screen has only two columns
             try:
                 title_text = self.col_titles[self.begin_col_display_at+_title_counter]
             except IndexError:
                 title_text = None
             title_cell.value = title_text
             title_cell.update()
-            _title_counter += 1
             
-        self.parent.curses_pad.hline(self.rely+1, self.relx, curses.ACS_HLINE, self.width)
-        self.parent.curses_pad.hline(self.height+1, self.relx, curses.ACS_HLINE, self.width)    # DV added bottom line
+        pad.hline(self.rely+1, self.relx, curses.ACS_HLINE, self.width)
+        pad.hline(self.height+1, self.relx, curses.ACS_HLINE, self.width)    # DV added bottom line
+        self._marker = pad.inch(self.rely+1, self.relx)
+
+    def _print_cell(self, cell):
+        "From SimpleGrid. The cell is repainted only if its value or highlighting differ from the last time."
+        row_indexer, column_indexer = cell.grid_current_value_index
+        try:
+            cell_value = self.display_value(self.values[row_indexer][column_indexer])
+        except (IndexError, TypeError):
+            cell_value = self.on_empty_display
+            cell.grid_current_value_index = -1
+        self._cell_widget_show_value(cell, cell_value)
+
+        if self.value:
+            selected = cell.grid_current_value_index in self.value or cell.grid_current_value_index == self.value
+            self._cell_widget_show_value_selected(cell, selected)
+        else:
+            self._cell_widget_show_value_selected(cell, False)
+
+        if (self.editing or self.always_show_cursor) and cell.grid_current_value_index != -1:
+            if self.select_whole_line:
+                if (self.edit_cell[0] == cell.grid_current_value_index[0]):
+                    self._cell_show_cursor(cell, True)
+                    cell.highlight_whole_widget = True
+                else:
+                    self._cell_show_cursor(cell, False)
+            else:
+                self._cell_show_cursor(cell, tuple(self.edit_cell) == cell.grid_current_value_index)
+        else:
+            self._cell_show_cursor(cell, False)
+
+        self.custom_print_cell(cell, cell_value)
+
+        painted = (cell.value, cell.show_bold, cell.highlight, cell.highlight_whole_widget, cell.relx, \
+            cell.maximum_string_length)
+        if self._painted.get(cell) != painted:
+            cell.update()
+            self._painted[cell] = painted
 
     def empty_the_grid(self):
         self.values = []
@@ -1135,6 +1301,7 @@ class DetailField(MyTextfield):
         self.how_exited = True      # self.find_next_editable, # A default value
         self.option = None  # to store FCRUD option
         self.formScreen = screenForm    # Record screen form
+        self.liveFind = None    # search-as-you-type of the Find literal, see liveFind.py
 
         super().__init__(screen, value='',         # goes to TextfieldBase->Widget
                         relx=relx,
@@ -1192,10 +1359,13 @@ class DetailField(MyTextfield):
             curses.halfdelay(self.parent.keypress_timeout)
             ch = self._get_ch()
             if ch == -1:
+                if self.liveFind is not None and self.liveFind.active:
+                    self.liveFind.tick()
                 return self.try_while_waiting()
         else:
             self.parent.curses_pad.timeout(-1)
             ch = self._get_ch()
+        feedback.key_pressed()  # a transient message goes away with the next key
 
         ch = self.filter_char(ch)
 
@@ -1215,10 +1385,21 @@ class DetailField(MyTextfield):
         
         self.try_adjust_widgets()
 
+        if self.option == "Find" and self.is_find_literal and config.LIVE_FIND and \
+            ch not in (curses.ascii.CR, curses.ascii.NL, curses.ascii.ESC):
+            self.live_find_key()
+
         # Enter-key on Numeral/Find-literal field:
         if ch == curses.ascii.CR or ch == curses.ascii.NL:  # Windows or GNU/Linux
+            found = self.liveFind.finish(self.value) if self.liveFind is not None else None
             if self.value != "":
-                if self.option == "Find":    # Find results go to grid, not to vertical file form
+                if self.option == "Find" and found is not None:     # the grid already shows the whole result
+                    if found:
+                        self.form.grid.set_highlight_row(None)    # select the first one
+                    else:
+                        notify("\n    No matching records found","Message", form_color='STANDOUT', wrap=True, wide=False)
+                        return
+                elif self.option == "Find":    # Find results go to grid, not to vertical file form
                     if self.form.find_DB_rows(self.value):
                         self.form.grid.set_highlight_row(None)    # select the first one
                     else:
@@ -1237,7 +1418,18 @@ class DetailField(MyTextfield):
                     grid.values = self.screenFileRows
                     grid.set_highlight_row(None)  # First row
         elif ch == curses.ascii.ESC:
+            if self.liveFind is not None:
+                self.liveFind.stop()
             self.editing = False
+
+    def live_find_key(self):
+        "A key in the Find literal: the live search follows it."
+        if self.liveFind is None:
+            import liveFind     # not needed until the first Find
+            self.liveFind = liveFind.LiveFind(self.form)
+        if not self.liveFind.active:
+            self.liveFind.start()
+        self.liveFind.key(self.value)
     
     def goto_Form(self, numeral):
         "Search for the required record and store it in a globally-accessible variable."
@@ -1245,11 +1437,11 @@ class DetailField(MyTextfield):
             selectorForm = self.form
             if not selectorForm.read_record(int(numeral)):
                 notify("\n        Record not found", form_color='STANDOUT', wrap=True, wide=False)
-                time.sleep(0.6)     # let it be seen
+                pause(0.6)      # let it be seen
                 return
         except ValueError:
             notify("\n        Bad value for Numeral", form_color='STANDOUT', wrap=True, wide=False)
-            time.sleep(0.6)     # let it be seen
+            pause(0.6)      # let it be seen
             return
 
         # we come from DetailField: before we get to the next screen, we have to restore...
@@ -1577,6 +1769,7 @@ class MyMultiLineEdit(npyscreen.MultiLineEdit):
         else:
             self.parent.curses_pad.timeout(-1)
             ch = self._get_ch()
+        feedback.key_pressed()  # a transient message goes away with the next key
 
         ch = self.filter_char(ch)
         if ch == False:     # Useless keys 
@@ -1953,6 +2146,7 @@ class MyAutocomplete(textbox.Textfield):
         else:
             self.parent.curses_pad.timeout(-1)
             ch = self._get_ch()
+        feedback.key_pressed()  # a transient message goes away with the next key
         ch = self.filter_char(ch)
         if ch == False:     # Useless keys 
             return
@@ -2497,6 +2691,13 @@ class MyMiniButtonPress(npyscreen.MiniButtonPress):
         pass
 
 
+class MyMultiSelect(npyscreen.MultiSelect):
+    "Check boxes: Space or x ticks and unticks; Enter accepts them as they are."
+
+    def h_select_exit(self, ch):
+        self.editing = False
+        self.how_exited = True
+
 class MySelectOne(multiline.MultiLine):
     "My version of wgselectone.SelectOne, to include h_exit_down()"
     _contained_widgets = npyscreen.RoundCheckBox
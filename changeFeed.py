@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     changeFeed.py - Changes made by every terminal, applied to the selector grids
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# A selector grid used to learn only about the changes made in this terminal; the other
+# terminals' ones showed up after a full read of the table. Now triggers write every insert,
+# update and delete of the selector tables in the changelog table: (seq, table, row id, op).
+# While the grid waits for keys, every config.changeFeedSeconds the selector asks for the
+# entries after the last one it has seen (nothing at all if PRAGMA data_version says the
+# file didn't change), re-reads just those rows and puts them in its row set and grid.
+# A book also changes when its authors do (book_author), or its stock (book_warehouse).
+# The log is pruned by dbMaintenance to the last config.changelogKept entries; a grid
+# that fell behind the pruning is read again in full.
+
+import sqlite3
+import time
+
+import config
+import database
+
+CHANGELOG_TABLE = "'bookstore.changelog'"
+
+TABLES = ["bookstore.author", "bookstore.book", "bookstore.publisher", "bookstore.user", "bookstore.warehouse"]
+
+TICK = 10   # keypress_timeout of the selectors, in tenths of a second: how often they may look
+
+EVENTS = (("insert", "INSERT", "I", "NEW"), ("update", "UPDATE", "U", "NEW"), ("delete", "DELETE", "D", "OLD"))
+
+
+def table_key(table):
+    "\"'bookstore.Author'\" --> 'bookstore.author'."
+    return table.strip("'").lower()
+
+def trigger_names():
+    "Names of the changelog triggers, for dbSchema."
+    names = [table.split(".")[1] + "_changelog_" + event for table in TABLES for event, *rest in EVENTS]
+    return names + [link + "_changelog_" + event for link in ("book_author", "book_warehouse") for event, *rest in EVENTS]
+
+def migration_statements():
+    "The changelog table, and the triggers that fill it."
+    statements = ["CREATE TABLE " + CHANGELOG_TABLE + " (seq INTEGER PRIMARY KEY AUTOINCREMENT, " \
+        "table_name TEXT NOT NULL, row_id INTEGER NOT NULL, op TEXT NOT NULL)"]
+    for table in TABLES:
+        for event, sqlEvent, op, ref in EVENTS:
+            statements.append("CREATE TRIGGER " + table.split(".")[1] + "_changelog_" + event + " AFTER " + sqlEvent + \
+                " ON '" + table + "' BEGIN INSERT INTO " + CHANGELOG_TABLE + " (table_name, row_id, op) " \
+                "VALUES ('" + table + "', " + ref + ".id, '" + op + "'); END")
+    return statements + book_link_statements("book_author")    # the book grid shows the main author
+
+def book_link_statements(link):
+    "Triggers that log a change of a book_<link> row as an update of its book."
+    statements = []
+    for event, sqlEvent, op, ref in EVENTS:
+        statements.append("CREATE TRIGGER " + link + "_changelog_" + event + " AFTER " + sqlEvent + \
+            " ON 'bookstore." + link + "' BEGIN INSERT INTO " + CHANGELOG_TABLE + " (table_name, row_id, op) " \
+            "SELECT 'bookstore.book', id, 'U' FROM 'bookstore.book' WHERE numeral = " + ref + ".book_num; END")
+    return statements
+
+def last_seq(conn):
+    "Sequence number of the last change logged."
+    return conn.execute("SELECT ifnull(max(seq), 0) FROM " + CHANGELOG_TABLE).fetchone()[0]
+
+def version(conn):
+    "Sequence number of the last change ever logged, even if pruned since: it only grows (AUTOINCREMENT)."
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (CHANGELOG_TABLE.strip("'"),)).fetchone()
+    return row[0] if row else 0
+
+def changes(conn, table, since):
+    """Rows of a table changed after the entry since: (last seq, {row ids}), or None if the entries
+    right after since were pruned already. Whether a row was deleted, the table itself tells."""
+    first = conn.execute("SELECT min(seq) FROM " + CHANGELOG_TABLE).fetchone()[0]
+    if first is not None and first > since + 1:
+        return None
+    changed = {row[0] for row in conn.execute("SELECT row_id FROM " + CHANGELOG_TABLE + \
+        " WHERE seq > ? AND table_name = ?", (since, table_key(table)))}
+    return last_seq(conn), changed
+
+def prune(conn, keep=None):
+    "Delete all but the last keep entries. Returns how many were deleted."
+    keep = config.changelogKept if keep is None else keep
+    deleted = conn.execute("DELETE FROM " + CHANGELOG_TABLE + " WHERE seq <= " \
+        "(SELECT max(seq) FROM " + CHANGELOG_TABLE + ") - ?", (keep,)).rowcount
+    conn.commit()
+    return deleted
+
+
+class GridFeed():
+    "The changes of a table, applied to the grid of its selector while it waits for keys."
+
+    def __init__(self, selector, table):
+        self.selector = selector    # form with grid, convert_rows(), getRowListForScreen() and set_up_title()
+        self.table = table
+        self.seq = None         # last change seen: the grid is up to date until it
+        self.stamp = None       # state of the file when it was last looked at
+        self.fullSet = True     # the grid shows the whole table, not a Find subset
+        self.due = 0
+
+    def reset(self, conn):
+        "The whole table is about to be read: the changes seen so far are all in it."
+        self.seq = last_seq(conn)
+        self.fullSet = True
+
+    def tick(self):
+        "Called while no key is pressed."
+        if time.monotonic() < self.due or self.seq is None or not self.selector.grid.editing:
+            return      # not yet, or the grid is not the one waiting (Find literal being typed...)
+        self.due = time.monotonic() + config.changeFeedSeconds
+        conn = database.reader()
+        stamp = (id(conn), conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+        if stamp == self.stamp:
+            return      # nobody wrote anything
+        self.stamp = stamp
+        try:
+            self.apply(conn)
+        except sqlite3.OperationalError:    # locked: next time
+            self.stamp = None
+
+    def apply(self, conn):
+        "Re-read the rows changed since the last time, and show them."
+        if config.last_table != self.table:
+            return      # config.fileRows belongs to another selector
+        selector, grid = self.selector, self.selector.grid
+        cursor = grid.edit_cell[0] if grid.edit_cell else 0
+        current = config.fileRows[cursor][1] if cursor < len(config.fileRows) else None    # numeral under the cursor
+        found = changes(conn, self.table, self.seq)
+        if found is None:   # too far behind: what changed is not known any more
+            if self.fullSet:
+                selector.fill_grid()
+                self.show(current)
+            else:
+                self.seq = last_seq(conn)
+            return
+        self.seq, changed = found
+        if not changed:
+            return
+        marks = ",".join("?" * len(changed))
+        dbRows = conn.execute("SELECT * FROM " + self.table + " WHERE id IN (" + marks + ")", tuple(changed)).fetchall()
+        fresh = {row[0]: row for row in selector.convert_rows(dbRows)}
+        rows = [fresh.pop(row[0], row) for row in config.fileRows if row[0] not in changed or row[0] in fresh]
+        if self.fullSet:    # new rows only in the full set: they may not match the Find
+            rows = sorted(rows + list(fresh.values()), key=lambda row: row[1])
+        config.fileRows = rows
+        self.show(current)
+
+    def show(self, current):
+        "Paint the new row set, the cursor on the same record (numeral current) if it's still there."
+        selector, grid = self.selector, self.selector.grid
+        selector.screenFileRows = selector.getRowListForScreen(config.fileRows)
+        grid.values = selector.screenFileRows
+        selector.set_up_title(config.fileRows, full_set=self.fullSet)
+        if any(row[1] == current for row in config.fileRows):
+            grid.set_highlight_row(current)
+        else:
+            grid.edit_cell = [min(grid.edit_cell[0], max(len(config.fileRows) - 1, 0)), 0]
+        selector.formTitle.display()
+        grid.display()
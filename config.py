@@ -13,14 +13,16 @@
 import json
 import os
 import platform
-import subprocess
-import sys
 
 SCREENWIDTH = 80        # Intended/enforced screen width
 AUTHENTICATE = True    # Ask for user identification at program startup.  
 CONFIRMEXIT = True
 PROFILING = False
 TRACEMALLOC = False
+EVENT_LOG = False       # Timing spans and SQL trace written to the event log file.
+NONBLOCKING_FEEDBACK = True     # Brief messages and option letters don't block the keyboard (False: old sleeps)
+LIVE_FIND = True        # The selector grid follows the Find literal while it's being typed
+FIND_CACHE = True       # Repeated finds are answered from memory while the database doesn't change
 
 system = platform.system()
 system_release = platform.release()     # e.g. '10', '8.1', '5.15.76-1-MANJARO'  
@@ -35,31 +37,8 @@ elif system == "Linux":
 pname = "bookstore"     # program name
 dbname = pname + ".db"
 
-# Program version: from git cmd or previously created json file
-try:
-    program_version = subprocess.run(["git", "describe", "--tags", "--abbrev=0"], \
-        capture_output=True, text=True).stdout.strip('\n')[:4]
-except FileNotFoundError:
-    program_version = ""
-
-filename = dataPath + "program.json"
-if program_version != "":   # it's a git repository
-    data = {'program': [ {'version' : program_version} ] }
-    json_string = json.dumps( data )
-    try:
-        with open(filename, 'w') as outfile:
-            outfile.write(json_string)  # we'll write the json now
-    except Exception as e:
-        print("\n" + pname + ": " + str(e) ,"Error")
-        sys.exit()                
-else:   # it's not a git repository, so we read from the json file   
-    try:
-        with open(filename) as json_file:
-            data = json.load(json_file)
-            program_version = data['program'][0]['version']
-    except FileNotFoundError:
-        print("\n " + pname + ": " + filename + " was not found.\n")
-        sys.exit()                
+# Program version: written to Data/program.json at release time by stampVersion.py,
+# and read from there the first time it's needed (see __getattr__ below).
 
 parentApp = None        # It's the npyscreen.NPSAppManaged in memory
 conn = None             # DB Connection
@@ -99,4 +78,54 @@ gender_neutral_pronoun = "(S)he"   # (S)he , She/he, He/She , They, Ze, Zir
 normal_exit_message = "Program exited normally."
 
 SAVE_REPORTS = False     # if False, automatically deletes the reports after created
-#-----------------------------------------------------------------------------------
\ No newline at end of file
+
+eventLogFile = os.getcwd() + "/event_log.txt"   # structured lines, one JSON object each
+eventLogMaxBytes = 1024 * 1024      # rotation size
+eventLogBackups = 3                 # rotated files kept: event_log.txt.1, .2, .3
+eventLogBuffer = 200                # lines held in memory before writing...
+eventLogFlushSeconds = 5            # ...or seconds, whatever comes first
+
+liveFindDelay = 0.3     # seconds of typing pause before the live Find searches
+liveFindRows = 50       # the first rows found are shown at once, the rest when the search ends
+findCacheEntries = 64   # Find results kept in memory...
+findCacheBytes = 4 * 1024 * 1024    # ...and the memory they may take
+numeralBlock = 1        # numerals reserved at once by each session for its new records (>1: fewer writes, gaps)
+backupDir = "Backups/"  # online backups (dbBackup.py), in the directory of the database file...
+backupsKept = 10        # ...the newest ones kept
+backupPages = 64        # database pages copied in each step, holding the read lock
+backupPause = 0.01      # seconds between steps, for the writers
+backupRestarts = 3      # restarts (writes by others) before copying the rest in one go
+MEMORY_MIRROR = False   # selectors and Find read from a copy of the database in memory (browsing terminals)
+pageCacheKB = 65536     # page cache of each connection (SQLite default: 2000 KiB)
+mmapSize = 0            # bytes of the file read through memory mapping (0: off; keep it off on network drives)
+pageSize = 4096         # database page size in bytes, applied by VACUUM (python benchmarks.py tuning)
+tempStore = "MEMORY"    # sorts and temporary tables: DEFAULT, FILE or MEMORY
+snapshotMemoryMB = 64   # listings copy a database up to this size into memory, a bigger one into a temporary file (rollback journal)
+statementCache = 128    # prepared statements kept by each connection
+changeFeedSeconds = 2   # how often an idle selector grid looks for the other terminals' changes
+changelogKept = 10000   # changelog entries kept by the maintenance (a grid further behind is read again)
+apiHost = "127.0.0.1"   # HTTP read API (httpApi.py) for the web storefront...
+apiPort = 8080          # ...its port...
+apiWorkers = 8          # ...worker threads, each with a read-only connection of the pool
+apiPageSize = 50        # rows per page of the API lists, unless ?limit= (up to apiMaxPageSize)
+apiMaxPageSize = 500
+API_WAL = False         # the API puts the database in WAL mode for good, so its readers don't hold the terminals back (never on network drives)
+DB_DAEMON = False       # config.conn goes through the database daemon (dbDaemon.py), the only writer of the file
+daemonSocket = dataPath + "bookstore.sock"  # its Unix socket
+daemonGroupMs = 5       # a Save waits at most this for others to share its COMMIT...
+daemonGroupMax = 64     # ...or until this many of them
+daemonBusySeconds = 5   # a write waits this for its turn before "database is locked", as the sqlite3 timeout
+#-----------------------------------------------------------------------------------
+
+def __getattr__(name):
+    "Lazy module attributes: config.program_version is only read from disk when first asked for."
+    global program_version
+    if name == "program_version":
+        try:
+            with open(dataPath + "program.json") as json_file:
+                data = json.load(json_file)
+                program_version = data['program'][0]['version']
+        except (FileNotFoundError, KeyError, IndexError, ValueError):
+            program_version = ""
+        return program_version
+    raise AttributeError("module 'config' has no attribute '" + name + "'")
\ No newline at end of file
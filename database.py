@@ -0,0 +1,164 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     database.py - SQLite connection setup
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Listings and reports read from a snapshot(), never from the shared config.conn: a long
+# query there would see the edits of other terminals half way, and would keep them waiting.
+# In WAL mode the snapshot is a read transaction on a connection of its own, which doesn't
+# stop the writers. In rollback journal mode (the default) a reader holds the writers back
+# for as long as it reads, so a database up to config.snapshotMemoryMB is first copied into
+# memory with the backup API in a single step: the writers wait just for that copy, not for
+# the whole report. A bigger one is copied into a temporary file instead, config.backupPages
+# pages at a time like the online backup (dbBackup.py): the writers wait only for each step.
+# With config.MEMORY_MIRROR on (terminals that mostly browse), the selectors and Find read
+# from reader(): a copy of the database in memory, made with the backup API, and copied
+# again when the file changes: PRAGMA data_version (the other terminals' commits) or the
+# connection total_changes (ours) say when to look, and the changelog version (changeFeed.py)
+# whether anything changed, also after config.conn was reopened. The writes still go to the
+# file through config.conn.
+# The mirror is a shared-cache memory database, so the live Find thread reads it too.
+# Every connection gets the page cache, memory mapping, temporary storage and statement
+# cache of config.py (benchmarks.py tuning sweeps them); the page size is the file's own,
+# set (migration 5, and whenever config.pageSize changes) by the dbMaintenance vacuum.
+# With config.DB_DAEMON on, config.conn is not a connection to the file but to the database
+# daemon (dbDaemon.py), which does the writes of all the terminals.
+
+import os
+import sqlite3
+import tempfile
+from contextlib import contextmanager
+
+import config
+import eventLog
+import findCache
+import textSearch
+
+MIRROR_URI = "file:bookstore-mirror?mode=memory&cache=shared"
+
+_mirror = None          # in-memory copy of the database, in MEMORY_MIRROR mode...
+_mirrorStamp = None     # ...the state of config.conn it was last checked against...
+_mirrorVersion = None   # ...and the changelog version it was copied at
+
+
+def connect(filename, uri=False, check_same_thread=True):
+    "Open a connection to the database file. Traced if the event log is on."
+    if eventLog.enabled():
+        conn = sqlite3.connect(filename, uri=uri, cached_statements=config.statementCache, \
+            check_same_thread=check_same_thread, factory=eventLog.TracedConnection)
+    else:
+        conn = sqlite3.connect(filename, uri=uri, cached_statements=config.statementCache, check_same_thread=check_same_thread)
+    textSearch.register(conn)   # the *_norm triggers call it
+    tune(conn)
+    return conn
+
+def shared(filename):
+    "Connection for config.conn: to the file, or through the database daemon if config.DB_DAEMON."
+    if config.DB_DAEMON:
+        import dbDaemon     # only then: the terminals without the daemon don't import it
+        return dbDaemon.connect(config.daemonSocket, filename)
+    return connect(filename)
+
+def tune(conn):
+    "Page cache, memory mapping and temporary storage of a connection, as in config.py."
+    conn.execute("PRAGMA cache_size = %d" % -config.pageCacheKB)    # negative: KiB, not pages
+    conn.execute("PRAGMA mmap_size = %d" % config.mmapSize)
+    conn.execute("PRAGMA temp_store = " + config.tempStore)
+
+NETWORK_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "fuse.sshfs", "ceph", "glusterfs")
+DRIVE_REMOTE = 4    # GetDriveTypeW()
+
+def on_network_drive(filename):
+    "True if the file is on a network file system, where SQLite's WAL mode is not safe."
+    path = os.path.realpath(filename)
+    if config.system == "Windows":
+        if path.startswith("\\\\"):     # UNC path
+            return True
+        import ctypes
+        return ctypes.windll.kernel32.GetDriveTypeW(os.path.splitdrive(path)[0] + "\\") == DRIVE_REMOTE
+    try:
+        with open("/proc/mounts") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:     # not Linux: can't tell
+        return False
+    fstype, longest = None, -1
+    for mountPoint, kind in mounts:
+        mountPoint = mountPoint.replace("\\040", " ")
+        if (path == mountPoint or path.startswith(mountPoint.rstrip("/") + "/")) and len(mountPoint) > longest:
+            fstype, longest = kind, len(mountPoint)
+    return fstype in NETWORK_FILESYSTEMS
+
+def filename_of(conn):
+    "File of the main database of a connection."
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+@contextmanager
+def snapshot(conn):
+    "Point-in-time, read-only connection to the database of conn, for listings and reports."
+    filename = filename_of(conn)
+    source = connect("file:" + filename + "?mode=ro", uri=True)
+    try:
+        if source.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+            source.execute("BEGIN")     # the snapshot starts with the first read
+            source.execute("SELECT count(*) FROM sqlite_schema").fetchone()
+            yield source
+            source.rollback()
+        elif os.path.getsize(filename) <= config.snapshotMemoryMB * 1024 * 1024:
+            copy = connect(":memory:")
+            try:
+                source.backup(copy, pages=-1)   # one step: a single read lock, and no restarts
+                yield copy
+            finally:
+                copy.close()
+        else:
+            import dbBackup     # imports this module
+            handle, copyName = tempfile.mkstemp(prefix="bookstore-snapshot-", suffix=".db")
+            os.close(handle)
+            try:
+                copy = connect(copyName)
+                try:
+                    dbBackup.stepped_copy(source, copy)     # the writers only wait for each step
+                    yield copy
+                finally:
+                    copy.close()
+            finally:
+                os.remove(copyName)
+    finally:
+        source.close()
+
+def reader():
+    "Connection for the browsing reads: config.conn, or its mirror in memory if config.MEMORY_MIRROR."
+    global _mirror, _mirrorStamp, _mirrorVersion
+    if not config.MEMORY_MIRROR:
+        return config.conn
+    import changeFeed   # imports this module
+    conn = config.conn
+    # a new connection (the forms reconnect on exit) starts its own data_version: only the changelog tells
+    stamp = (conn, conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+    if stamp != _mirrorStamp:
+        version = changeFeed.version(conn)
+        if _mirror is None or version != _mirrorVersion:
+            if _mirror is None:
+                _mirror = connect(MIRROR_URI, uri=True)
+            try:
+                with eventLog.span("mirrorRefresh"):
+                    conn.backup(_mirror)
+            except sqlite3.OperationalError:    # the live Find thread reading it: stale for now, copied next time
+                return _mirror
+            _mirrorVersion = version
+            findCache.cache.clear()     # its rows came from the old copy
+        _mirrorStamp = stamp
+    return _mirror
+
+def thread_reader():
+    "A connection of its own for a background reading thread: to the mirror, or to the file."
+    if config.MEMORY_MIRROR:
+        return connect(MIRROR_URI, uri=True)    # the same memory database while any connection is open
+    return connect(config.dataPath + config.dbname)
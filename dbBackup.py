@@ -0,0 +1,150 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     dbBackup.py - Online backup of the database
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Copying bookstore.db with the file manager needs everybody out of the program, or the
+# copy may be torn. Here the SQLite backup API copies it while the terminals keep working:
+# config.backupPages pages at a time, with a pause of config.backupPause seconds in between
+# so the writers get their turn. The snapshot is written to a .part file, checked with
+# PRAGMA quick_check, and only then gets its final name, bookstore-yymmddhhmmss.db in
+# config.backupDir of the database's own directory. The config.backupsKept newest are kept.
+# In WAL mode the copy is read from a snapshot held open all along, which doesn't stop the
+# writers. In rollback journal mode the read lock is only held during each step, and SQLite
+# restarts the copy when another terminal writes in between; after config.backupRestarts
+# restarts, the rest is copied in one go (the writers wait for that single step).
+#   python dbBackup.py [database file]      --> backup now, and report
+
+import glob
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+
+import config
+import database
+
+
+class BackupError(Exception):
+    "The backup could not be made, or did not pass the check. The message says why."
+    pass
+
+class _Restarted(Exception):
+    "Too many restarts of a stepped backup."
+    pass
+
+
+def snapshot_name(directory, filename):
+    "Timestamped name of a new snapshot of a database file."
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return os.path.join(directory, name + "-" + datetime.now().strftime('%Y%m%d%H%M%S.%f')[2:-7] + ".db")
+
+def snapshots(directory, filename):
+    "Snapshots of a database file in a directory, oldest first."
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return sorted(glob.glob(os.path.join(glob.escape(directory), name + "-" + "[0-9]" * 12 + ".db")))
+
+def rotate(directory, filename, keep):
+    "Delete the oldest snapshots but keep. Returns the deleted ones."
+    old = snapshots(directory, filename)[:-keep] if keep > 0 else []
+    for snapshot in old:
+        os.remove(snapshot)
+    return old
+
+def stepped_copy(source, dest, pages=None, pause=None, progress=None):
+    """Copy the database of source into dest with the backup API, pages at a time with a pause in
+    between (all at once after config.backupRestarts restarts). Returns a dict with its size in
+    pages, the seconds taken, the longest step and the restarts. progress(remaining, total) is
+    called after every step."""
+    pages = pages or config.backupPages
+    pause = config.backupPause if pause is None else pause
+    steps = {"last": None, "longest": 0.0, "remaining": None, "restarts": 0, "total": 0}
+
+    def step(status, remaining, total):
+        now = time.perf_counter()
+        steps["longest"] = max(steps["longest"], now - steps["last"])
+        if steps["remaining"] is not None and remaining >= steps["remaining"]:
+            steps["restarts"] += 1      # no progress: the source changed and SQLite started over
+            if steps["restarts"] > config.backupRestarts:
+                raise _Restarted()
+        steps["remaining"], steps["total"] = remaining, total
+        if progress is not None:
+            progress(remaining, total)
+        if remaining > 0:
+            time.sleep(pause)       # no lock held by us here: the writers' turn
+        steps["last"] = time.perf_counter()
+
+    start = steps["last"] = time.perf_counter()
+    try:
+        source.backup(dest, pages=pages, progress=step)
+    except _Restarted:
+        steps["remaining"] = None
+        steps["last"] = time.perf_counter()
+        source.backup(dest, pages=-1, progress=step)    # too busy for small steps: all at once
+    return {"pages": steps["total"], "seconds": time.perf_counter() - start, "longest_step": steps["longest"],
+        "restarts": steps["restarts"]}
+
+def backup(filename=None, directory=None, pages=None, pause=None, keep=None, progress=None):
+    """Online backup of a database file. Returns a dict with the snapshot file, its size in pages,
+    the seconds taken, the longest step (the longest a writer may have waited), and the restarts.
+    progress(remaining, total) is called after every step."""
+    filename = filename or config.dataPath + config.dbname
+    directory = directory or os.path.join(os.path.dirname(filename), config.backupDir)     # next to the database
+    keep = config.backupsKept if keep is None else keep
+    os.makedirs(directory, exist_ok=True)
+    target = snapshot_name(directory, filename)
+    partial = target + ".part"
+
+    source = database.connect(filename)
+    try:
+        dest = sqlite3.connect(partial)
+        try:
+            if source.execute("PRAGMA journal_mode").fetchone()[0] == "wal":
+                source.execute("BEGIN")     # a read snapshot for the whole copy: no restarts
+                source.execute("SELECT count(*) FROM sqlite_schema").fetchone()
+            result = stepped_copy(source, dest, pages, pause, progress)
+            check = dest.execute("PRAGMA quick_check").fetchone()[0]
+        finally:
+            dest.close()
+    except sqlite3.Error as e:
+        _remove(partial)
+        raise BackupError("Backup of " + filename + " failed: " + str(e))
+    finally:
+        source.close()
+    if check != "ok":
+        _remove(partial)
+        raise BackupError("Backup of " + filename + " did not pass quick_check: " + check)
+    os.replace(partial, target)
+    rotate(directory, filename, keep)
+    result["file"] = target
+    return result
+
+def _remove(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
+
+def summary(result):
+    "The result of a backup, in a few lines."
+    return "Snapshot: " + result["file"] + "\n" + \
+        "%d pages in %.2f s, quick_check ok\n" % (result["pages"], result["seconds"]) + \
+        "Longest writer stall: %.1f ms" % (result["longest_step"] * 1000) + \
+        (", restarted %d times" % result["restarts"] if result["restarts"] else "")
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else config.dataPath + config.dbname
+    try:
+        print(summary(backup(filename)))
+    except (BackupError, OSError) as e:
+        print(e)
+        sys.exit(1)
@@ -0,0 +1,605 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     dbDaemon.py - Database daemon: one process writes for all the terminals
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# SQLite lets a single connection write at a time, and every terminal fights for that lock
+# with busy waits: the more terminals, the longer a Save waits. With config.DB_DAEMON on,
+# config.conn is a DaemonConnection: the same calls (execute, cursor, fetch*, commit,
+# rollback, in_transaction, total_changes) sent over a Unix socket, one JSON line each way,
+# to this process, the only one that writes the file. Each terminal gets a session:
+#   - its reads outside a write go to a read-only connection of its own, so they see what's
+#     committed and never wait for the writes;
+#   - its first write takes the writer connection (the terminals queue for it, first come
+#     first served) and runs in a SAVEPOINT, so its errors, lastrowid and RETURNING rows
+#     come back at once, as they did; the reads in between see its own changes;
+#   - its COMMIT releases the savepoint and hands the writer to the next terminal in the
+#     queue. The real COMMIT (the disk sync) is done when nobody is waiting, or when
+#     config.daemonGroupMax transactions or config.daemonGroupMs have gathered: all of them
+#     are committed together, and only then each terminal gets its answer (group commit).
+#     A timer commits the group when it's daemonGroupMs old even if the terminal writing now
+#     takes its time (a dialog open half way through a Save): its savepoint is rolled back,
+#     the group committed, and its writes done again on the very same data.
+#     A ROLLBACK undoes the savepoint of that terminal alone.
+# BEGIN doesn't lock anything by itself: the writer is taken at the first write, so a form
+# open in Update mode no longer holds the other terminals back while somebody types (the
+# last Save wins, as between terminals with their own copies of a record). A transaction
+# left open half way (an error message in the middle of a Save) still makes the next writes
+# wait, as the database lock did, but not the Saves already done. The background readers (live Find, listings) still read
+# the file directly; so do the command line and the HTTP API, which may also write it: the
+# daemon waits for them as any connection would.
+#   python dbDaemon.py [--db file] [--socket path]
+
+import argparse
+import collections
+import json
+import os
+import re
+import signal
+import socket
+import socketserver
+import sqlite3
+import sys
+import threading
+import time
+
+import config
+import database
+import dbMigrations
+import dbSchema
+import eventLog
+
+DML = ("INSERT", "UPDATE", "DELETE", "REPLACE")     # they open a transaction by themselves, as in sqlite3
+WRITES = DML + ("CREATE", "DROP", "ALTER", "ANALYZE", "REINDEX", "SAVEPOINT", "RELEASE")
+WRITING_PRAGMAS = ("optimize", "incremental_vacuum")
+OUTSIDE_TRANSACTION = ("VACUUM",)   # and executescript(): the pending transactions are committed first
+OUTSIDE_PRAGMAS = ("journal_mode", "wal_checkpoint")
+
+SAVEPOINT = "terminal"
+
+
+def statement_kind(sql):
+    "'begin', 'commit', 'rollback', 'dml', 'write', 'outside' or 'read'."
+    words = re.findall(r"[A-Za-z_]+", sql[:200].upper())
+    first = words[0] if words else ""
+    if first == "BEGIN":
+        return "begin"
+    if first in ("COMMIT", "END"):
+        return "commit"
+    if first == "ROLLBACK":
+        return "write" if "TO" in words[1:3] else "rollback"
+    if first in DML or (first == "WITH" and re.search(r"\b(INSERT|UPDATE|DELETE|REPLACE)\b", sql.upper())):
+        return "dml"
+    if first in OUTSIDE_TRANSACTION:
+        return "outside"
+    if first == "PRAGMA":
+        name = re.match(r"\s*PRAGMA\s+(?:\w+\.)?(\w+)", sql, re.IGNORECASE).group(1).lower()
+        if name in OUTSIDE_PRAGMAS and ("=" in sql or name == "wal_checkpoint"):
+            return "outside"
+        return "write" if "=" in sql or name in WRITING_PRAGMAS else "read"
+    return "write" if first in WRITES else "read"
+
+
+class Pending():
+    "A transaction released into the group, waiting for the COMMIT."
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.error = None
+
+
+class Writer():
+    "The one connection that writes, handed from one session to the next, and the group commit."
+
+    def __init__(self, filename):
+        self.conn = database.connect(filename, check_same_thread=False)
+        self.conn.isolation_level = None    # the transactions are ours to begin and end
+        self.conn.execute("PRAGMA busy_timeout = %d" % (config.daemonBusySeconds * 1000))   # other programs writing
+        self.lock = threading.Condition()   # every use of self.conn is made holding it
+        self.holder = None          # session writing now
+        self.waiting = collections.deque()  # sessions queued for the writer
+        self.group = []             # transactions released but not committed yet
+        self.groupStart = 0
+        self.savepoint = False      # the holder's savepoint is open
+        self.transactions = 0
+        self.commits = 0
+        self.stopped = threading.Event()
+        self.timer = threading.Thread(target=self.flusher, name="groupCommit", daemon=True)
+        self.timer.start()
+
+    def acquire(self, session):
+        "Wait for the writer, first come first served; 'database is locked' after config.daemonBusySeconds."
+        deadline = time.monotonic() + config.daemonBusySeconds
+        with self.lock:
+            self.waiting.append(session)
+            while self.holder is not None or self.waiting[0] is not session:
+                if not self.lock.wait(deadline - time.monotonic()) and time.monotonic() >= deadline:
+                    self.waiting.remove(session)
+                    self.lock.notify_all()
+                    raise sqlite3.OperationalError("database is locked")
+            self.waiting.popleft()
+            self.holder = session
+
+    def release(self):
+        "Hand the writer over. The group is committed if nobody waits, or if it's big or old enough."
+        with self.lock:
+            if self.group and (not self.waiting or len(self.group) >= config.daemonGroupMax or self.due()):
+                self.flush()
+            elif not self.group and not self.waiting and self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")   # nothing in it: the file lock is given back
+            self.holder = None
+            self.lock.notify_all()
+
+    def due(self):
+        return time.monotonic() - self.groupStart >= config.daemonGroupMs / 1000
+
+    def flush(self):
+        "The COMMIT of every transaction in the group, and their answers."
+        group, self.group = self.group, []
+        error = None
+        start = time.perf_counter()
+        try:
+            self.conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            error = e
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+        eventLog.event("groupCommit", transactions=len(group), ms=round((time.perf_counter() - start) * 1000, 3))
+        self.commits += 1
+        self.transactions += len(group)
+        for pending in group:
+            pending.error = error
+            pending.done.set()
+
+    def flusher(self):
+        "Timer: the group is committed when it's config.daemonGroupMs old, however long the session writing takes."
+        while not self.stopped.wait(config.daemonGroupMs / 1000):
+            with self.lock:
+                if self.group and self.due():
+                    if self.savepoint:
+                        self.preempt()
+                    else:
+                        self.flush()
+
+    def preempt(self):
+        "Commit the group without the changes of the session writing now (a dialog open half way), then redo them."
+        holder = self.holder
+        self.conn.execute("ROLLBACK TO " + SAVEPOINT)
+        self.conn.execute("RELEASE " + SAVEPOINT)
+        self.flush()
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            self.conn.execute("SAVEPOINT " + SAVEPOINT)
+            for sql, params in holder.replay:   # on the same data as before: the same results
+                self.conn.execute(sql, params)
+        except sqlite3.Error as e:
+            holder.lost = e     # its next statement or COMMIT gets the error
+            self.savepoint = False
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+
+    def begin(self, session):
+        "Take the writer for a session, in a savepoint of its own."
+        self.acquire(session)
+        try:
+            with self.lock:
+                if not self.conn.in_transaction:
+                    self.conn.execute("BEGIN IMMEDIATE")
+                self.conn.execute("SAVEPOINT " + SAVEPOINT)
+                self.savepoint = True
+        except sqlite3.Error:
+            self.release()
+            raise
+        session.replay = []
+        session.lost = None
+
+    def run(self, session, sql, params, write):
+        "A statement of the session writing now. Its writes are kept, to redo them if preempted."
+        with self.lock:
+            if session.lost is not None:
+                raise session.lost
+            before = self.conn.total_changes
+            try:
+                result = answer(self.conn.execute(sql, params))
+            finally:
+                session.total_changes += self.conn.total_changes - before
+            if write:
+                session.replay.append((sql, params))
+            return result
+
+    def end(self, session, commit):
+        "End the transaction of the session holding the writer. A commit returns once it's on disk."
+        pending = None
+        try:
+            with self.lock:
+                self.savepoint = False
+                if session.lost is not None or not self.conn.in_transaction:
+                    error = session.lost or sqlite3.OperationalError("transaction rolled back by an error")
+                    if not self.conn.in_transaction:    # an error (disk full...) rolled everything back
+                        self.lost(error)
+                    if commit:
+                        raise error
+                elif commit:
+                    self.conn.execute("RELEASE " + SAVEPOINT)
+                    pending = Pending()
+                    if not self.group:
+                        self.groupStart = time.monotonic()
+                    self.group.append(pending)
+                else:
+                    self.conn.execute("ROLLBACK TO " + SAVEPOINT)
+                    self.conn.execute("RELEASE " + SAVEPOINT)
+        finally:
+            session.replay = []
+            session.lost = None
+            self.release()
+        if pending is not None:
+            # the timer commits the group in daemonGroupMs; the COMMIT itself may wait for other programs
+            if not pending.done.wait(2 * config.daemonBusySeconds + config.daemonGroupMs / 1000):
+                raise sqlite3.OperationalError("database daemon: the COMMIT is taking too long, it may not be done")
+            if pending.error is not None:
+                raise pending.error
+
+    def lost(self, error):
+        "The transaction is gone: the answer of the group is this error."
+        with self.lock:
+            group, self.group = self.group, []
+        for pending in group:
+            pending.error = error
+            pending.done.set()
+
+    def alone(self, session, function):
+        "Run function(conn) outside any transaction (VACUUM, scripts), the pending ones committed first."
+        self.acquire(session)
+        try:
+            with self.lock:
+                if self.group:
+                    self.flush()
+                elif self.conn.in_transaction:
+                    self.conn.execute("ROLLBACK")
+                return function(self.conn)
+        finally:
+            self.release()
+
+    def close(self):
+        self.stopped.set()
+        self.timer.join()
+        with self.lock:
+            if self.group and self.savepoint:   # somebody half way: its changes out, the group in
+                self.conn.execute("ROLLBACK TO " + SAVEPOINT)
+                self.conn.execute("RELEASE " + SAVEPOINT)
+            if self.group:
+                self.flush()
+        self.conn.close()
+
+
+def answer(cursor):
+    "What the DaemonConnection gets of an executed statement."
+    rows = cursor.fetchall()
+    return {"rows": rows, "description": [column[0] for column in cursor.description or []],
+        "rowcount": cursor.rowcount, "lastrowid": cursor.lastrowid}
+
+
+class Session():
+    "A terminal connected to the daemon: its transaction, and its connection for reading."
+
+    def __init__(self, server):
+        self.filename = server.filename
+        self.writer = server.writer
+        self.reader = None
+        self.in_transaction = False     # as the terminal sees it: after BEGIN, or a DML statement
+        self.writing = False            # it holds the writer: its changes are in the savepoint
+        self.replay = []                # its writes in the savepoint, (sql, params)
+        self.lost = None                # error of the redo of its writes, if they couldn't be redone
+        self.total_changes = 0
+
+    def request(self, request):
+        "Answer a request of the DaemonConnection."
+        op = request["op"]
+        if op == "execute":
+            return self.execute(request["sql"], request["params"], request["autocommit"])
+        if op == "script":
+            if self.writing:
+                self.commit()   # as executescript() does
+            self.writer.alone(self, lambda conn: conn.executescript(request["sql"]))
+            return {}
+        if op == "commit":
+            self.commit()
+            return {}
+        if op == "rollback":
+            self.rollback()
+            return {}
+        if op == "hello":
+            return {"filename": self.filename}
+        if op == "stats":
+            return {"transactions": self.writer.transactions, "commits": self.writer.commits}
+        raise sqlite3.ProgrammingError("unknown request: " + op)
+
+    def execute(self, sql, params, autocommit):
+        "One statement: a read on the session's connection, a write on the writer."
+        kind = statement_kind(sql)
+        if kind == "begin":
+            if self.in_transaction:
+                raise sqlite3.OperationalError("cannot start a transaction within a transaction")
+            self.in_transaction = True      # the writer is taken at the first write
+            return {}
+        if kind == "commit":
+            self.commit()
+            return {}
+        if kind == "rollback":
+            self.rollback()
+            return {}
+        if kind == "read":
+            if self.writing:
+                return self.writer.run(self, sql, params, write=False)  # its own changes, not committed yet
+            if self.reader is None:
+                self.reader = database.connect("file:" + self.filename + "?mode=ro", uri=True)
+            return answer(self.reader.execute(sql, params))
+        if kind == "outside":
+            if self.in_transaction:
+                raise sqlite3.OperationalError("cannot run " + sql.split()[0] + " within a transaction")
+            return self.writer.alone(self, lambda conn: answer(conn.execute(sql, params)))
+        if not self.writing:
+            self.writer.begin(self)
+            self.writing = True
+        if kind == "dml" and not autocommit:
+            self.in_transaction = True
+        try:
+            return self.writer.run(self, sql, params, write=True)
+        finally:
+            if not self.in_transaction:     # DDL, or autocommit: a transaction of its own
+                self.commit()
+
+    def commit(self):
+        self.in_transaction = False
+        if self.writing:
+            self.writing = False
+            self.writer.end(self, commit=True)
+
+    def rollback(self):
+        self.in_transaction = False
+        if self.writing:
+            self.writing = False
+            self.writer.end(self, commit=False)
+
+    def close(self):
+        if self.writing:
+            self.rollback()     # the terminal went away half way
+        if self.reader is not None:
+            self.reader.close()
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    "The requests of one terminal, one JSON line each, answered in order."
+
+    def handle(self):
+        session = Session(self.server)
+        try:
+            for line in self.rfile:
+                try:
+                    answer = session.request(json.loads(line))
+                except (sqlite3.Error, ValueError, KeyError, TypeError) as e:
+                    name = type(e).__name__ if isinstance(e, sqlite3.Error) else "InterfaceError"
+                    answer = {"error": name, "message": str(e)}
+                answer["in_transaction"] = session.in_transaction
+                answer["total_changes"] = session.total_changes
+                self.wfile.write(json.dumps(answer, ensure_ascii=False).encode("utf-8") + b"\n")
+        except ConnectionError:
+            pass    # the terminal went away
+        finally:
+            session.close()
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    "Unix socket server with a thread per terminal, and the writer they share."
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, socketPath, filename):
+        self.filename = os.path.abspath(filename)
+        self.writer = Writer(self.filename)
+        super().__init__(socketPath, DaemonHandler)
+
+    def server_close(self):
+        super().server_close()
+        self.writer.close()
+
+
+class DaemonCursor():
+    "The part of sqlite3.Cursor the program uses, over the rows sent by the daemon."
+    arraysize = 1
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.rows = collections.deque()
+        self.description = None
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, sql, parameters=()):
+        params = dict(parameters) if isinstance(parameters, dict) else list(parameters)
+        answer = self.connection.request({"op": "execute", "sql": sql, "params": params,
+            "autocommit": self.connection.isolation_level is None})
+        self.rows = collections.deque(tuple(row) for row in answer.get("rows", []))
+        names = answer.get("description", [])
+        self.description = tuple((name, None, None, None, None, None, None) for name in names) if names else None
+        self.rowcount = answer.get("rowcount", -1)
+        self.lastrowid = answer.get("lastrowid", self.lastrowid)
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        rowcount = 0
+        for parameters in seq_of_parameters:
+            rowcount += max(self.execute(sql, parameters).rowcount, 0)
+        self.rowcount = rowcount
+        return self
+
+    def fetchone(self):
+        return self.rows.popleft() if self.rows else None
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        return [self.rows.popleft() for n in range(min(size, len(self.rows)))]
+
+    def fetchall(self):
+        rows, self.rows = list(self.rows), collections.deque()
+        return rows
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self.rows:
+            raise StopIteration
+        return self.rows.popleft()
+
+    def close(self):
+        self.rows.clear()
+
+
+class DaemonConnection():
+    "config.conn in daemon mode: the sqlite3.Connection calls of the program, answered by the daemon."
+
+    def __init__(self, socketPath):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(socketPath)
+        except OSError as e:
+            self.sock.close()
+            raise sqlite3.OperationalError("database daemon not running at " + socketPath + ": " + str(e))
+        self.file = self.sock.makefile("rwb")
+        self.isolation_level = ""   # as sqlite3: DML statements open a transaction
+        self.in_transaction = False
+        self.total_changes = 0
+
+    def request(self, request):
+        "Send a request and wait for its answer. The daemon's errors are raised as the sqlite3 ones."
+        try:
+            self.file.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+            self.file.flush()
+            line = self.file.readline()
+        except (OSError, ValueError) as e:
+            raise sqlite3.OperationalError("database daemon: " + str(e))
+        if not line:
+            raise sqlite3.OperationalError("database daemon closed the connection")
+        answer = json.loads(line)
+        self.in_transaction = answer["in_transaction"]
+        self.total_changes = answer["total_changes"]
+        if "error" in answer:
+            error = getattr(sqlite3, answer["error"], sqlite3.DatabaseError)
+            if not (isinstance(error, type) and issubclass(error, sqlite3.Error)):
+                error = sqlite3.DatabaseError
+            raise error(answer["message"])
+        return answer
+
+    def cursor(self, factory=None):
+        return DaemonCursor(self)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql):
+        self.request({"op": "script", "sql": sql})
+        return self.cursor()
+
+    def commit(self):
+        if self.in_transaction:
+            self.request({"op": "commit"})
+
+    def rollback(self):
+        if self.in_transaction:
+            self.request({"op": "rollback"})
+
+    def backup(self, target, **kwargs):
+        "Copy of the database, read from the file itself (as the mirror does)."
+        source = database.connect("file:" + self.filename() + "?mode=ro", uri=True)
+        try:
+            source.backup(target, **kwargs)
+        finally:
+            source.close()
+
+    def interrupt(self):
+        pass    # the daemon answers one statement at a time
+
+    def filename(self):
+        "File the daemon serves."
+        return self.request({"op": "hello"})["filename"]
+
+    def stats(self):
+        "Transactions and COMMITs done by the daemon so far."
+        answer = self.request({"op": "stats"})
+        return answer["transactions"], answer["commits"]
+
+    def close(self):
+        try:
+            self.file.close()
+        finally:
+            self.sock.close()
+
+def connect(socketPath=None, filename=None):
+    "Connection to the daemon. If filename is given, it must be the file the daemon serves."
+    conn = DaemonConnection(socketPath or config.daemonSocket)
+    if filename is not None and not os.path.samefile(conn.filename(), filename):
+        served = conn.filename()
+        conn.close()
+        raise sqlite3.OperationalError("database daemon serves " + served + ", not " + filename)
+    return conn
+
+def prepare(filename):
+    "Migrations pending, as the program does at startup, and the schema check. Returns the differences."
+    conn = database.connect(filename)
+    try:
+        dbMigrations.migrate(conn)
+        return dbSchema.check_schema(conn)
+    finally:
+        conn.close()
+
+def stale(socketPath):
+    "True if there's a socket file but nobody listening (a daemon that was killed)."
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(socketPath)
+        except OSError:
+            return True
+    return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Database daemon: the only writer of the bookstore database.")
+    parser.add_argument("--db", default=config.dataPath + config.dbname, help="database file")
+    parser.add_argument("--socket", default=config.daemonSocket, help="Unix socket of the terminals")
+    args = parser.parse_args()
+    eventLog.setup()
+    try:
+        differences = prepare(args.db)
+    except sqlite3.Error as e:
+        print("Database " + args.db + ": " + str(e), file=sys.stderr)
+        sys.exit(1)
+    if differences:
+        print("Database schema is not the expected one: " + "; ".join(differences[:10]), file=sys.stderr)
+        sys.exit(1)
+    if os.path.exists(args.socket):
+        if not stale(args.socket):
+            print("A database daemon is already running at " + args.socket, file=sys.stderr)
+            sys.exit(1)
+        os.unlink(args.socket)
+    server = DaemonServer(args.socket, args.db)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)   # stopped as with Ctrl-C: the group committed
+    print("Serving " + server.filename + " on " + args.socket, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args.socket)
+        print("%d transactions in %d commits" % (server.writer.transactions, server.writer.commits), flush=True)
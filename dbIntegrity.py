@@ -0,0 +1,95 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     dbIntegrity.py - Referential integrity rules of the database, without the screen
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# The checks of the 'Database integrity check' utility, free of npyscreen so the command
+# line (bookstore.py check) runs them too. check() yields every problem as it's found:
+# the form shows each one in a popup, the command line prints them. The duplicated
+# book_author and book_warehouse records are deleted only if asked to (fix=True).
+
+
+def books_authors_publishers(conn):
+    "book -> book_author -> author, book -> publisher"
+    cur = conn.cursor()
+    for numeral, publisher_num in conn.execute("SELECT numeral, publisher_num FROM 'bookstore.book' ORDER BY id").fetchall():
+        author = cur.execute("SELECT author_num FROM 'bookstore.book_author' WHERE book_num=?", (numeral,)).fetchone()
+        if author is None:
+            yield "Book with numeral " + str(numeral) + " has no assigned author.", None
+            continue
+        if cur.execute("SELECT numeral FROM 'bookstore.author' WHERE numeral=?", (author[0],)).fetchone() is None:
+            yield "Author of book with numeral " + str(numeral) + " was not found.", None
+            continue
+        if cur.execute("SELECT numeral FROM 'bookstore.publisher' WHERE numeral=?", (publisher_num,)).fetchone() is None:
+            yield "Publisher of book with numeral " + str(numeral) + " was not found.", None
+
+def books_warehouses(conn):
+    "book -> book_warehouse -> warehouse"
+    cur = conn.cursor()
+    for (numeral,) in conn.execute("SELECT numeral FROM 'bookstore.book' ORDER BY id").fetchall():
+        warehouses_book = cur.execute("SELECT warehouse_num FROM 'bookstore.book_warehouse' WHERE book_num=?", (numeral,)).fetchall()
+        if len(warehouses_book) == 0:
+            yield "Book with numeral " + str(numeral) + " has no assigned warehouse.", None
+            continue
+        for warehouse_book in warehouses_book:
+            if cur.execute("SELECT numeral FROM 'bookstore.warehouse' WHERE numeral=?", (warehouse_book[0],)).fetchone() is None:
+                yield "Warehouse of book with numeral " + str(numeral) + " was not found.", None
+
+def book_author_references(conn):
+    "book_author -> book, book_author -> author"
+    cur = conn.cursor()
+    for id, book_num, author_num in conn.execute("SELECT id, book_num, author_num FROM 'bookstore.book_author' ORDER BY id").fetchall():
+        if cur.execute("SELECT numeral FROM 'bookstore.book' WHERE numeral=?", (book_num,)).fetchone() is None:
+            yield "Book in book_author with id=" + str(id) + " was not found.", None
+        elif cur.execute("SELECT numeral FROM 'bookstore.author' WHERE numeral=?", (author_num,)).fetchone() is None:
+            yield "Author in book_author with id=" + str(id) + " was not found.", None
+
+def book_warehouse_references(conn):
+    "book_warehouse -> book, book_warehouse -> warehouse"
+    cur = conn.cursor()
+    for id, book_num, warehouse_num in conn.execute("SELECT id, book_num, warehouse_num FROM 'bookstore.book_warehouse' ORDER BY id").fetchall():
+        if cur.execute("SELECT numeral FROM 'bookstore.book' WHERE numeral=?", (book_num,)).fetchone() is None:
+            yield "Book in book_warehouse with id=" + str(id) + " was not found.", None
+        elif cur.execute("SELECT numeral FROM 'bookstore.warehouse' WHERE numeral=?", (warehouse_num,)).fetchone() is None:
+            yield "Warehouse in book_warehouse with id=" + str(id) + " was not found.", None
+
+def book_author_duplicates(conn):
+    "book_author duplicates"
+    last_book = None
+    for id, book_num in conn.execute("SELECT id, book_num FROM 'bookstore.book_author' ORDER BY book_num").fetchall():
+        if book_num == last_book:
+            yield "Book in book_author with id=" + str(id) + " is duplicated.", \
+                ("DELETE FROM 'bookstore.book_author' WHERE id=?", (id,))
+        last_book = book_num
+
+def book_warehouse_duplicates(conn):
+    "book_warehouse duplicates"
+    last = None
+    for id, book_num, warehouse_num in conn.execute("SELECT id, book_num, warehouse_num FROM 'bookstore.book_warehouse' " \
+            "ORDER BY book_num, warehouse_num").fetchall():
+        if (book_num, warehouse_num) == last:
+            yield "Book in book_warehouse with id=" + str(id) + " is duplicated.", \
+                ("DELETE FROM 'bookstore.book_warehouse' WHERE id=?", (id,))
+        last = (book_num, warehouse_num)
+
+CHECKS = [books_authors_publishers, books_warehouses, book_author_references, book_warehouse_references,
+    book_author_duplicates, book_warehouse_duplicates]
+
+def check(conn, fix=False, progress=None):
+    """Run every check. Yields (message, fixable) for every problem found; with fix=True the fixable
+    ones (duplicates) are deleted once the caller has seen them. progress(description) before each check."""
+    for rule in CHECKS:
+        if progress is not None:
+            progress(rule.__doc__)
+        for message, repair in rule(conn):
+            yield message, repair is not None
+            if fix and repair is not None:
+                conn.execute(*repair)
+                conn.commit()
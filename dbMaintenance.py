@@ -0,0 +1,298 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     dbMaintenance.py - Database maintenance: statistics, vacuum, space report
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# After bulk deletions the file doesn't shrink, and the query planner keeps deciding with
+# the statistics of the table as it was. The maintenance steps, each one timed so they can
+# be scheduled off-hours (e.g. from cron with the command line):
+#   search      the accent-insensitive search columns (textSearch.py) refilled where another
+#               tool changed the name or title
+#   analyze     ANALYZE: fresh statistics of every table and index
+#   optimize    PRAGMA optimize: what SQLite itself thinks is worth re-analyzing
+#   changelog   the changelog of the selector grids (changeFeed.py) pruned to its last entries
+#   vacuum      PRAGMA incremental_vacuum: the free pages go back to the file system.
+#               If the database is still without auto_vacuum = INCREMENTAL (migration 4),
+#               or its page size is not config.pageSize (migration 5), a full VACUUM first,
+#               once: it rewrites the whole file, so it's left to this step and not done
+#               at the startup of the terminals.
+#   fts         'optimize' command of every FTS5 full-text table, if any
+#   space       dbstat report: pages, size, unused space and fragmentation of every
+#               table and index
+#   python dbMaintenance.py [--steps analyze,optimize,...] [database file]
+
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import npyscreen
+
+import bsWidgets as bs
+import changeFeed
+import config
+import database
+import eventLog
+import textSearch
+from dbIntegrityCheck import Mi_MiniButtonPress
+
+CR  = chr(13)
+LF  = chr(10)
+
+if config.system_release == "10":   LF = ''     # Windows 8.1 notepad program needs LF
+
+AUTO_VACUUM_INCREMENTAL = 2
+
+# dbstat rows in b-tree order: the fragmentation is how often the next page isn't the next one in the file
+SPACE_QUERY = "SELECT name, pageno, pgsize, unused FROM dbstat ORDER BY name, path"
+
+helpText =  "Database maintenance:\n\n" \
+        "   1. Search columns of the names and titles changed by other tools refilled.\n" \
+        "   2. ANALYZE and PRAGMA optimize: up-to-date statistics for the query planner.\n" \
+        "   3. Old entries of the changelog (for the selector grids) deleted.\n" \
+        "   4. Incremental vacuum: the space freed by deletions is given back to the disk.\n" \
+        "   5. Optimize of the full-text tables, if any.\n" \
+        "   6. Report of the size, unused space and fragmentation of every table and index.\n\n" \
+        "   Every step is timed. The other terminals should be idle: the vacuum locks the database.\n" \
+        "   From the command line:  python dbMaintenance.py"
+
+
+def search(conn):
+    "Refill the text search columns of the rows changed by other tools."
+    return "%d rows refilled" % textSearch.refill(conn)
+
+def analyze(conn):
+    "Fresh statistics of every table and index."
+    conn.execute("ANALYZE")
+    conn.commit()
+    return "statistics updated"
+
+def optimize(conn):
+    "Let SQLite re-analyze what it thinks is worth it."
+    conn.execute("PRAGMA optimize")
+    conn.commit()
+    return "done"
+
+def rebuild_pending(conn):
+    "True if the file still needs the full VACUUM of migrations 4 and 5."
+    pageSize = conn.execute("PRAGMA page_size").fetchone()[0]
+    wal = conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"     # the page size can't change in WAL mode
+    return conn.execute("PRAGMA auto_vacuum").fetchone()[0] != AUTO_VACUUM_INCREMENTAL or \
+        (pageSize != config.pageSize and not wal)
+
+def vacuum(conn):
+    "Give the free pages back to the file system."
+    before = os.path.getsize(database_file(conn))
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if conn.in_transaction:
+        conn.commit()
+    if rebuild_pending(conn):
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA page_size = %d" % config.pageSize)
+        conn.execute("VACUUM")      # once: from now on, incremental
+        result = "full VACUUM, auto_vacuum INCREMENTAL, page size %d" % conn.execute("PRAGMA page_size").fetchone()[0]
+    else:
+        conn.executescript("PRAGMA incremental_vacuum")  # stepped to the end: execute() frees a single page
+        result = "%d free pages released" % free
+    after = os.path.getsize(database_file(conn))
+    return result + ", file %s --> %s" % (kbytes(before), kbytes(after))
+
+def fts(conn):
+    "The 'optimize' command of every FTS5 table: their index segments merged into one."
+    tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_schema WHERE type = 'table' " \
+        "AND sql LIKE 'CREATE VIRTUAL TABLE%USING fts5%'")]
+    for table in tables:
+        conn.execute("INSERT INTO \"" + table + "\" (\"" + table + "\") VALUES ('optimize')")
+    conn.commit()
+    return ("optimized: " + ", ".join(tables)) if tables else "no full-text tables"
+
+def changelog(conn):
+    "Prune the changelog of the selector grids to its last config.changelogKept entries."
+    return "%d old entries deleted" % changeFeed.prune(conn)
+
+def has_dbstat(conn):
+    "True if this SQLite was built with the dbstat table (SQLITE_ENABLE_DBSTAT_VTAB)."
+    try:
+        return conn.execute("SELECT 1 FROM pragma_module_list WHERE name = 'dbstat'").fetchone() is not None
+    except sqlite3.OperationalError:     # no introspection pragmas either
+        return False
+
+def space(conn):
+    "Pages, bytes, unused bytes and fragmentation of every table and index, the biggest first."
+    if not has_dbstat(conn):    # the whole file only: its pages, and the free ones as unused
+        pages = conn.execute("PRAGMA page_count").fetchone()[0]
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        pageSize = conn.execute("PRAGMA page_size").fetchone()[0]
+        return [("(whole file: this SQLite has no dbstat)", pages, pages * pageSize, free / pages if pages else 0.0, 0.0)]
+    objects = {}
+    for name, pageno, pgsize, unused in conn.execute(SPACE_QUERY):
+        o = objects.setdefault(name, {"pages": 0, "bytes": 0, "unused": 0, "jumps": 0, "last": None})
+        if o["last"] is not None and pageno != o["last"] + 1:
+            o["jumps"] += 1
+        o["pages"] += 1
+        o["bytes"] += pgsize
+        o["unused"] += unused
+        o["last"] = pageno
+    report = []
+    for name, o in objects.items():
+        fragmentation = o["jumps"] / (o["pages"] - 1) if o["pages"] > 1 else 0.0
+        report.append((name, o["pages"], o["bytes"], o["unused"] / o["bytes"], fragmentation))
+    report.sort(key=lambda r: (-r[2], r[0]))
+    return report
+
+STEPS = {
+    "search": search,
+    "analyze": analyze,
+    "optimize": optimize,
+    "changelog": changelog,     # before the vacuum, which gives its pages back
+    "vacuum": vacuum,
+    "fts": fts,
+}
+
+def run(conn, steps=None, progress=None):
+    "Run the maintenance steps (all by default). Returns a list of (step, seconds, result)."
+    results = []
+    for step in steps or STEPS:
+        if progress is not None:
+            progress(step)
+        start = time.perf_counter()
+        with eventLog.span("maintenance", step=step):
+            result = STEPS[step](conn)
+        results.append((step, time.perf_counter() - start, result))
+    return results
+
+def database_file(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+def kbytes(size):
+    return "{:,} KB".format(size // 1024)
+
+def write_report(conn, results, f):
+    "Write the step timings and the space report to an open text file."
+    f.write("Maintenance of " + database_file(conn) + "  " + datetime.now().strftime("%Y-%m-%d %H:%M") + CR + LF)
+    f.write("-" * 100 + CR + LF)
+    for step, seconds, result in results:
+        f.write(step.ljust(12) + ("%8.3f s  " % seconds) + result + CR + LF)
+    f.write(CR + LF)
+    start = time.perf_counter()
+    report = space(conn)
+    seconds = time.perf_counter() - start
+    f.write("Table or index".ljust(50) + "Pages".rjust(9) + "Size".rjust(14) + "Unused".rjust(10) + "Fragm.".rjust(10) + CR + LF)
+    f.write("-" * 100 + CR + LF)
+    for name, pages, size, unused, fragmentation in report:
+        f.write(name[:49].ljust(50) + str(pages).rjust(9) + kbytes(size).rjust(14) + \
+            ("%.0f %%" % (unused * 100)).rjust(10) + ("%.0f %%" % (fragmentation * 100)).rjust(10) + CR + LF)
+    f.write("-" * 100 + CR + LF)
+    f.write("space".ljust(12) + ("%8.3f s  " % seconds) + str(len(report)) + " tables and indexes, " + \
+        kbytes(os.path.getsize(database_file(conn))) + " in the file" + CR + LF)
+
+def show_report(conn, results):
+    "Write the report in the Reports folder and open it with the text viewer."
+    filename = config.dataPath + "Reports/maintenance-" + datetime.now().strftime('%Y%m%d%H%M%S.%f')[2:-7] + ".txt"
+    try:
+        with open(filename, 'w') as f:
+            write_report(conn, results, f)
+    except sqlite3.Error:
+        os.remove(filename)     # not half a report
+        raise
+    subprocess.run([config.textViewer, filename])      # waits for completion (closing)
+    if not config.SAVE_REPORTS:
+        try:
+            os.remove(filename)
+        except FileNotFoundError:   # whatever
+            pass
+
+
+class MaintenanceForm(npyscreen.FormBaseNew):
+    "Form for the database maintenance."
+    def __init__(self, name="Maintenance", parentApp=None, framed=None, help=None, color='FORMDEFAULT',\
+    widget_list=None, cycle_widgets=False, *args, **keywords):
+
+        """ Crea el padre, npyscreen.FormBaseNew. """
+        super().__init__(name, parentApp, framed, help, color, widget_list, cycle_widgets=cycle_widgets, *args, **keywords)
+
+    def create(self):
+        """The standard constructor will call the method .create(), which you should override to create the Form widgets."""
+        self.framed = True   # Framed form
+        self.how_exited_handers[npyscreen.wgwidget.EXITED_ESCAPE] = self.exitMaintenance   # Escape exit
+
+        # Form title
+        pname, version = config.pname, config.program_version
+        self.formTitle = pname + " " + version + " - Database Maintenance "
+        self.title = self.add(bs.MyFixedText, name="Maintenance", value=self.formTitle,\
+            relx=2, rely=0, editable=False)  # Screen title line
+        #-------------------------------------------------------------------------------------------------------------------------
+        self.infoTxt = self.add(bs.MyMultiLineEdit, name="", value="", relx=13, rely=7, max_height=3, editable=False)
+        #-------------------------------------------------------------------------------------------------------------------------
+        self.ok_button=self.add(Mi_MiniButtonPress, name="Run maintenance", relx=21, rely=14, editable=True)
+        self.ok_button.when_pressed_function = self.RunMaintenancebtn_function
+        self.cancel_button=self.add(Mi_MiniButtonPress, name="Cancel", relx=45, rely=14, editable=True)
+        self.cancel_button.when_pressed_function = self.Cancelbtn_function
+
+        self.statusLine=self.add(npyscreen.FixedText, name="MaintenanceStatus", value="", relx=2, rely=23, use_max_space=True, editable=False)
+        self.statusLine.value = "Select button"
+
+    def beforeEditing(self):
+        "Say if the full VACUUM is still pending."
+        info = "Statistics, vacuum and space report of the database.\nBetter with the other terminals idle.\n"
+        if rebuild_pending(config.conn):
+            info += "Pending: a full VACUUM, it rewrites the whole file."
+        self.infoTxt.value = info
+
+    def RunMaintenancebtn_function(self):
+        "Run maintenance button function."
+        self.runMaintenance()
+
+    def Cancelbtn_function(self):
+        "Cancel button function."
+        self.exitMaintenance()
+
+    def runMaintenance(self):
+        "Run every maintenance step, then show the report."
+        message = "   Do you want to run the maintenance now?\n   (it can take some time to complete)\n"
+        if not bs.notify_ok_cancel(message, title="", wrap=True, editw = 1,):
+            return
+        conn = config.conn
+        def progress(step):
+            bs.notify("\n    Maintenance: " + step + "...", title="Message", form_color='STANDOUT', wrap=True, wide=False)
+        try:
+            results = run(conn, progress=progress)
+        except sqlite3.OperationalError as e:
+            bs.notify_OK("\n    sqlite3.OperationalError: \n"+str(e),"Message", form_color='STANDOUT', wrap=True, wide=False)
+            return
+        try:
+            show_report(conn, results)
+        except (FileNotFoundError, sqlite3.Error):  # no report directory, no text viewer, no space report: the timings at least
+            bs.notify_OK("\n" + "\n".join("%-10s %7.3f s" % (step, seconds) for step, seconds, result in results), "Maintenance")
+        self.exitMaintenance()
+
+    def exitMaintenance(self):
+        self.statusLine.value = "Select button"
+        config.parentApp.setNextForm("UTILITIES")
+        config.parentApp.switchFormNow()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    steps = None
+    if "--steps" in args:
+        i = args.index("--steps")
+        steps = args[i + 1].split(",")
+        del args[i:i + 2]
+        for step in steps:
+            if step not in STEPS:
+                print("Unknown step: " + step + "  (" + ", ".join(STEPS) + ")")
+                sys.exit(2)
+    filename = args[0] if args else config.dataPath + config.dbname
+    CR, LF = "", "\n"   # the standard output translates the line ends already
+    conn = database.connect(filename)
+    write_report(conn, run(conn, steps, progress=lambda step: print(step + "...", flush=True)), sys.stdout)
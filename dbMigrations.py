@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     dbMigrations.py - Database schema migrations
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# PRAGMA user_version is the number of the last migration applied to the database file.
+# At startup, the pending ones are applied in order, each one in its own transaction.
+# The file rebuilds (full VACUUM) of migrations 4 and 5 are not done here, at the startup of
+# every terminal: they are pending in the file itself (PRAGMA auto_vacuum, page_size), and
+# the vacuum step of dbMaintenance does them when an operator runs it.
+# dbSchema.EXPECTED describes the schema after the last one.
+#   python dbMigrations.py [database file]     --> migrate a database file
+
+import sqlite3
+import sys
+
+import changeFeed
+import config
+import database
+import numeralSequence
+import textSearch
+
+# Normalised ISBN: the digits (and final X) only, as typed in Find with or without hyphens.
+ISBN_NORM = "upper(replace(replace({0}, '-', ''), ' ', ''))"
+
+# (user_version after it, description, statements)
+MIGRATIONS = [
+    (1, "Normalised ISBN column, and indexes for the Find exact lookups", [
+        "ALTER TABLE 'bookstore.book' ADD COLUMN isbn_norm TEXT",
+        "UPDATE 'bookstore.book' SET isbn_norm = " + ISBN_NORM.format("isbn"),
+        "CREATE INDEX book_isbn_norm ON 'bookstore.book' (isbn_norm)",
+        "CREATE INDEX book_year ON 'bookstore.book' (year)",
+        "CREATE INDEX book_author_book ON 'bookstore.book_author' (book_num)",   # so the lookups drive the joins
+        "CREATE TRIGGER book_isbn_norm_insert AFTER INSERT ON 'bookstore.book' BEGIN " +
+            "UPDATE 'bookstore.book' SET isbn_norm = " + ISBN_NORM.format("NEW.isbn") + " WHERE id = NEW.id; END",
+        "CREATE TRIGGER book_isbn_norm_update AFTER UPDATE OF isbn ON 'bookstore.book' BEGIN " +
+            "UPDATE 'bookstore.book' SET isbn_norm = " + ISBN_NORM.format("NEW.isbn") + " WHERE id = NEW.id; END",
+    ]),
+    (2, "Accent- and case-insensitive shadow columns for text search", textSearch.migration_statements()),
+    (3, "Sequence table for the numerals of new records", numeralSequence.migration_statements()),
+    (4, "Incremental auto-vacuum, so the file can shrink after deletions (dbMaintenance vacuum)", []),
+    (5, "Page size of config.pageSize (dbMaintenance vacuum)", []),
+    (6, "Changelog of the selector tables, for the grids of the other terminals", changeFeed.migration_statements()),
+    (7, "Stock changes in the changelog, for the HTTP API versions", changeFeed.book_link_statements("book_warehouse")),
+    (8, "Shadow columns of text search filled by the program, not by triggers", textSearch.drop_trigger_statements()),
+]
+
+LAST_VERSION = MIGRATIONS[-1][0]
+
+
+def pending(conn):
+    "Migrations not applied yet to the database."
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    return [m for m in MIGRATIONS if m[0] > version]
+
+def migrate(conn):
+    "Apply the pending migrations. Returns the list of their descriptions."
+    done = []
+    for version, description, statements in pending(conn):
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                conn.rollback()     # another program instance was quicker
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("PRAGMA user_version = %d" % version)
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        done.append(description)
+    return done
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else config.dataPath + config.dbname
+    import dbMaintenance
+    conn = database.connect(filename)     # with the functions the migrations use
+    for description in migrate(conn):
+        print("applied: " + description)
+    print("user_version: " + str(conn.execute("PRAGMA user_version").fetchone()[0]))
+    if dbMaintenance.rebuild_pending(conn):
+        print("pending: a full VACUUM (auto_vacuum, page size), run  python dbMaintenance.py --steps vacuum")
@@ -0,0 +1,198 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     dbSchema.py - Database schema validation
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# At startup, the whole schema (tables, columns, indexes, triggers) is read in a single
+# query and compared with EXPECTED. If PRAGMA schema_version is the same as in the last
+# successful check (remembered in Data/schema_check.json), even that query is skipped.
+# EXPECTED is the schema after the last migration in dbMigrations.py.
+#   python dbSchema.py [database file]          --> differences and fingerprint
+#   python dbSchema.py --dump [database file]   --> current schema as an EXPECTED literal
+
+import hashlib
+import json
+import sys
+
+import config
+
+# table --> ([columns, in order], [indexes])
+EXPECTED = {
+    "bookstore.author": (
+        ["id INTEGER NOT NULL PRIMARY KEY", "numeral INTEGER NOT NULL", "name TEXT NOT NULL", "address TEXT",
+        "bio TEXT", "url TEXT", "name_norm TEXT"],
+        ["UNIQUE (id)", "UNIQUE (name)", "UNIQUE (numeral)", "author_name_norm (name_norm)"]),
+    "bookstore.book": (
+        ["id INTEGER NOT NULL PRIMARY KEY", "numeral INTEGER NOT NULL", "book_title TEXT NOT NULL", "original_title TEXT",
+        "description TEXT", "isbn CHAR (13) NOT NULL", "year INTEGER NOT NULL", "publisher_num INTEGER NOT NULL",
+        "creation_date TEXT NOT NULL", "genre_id INTEGER NOT NULL", "cover_type INTEGER NOT NULL", "price FLOAT (4, 2) NOT NULL",
+        "isbn_norm TEXT", "title_norm TEXT"],
+        ["UNIQUE (id)", "UNIQUE (numeral)", "book_isbn_norm (isbn_norm)", "book_title_norm (title_norm)", "book_year (year)"]),
+    "bookstore.book_author": (
+        ["id INTEGER NOT NULL PRIMARY KEY", "book_num INTEGER NOT NULL", "author_num INTEGER NOT NULL",
+        "is_main_author BOOLEAN NOT NULL"],
+        ["UNIQUE (id)", "book_author_book (book_num)"]),
+    "bookstore.book_warehouse": (
+        ["id INTEGER NOT NULL PRIMARY KEY", "book_num INTEGER NOT NULL", "warehouse_num INTEGER NOT NULL", "bookshelf TEXT",
+        "stock INTEGER"],
+        ["UNIQUE (id)"]),
+    "bookstore.changelog": (
+        ["seq INTEGER PRIMARY KEY", "table_name TEXT NOT NULL", "row_id INTEGER NOT NULL", "op TEXT NOT NULL"],
+        []),
+    "bookstore.publisher": (
+        ["id INTEGER NOT NULL PRIMARY KEY", "numeral INTEGER NOT NULL", "name TEXT NOT NULL", "address TEXT NOT NULL",
+        "phone TEXT NOT NULL", "url TEXT NOT NULL", "name_norm TEXT"],
+        ["UNIQUE (id)", "UNIQUE (name)", "UNIQUE (numeral)", "publisher_name_norm (name_norm)"]),
+    "bookstore.sequence": (
+        ["name TEXT NOT NULL PRIMARY KEY", "next_numeral INTEGER NOT NULL"],
+        ["UNIQUE (name)"]),
+    "bookstore.user": (
+        ["id INTEGER NOT NULL PRIMARY KEY", "numeral INTEGER NOT NULL", "user TEXT NOT NULL", "user_name TEXT",
+        "user_level INTEGER NOT NULL", "creation_date TEXT NOT NULL", "password TEXT NOT NULL"],
+        ["UNIQUE (id)", "UNIQUE (numeral)", "UNIQUE (user)"]),
+    "bookstore.warehouse": (
+        ["id INTEGER NOT NULL PRIMARY KEY", "numeral INTEGER NOT NULL", "code TEXT NOT NULL", "address TEXT NOT NULL",
+        "phone", "code_norm TEXT"],
+        ["UNIQUE (code)", "UNIQUE (id)", "UNIQUE (numeral)", "warehouse_code_norm (code_norm)"]),
+}
+EXPECTED_TRIGGERS = ["book_isbn_norm_insert", "book_isbn_norm_update",
+    "author_changelog_insert", "author_changelog_update", "author_changelog_delete",
+    "book_changelog_insert", "book_changelog_update", "book_changelog_delete",
+    "publisher_changelog_insert", "publisher_changelog_update", "publisher_changelog_delete",
+    "user_changelog_insert", "user_changelog_update", "user_changelog_delete",
+    "warehouse_changelog_insert", "warehouse_changelog_update", "warehouse_changelog_delete",
+    "book_author_changelog_insert", "book_author_changelog_update", "book_author_changelog_delete",
+    "book_warehouse_changelog_insert", "book_warehouse_changelog_update", "book_warehouse_changelog_delete"]
+EXPECTED_VIEWS = []
+
+# Everything in one pass: columns, index columns, and the other schema objects.
+SCHEMA_QUERY = """
+    SELECT 'column', m.name, p.cid, p.name, upper(p.type), p."notnull", p.pk
+        FROM sqlite_schema AS m, pragma_table_info(m.name) AS p
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite!_%' ESCAPE '!'
+    UNION ALL
+    SELECT 'index', m.name, il.name, ii.seqno, ii.name, il."unique", il.origin
+        FROM sqlite_schema AS m, pragma_index_list(m.name) AS il, pragma_index_info(il.name) AS ii
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite!_%' ESCAPE '!'
+    UNION ALL
+    SELECT m.type, m.tbl_name, m.name, 0, NULL, NULL, NULL
+        FROM sqlite_schema AS m WHERE m.type IN ('trigger', 'view')
+    """
+
+
+def cache_filename():
+    return config.dataPath + "schema_check.json"
+
+def read_schema(conn):
+    "Current schema, in the EXPECTED format. Returns (tables, triggers, views)."
+    columns, indexes, triggers, views = {}, {}, [], []
+    for kind, table, a, b, c, d, e in conn.execute(SCHEMA_QUERY):
+        if kind == "column":    # a=cid, b=name, c=type, d=notnull, e=pk
+            column = (b + " " + c).strip() + (" NOT NULL" if d else "") + (" PRIMARY KEY" if e else "")
+            columns.setdefault(table, []).append((a, column))
+        elif kind == "index":   # a=index name, b=seqno, c=column, d=unique, e=origin
+            index = indexes.setdefault(table, {}).setdefault(a, [a, d, e, []])
+            index[3].append((b, c if c is not None else "<expression>"))
+        elif kind == "trigger":
+            triggers.append(a)
+        elif kind == "view":
+            views.append(a)
+    tables = {}
+    for table, cols in columns.items():
+        indexList = []
+        for name, unique, origin, cols_ in indexes.get(table, {}).values():
+            text = ("UNIQUE " if unique else "") + "(" + ", ".join(col for seqno, col in sorted(cols_)) + ")"
+            if origin == "c":   # explicitly created: name included; autoindexes are known by their columns
+                text = name + " " + text
+            indexList.append(text)
+        tables[table] = ([col for cid, col in sorted(cols)], sorted(indexList))
+    return tables, sorted(triggers), sorted(views)
+
+def fingerprint(tables, triggers, views):
+    data = json.dumps([sorted((t, list(c), list(i)) for t, (c, i) in tables.items()), triggers, views])
+    return hashlib.sha256(data.encode()).hexdigest()[:16]
+
+def expected_fingerprint():
+    return fingerprint(EXPECTED, sorted(EXPECTED_TRIGGERS), sorted(EXPECTED_VIEWS))
+
+def differences(tables, triggers, views):
+    "Precise list of differences between a schema and the expected one."
+    diff = []
+    for table, (expColumns, expIndexes) in EXPECTED.items():
+        if table not in tables:
+            diff.append("missing table " + table)
+            continue
+        columns, indexes = tables[table]
+        for n in range(max(len(columns), len(expColumns))):
+            found = columns[n] if n < len(columns) else None
+            expected = expColumns[n] if n < len(expColumns) else None
+            if found is None:
+                diff.append(table + ": missing column " + str(n) + " '" + expected + "'")
+            elif expected is None:
+                diff.append(table + ": unexpected column " + str(n) + " '" + found + "'")
+            elif found != expected:
+                diff.append(table + ": column " + str(n) + " is '" + found + "', expected '" + expected + "'")
+        for index in sorted(set(expIndexes) - set(indexes)):
+            diff.append(table + ": missing index " + index)
+        for index in sorted(set(indexes) - set(expIndexes)):
+            diff.append(table + ": unexpected index " + index)
+    for table in sorted(set(tables) - set(EXPECTED)):
+        diff.append("unexpected table " + table)
+    for kind, found, expected in (("trigger", triggers, EXPECTED_TRIGGERS), ("view", views, EXPECTED_VIEWS)):
+        diff += ["missing " + kind + " " + name for name in sorted(set(expected) - set(found))]
+        diff += ["unexpected " + kind + " " + name for name in sorted(set(found) - set(expected))]
+    return diff
+
+def read_cache():
+    try:
+        with open(cache_filename()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_cache(schemaVersion):
+    data = {"schema_version": schemaVersion, "fingerprint": expected_fingerprint()}
+    try:
+        with open(cache_filename(), "w") as f:
+            json.dump(data, f)
+    except OSError:     # read-only data directory: we'll just check again next time
+        pass
+
+def check_schema(conn):
+    "Validate the database schema. Returns the list of differences, empty if it's the expected one."
+    schemaVersion = conn.execute("PRAGMA schema_version").fetchone()[0]
+    cache = read_cache()
+    if cache.get("schema_version") == schemaVersion and cache.get("fingerprint") == expected_fingerprint():
+        return []   # nothing changed since the last good check
+    tables, triggers, views = read_schema(conn)
+    if fingerprint(tables, triggers, views) == expected_fingerprint():
+        write_cache(schemaVersion)
+        return []
+    return differences(tables, triggers, views)
+
+
+if __name__ == "__main__":
+    import sqlite3
+    args = sys.argv[1:]
+    dump = "--dump" in args
+    args = [a for a in args if a != "--dump"]
+    filename = args[0] if args else config.dataPath + config.dbname
+    conn = sqlite3.connect("file:" + filename + "?mode=ro", uri=True)
+    tables, triggers, views = read_schema(conn)
+    if dump:
+        for table, (columns, indexes) in sorted(tables.items()):
+            print('    "%s": (\n        %r,\n        %r),' % (table, columns, indexes))
+        print("EXPECTED_TRIGGERS = %r\nEXPECTED_VIEWS = %r" % (triggers, views))
+        sys.exit(0)
+    diff = differences(tables, triggers, views)
+    print("fingerprint: " + fingerprint(tables, triggers, views) + "   expected: " + expected_fingerprint())
+    for line in diff:
+        print("  " + line)
+    sys.exit(1 if diff else 0)
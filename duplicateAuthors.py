@@ -0,0 +1,230 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     duplicateAuthors.py - Find and merge duplicate authors
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Comparing every author with every other one is O(n^2): out of the question with
+# hundreds of thousands of them. Instead, every name (normalised already in the name_norm
+# column, see textSearch) gives a couple of blocking keys, and only the authors sharing a
+# key (a block) are compared with each other:
+#   - its normalised words, sorted:  "García Márquez, Gabriel" = "Gabriel Garcia Marquez"
+#   - its normalised surname words, sorted, and the initial of the given name:
+#     "Garcia Marquez, G." and "García Márquez, Gabriel", but "Smith, John" and "Smith, Jane" too
+# A key only says two authors may be the same: same_author() decides, and only then they
+# join the same cluster (union-find). The given names must agree word by word: an initial
+# agrees with a name starting with it, two different names never do. A cluster never holds
+# two authors whose given names disagree, so "Smith, J." goes with John or with Jane, not both.
+# Merging re-points the books of the other authors to the chosen one and deletes the
+# others, in one transaction. The members of a cluster can be left out before merging.
+
+import re
+import sqlite3
+
+import npyscreen
+
+import bsWidgets as bs
+import config
+from dbIntegrityCheck import Mi_MiniButtonPress
+
+_WORD = re.compile(r"\w+")
+
+helpText =  "Merge duplicate authors:\n\n" \
+        "   Authors whose names are the same words in another order, or with other accents or case,\n" \
+        "   or the same surnames with the given name abbreviated, are shown as clusters.\n\n" \
+        "   Choose a cluster, untick (Space) the authors that are not the same one, and choose\n" \
+        "   the author to keep: the books of the other ticked ones are moved to it, and they are deleted."
+
+
+def blocking_keys(name):
+    "Keys of a normalised name (textSearch): names sharing any of them are likely the same author."
+    keys = []
+    words = _WORD.findall(name)
+    if words:
+        keys.append(" ".join(sorted(words)))
+    surname, comma, given = name.partition(",")
+    givenWords = _WORD.findall(given)
+    if comma and givenWords:
+        keys.append(" ".join(sorted(_WORD.findall(surname))) + "|" + givenWords[0][0])
+    return keys
+
+def given_names_agree(given, otherGiven):
+    "Word by word: the same name, or an initial and a name starting with it."
+    for word, other in zip(given, otherGiven):
+        if word != other and not (len(word) == 1 and other.startswith(word)) and \
+                not (len(other) == 1 and word.startswith(other)):
+            return False
+    return True
+
+def name_parts(name):
+    "Of a normalised name: its sorted words, and its (sorted surname words, given name words), None without a comma."
+    surname, comma, given = name.partition(",")
+    givenWords = _WORD.findall(given)
+    return sorted(_WORD.findall(name)), ((sorted(_WORD.findall(surname)), givenWords) if comma and givenWords else None)
+
+def same_parts(parts, otherParts):
+    "same_author() of two name_parts()."
+    if parts[0] == otherParts[0]:
+        return True
+    parts, otherParts = parts[1], otherParts[1]
+    return parts is not None and otherParts is not None and parts[0] == otherParts[0] and \
+        given_names_agree(parts[1], otherParts[1])
+
+def different_parts(parts, otherParts):
+    "Whether two name_parts() are surely two authors: the same surnames, and given names that disagree."
+    parts, otherParts = parts[1], otherParts[1]
+    return parts is not None and otherParts is not None and parts[0] == otherParts[0] and \
+        not given_names_agree(parts[1], otherParts[1])
+
+def same_author(name, other):
+    "Whether two normalised names are the same author: the same words, or the same surnames and given names that agree."
+    return same_parts(name_parts(name), name_parts(other))
+
+def find_clusters(conn):
+    "Clusters of likely duplicate authors: lists of (numeral, name, number of books), biggest clusters first."
+    parent = {}     # union-find forest over the author numerals
+
+    def root(numeral):
+        while parent[numeral] != numeral:
+            parent[numeral] = parent[parent[numeral]]
+            numeral = parent[numeral]
+        return numeral
+
+    names, parts = {}, {}
+    blocks = {}     # blocking key --> numerals of the authors sharing it
+    for numeral, name, normName in conn.execute("SELECT numeral, name, name_norm FROM 'bookstore.author'"):
+        names[numeral] = name
+        parts[numeral] = name_parts(normName or "")
+        parent[numeral] = numeral
+        for key in blocking_keys(normName or ""):
+            blocks.setdefault(key, []).append(numeral)
+
+    members = {numeral: [numeral] for numeral in names}    # root --> its cluster
+    for block in blocks.values():
+        for i, numeral in enumerate(block):
+            for other in block[i + 1:]:
+                a, b = root(numeral), root(other)
+                if a != b and same_parts(parts[numeral], parts[other]) and \
+                        not any(different_parts(parts[x], parts[y]) for x in members[a] for y in members[b]):
+                    parent[b] = a
+                    members[a] += members.pop(b)
+    clusters = [m for m in members.values() if len(m) > 1]
+    if not clusters:
+        return []
+    books = dict(conn.execute("SELECT author_num, count(*) FROM 'bookstore.book_author' GROUP BY author_num"))
+    clusters = [sorted(((n, names[n], books.get(n, 0)) for n in m), key=lambda a: (-a[2], a[0])) for m in clusters]
+    clusters.sort(key=lambda c: (-len(c), c[0][1]))
+    return clusters
+
+def merge_authors(conn, keep, others):
+    "Move the books of the other authors to the kept one, and delete the others. One transaction."
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        marks = ",".join("?" * len(others))
+        conn.execute("UPDATE 'bookstore.book_author' SET author_num = ? WHERE author_num IN (" + marks + ")", (keep, *others))
+        # a book that had two of them now has the kept one twice: leave the main author row, or the first one
+        conn.execute("DELETE FROM 'bookstore.book_author' WHERE author_num = ? AND id NOT IN " \
+            "(SELECT id FROM (SELECT id, row_number() OVER (PARTITION BY book_num ORDER BY is_main_author DESC, id) AS n " \
+            "FROM 'bookstore.book_author' WHERE author_num = ?) WHERE n = 1)", (keep, keep))
+        conn.execute("DELETE FROM 'bookstore.author' WHERE numeral IN (" + marks + ")", tuple(others))
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+class DuplicateAuthorsForm(npyscreen.FormBaseNew):
+    "Form for finding and merging duplicate authors."
+    def __init__(self, name="DuplicateAuthors", parentApp=None, framed=None, help=None, color='FORMDEFAULT',\
+    widget_list=None, cycle_widgets=False, *args, **keywords):
+
+        """ Crea el padre, npyscreen.FormBaseNew. """
+        super().__init__(name, parentApp, framed, help, color, widget_list, cycle_widgets=cycle_widgets, *args, **keywords)
+
+    def create(self):
+        """The standard constructor will call the method .create(), which you should override to create the Form widgets."""
+        self.framed = True   # Framed form
+        self.how_exited_handers[npyscreen.wgwidget.EXITED_ESCAPE] = self.exitDuplicateAuthors   # Escape exit
+
+        # Form title
+        pname, version = config.pname, config.program_version
+        self.formTitle = pname + " " + version + " - Merge Duplicate Authors "
+        self.title = self.add(bs.MyFixedText, name="DuplicateAuthors", value=self.formTitle,\
+            relx=2, rely=0, editable=False)  # Screen title line
+        #-------------------------------------------------------------------------------------------------------------------------
+        self.infoTxt = self.add(bs.MyMultiLineEdit, name="", value="", relx=13, rely=7, max_height=3, editable=False)
+        info = "Authors that look like the same one will be shown,\nto choose which ones to merge.\n"
+        self.infoTxt.value = info
+        #-------------------------------------------------------------------------------------------------------------------------
+        self.ok_button=self.add(Mi_MiniButtonPress, name="Find duplicates", relx=21, rely=14, editable=True)
+        self.ok_button.when_pressed_function = self.FindDuplicatesbtn_function
+        self.cancel_button=self.add(Mi_MiniButtonPress, name="Cancel", relx=45, rely=14, editable=True)
+        self.cancel_button.when_pressed_function = self.Cancelbtn_function
+
+        self.statusLine=self.add(npyscreen.FixedText, name="DuplicateAuthorsStatus", value="", relx=2, rely=23, use_max_space=True, editable=False)
+        self.statusLine.value = "Select button"
+
+    def FindDuplicatesbtn_function(self):
+        "Find duplicates button function."
+        self.mergeDuplicates()
+
+    def Cancelbtn_function(self):
+        "Cancel button function."
+        self.exitDuplicateAuthors()
+
+    def mergeDuplicates(self):
+        "Show the clusters of duplicate authors until Escape, merging the ones chosen."
+        conn = config.conn
+        while True:
+            self.statusLine.value = "Looking for duplicate authors"
+            self.display(clear=True)    # no popups left over from the last merge
+            bs.notify("\n    Looking for duplicate authors...", title="Message", form_color='STANDOUT', wrap=True, wide=False)
+            clusters = find_clusters(conn)
+            if len(clusters) == 0:
+                bs.notify_OK("\n     No duplicate authors were found.\n", "Message")
+                break
+            self.statusLine.value = str(len(clusters)) + " clusters of duplicate authors found"
+            self.statusLine.display()
+            values = [" | ".join(a[1] for a in cluster) for cluster in clusters]
+            choice = bs.choose_from_list(values, title="Duplicate authors", show_atx=3, show_aty=3, columns=74, lines=16)
+            if choice == None:
+                break
+            cluster = clusters[choice]
+            values = [a[1] + "  (" + str(a[2]) + " books)" for a in cluster]
+            ticked = bs.choose_many_from_list(values, title="Authors to merge (Space unticks)", show_atx=10, show_aty=6, \
+                columns=60, lines=10)
+            if ticked == None:
+                continue
+            if len(ticked) < 2:
+                bs.notify_OK("\n     At least two authors are needed to merge.\n", "Message")
+                continue
+            cluster = [cluster[n] for n in ticked]
+            values = [values[n] for n in ticked]
+            keep = bs.choose_from_list(values, title="Author to keep", show_atx=10, show_aty=6, columns=60, lines=10)
+            if keep == None:
+                continue
+            others = [a[0] for n, a in enumerate(cluster) if n != keep]
+            message = "\n   The books of " + str(len(others)) + " authors will be moved to\n   " + cluster[keep][1] + \
+                "\n   and those authors deleted. Go on?"
+            if not bs.notify_ok_cancel(message, title="", wrap=True, editw = 1,):
+                continue
+            try:
+                merge_authors(conn, cluster[keep][0], others)
+            except sqlite3.OperationalError as e:
+                bs.notify_OK("\n    sqlite3.OperationalError: \n"+str(e),"Message", form_color='STANDOUT', wrap=True, wide=False)
+                continue
+            bs.notify("\n     Authors merged.", title="Message", form_color='STANDOUT', wrap=True, wide=False)
+        self.exitDuplicateAuthors()
+
+    def exitDuplicateAuthors(self):
+        self.statusLine.value = "Select button"
+        config.parentApp.setNextForm("UTILITIES")
+        config.parentApp.switchFormNow()
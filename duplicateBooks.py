@@ -0,0 +1,126 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     duplicateBooks.py - Duplicate books report
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Books entered twice, with different numerals, are found in a single streaming pass over
+# the book table: every book is hashed by its normalised ISBN, and by its normalised title
+# plus main author plus publisher. Only the hash and the first numeral of each key are kept
+# in memory, never the rows. Then just the books whose hash repeats are read again, to
+# write the groups (hash collisions are discarded there, comparing the real keys).
+#   python duplicateBooks.py [database file]    --> report to the standard output
+
+import os
+import subprocess
+import sys
+from datetime import datetime
+
+import config
+import database
+import findPlanner
+
+CR  = chr(13)
+LF  = chr(10)
+
+if config.system_release == "10":   LF = ''     # Windows 8.1 notepad program needs LF
+
+# numeral, normalised isbn, normalised title, main author, publisher
+SCAN_QUERY = "SELECT numeral, isbn_norm, title_norm, " \
+    "(SELECT min(author_num) FROM 'bookstore.book_author' WHERE book_num = 'bookstore.book'.numeral AND is_main_author), " \
+    "publisher_num FROM 'bookstore.book'"
+
+DETAIL_QUERY = "SELECT 'bookstore.book'.numeral, book_title, 'bookstore.author'.name, year, 'bookstore.publisher'.name, isbn " \
+    "FROM 'bookstore.book' " \
+    "LEFT JOIN 'bookstore.book_author' ON 'bookstore.book_author'.book_num = 'bookstore.book'.numeral AND is_main_author " \
+    "LEFT JOIN 'bookstore.author' ON 'bookstore.author'.numeral = 'bookstore.book_author'.author_num " \
+    "LEFT JOIN 'bookstore.publisher' ON 'bookstore.publisher'.numeral = 'bookstore.book'.publisher_num " \
+    "WHERE 'bookstore.book'.numeral IN (SELECT value FROM json_each(?)) GROUP BY 'bookstore.book'.numeral"
+
+
+def book_keys(isbn, title, author, publisher):
+    "Grouping keys of a book: by ISBN, if it's a whole one, and by title + main author + publisher."
+    keys = []
+    if isbn and findPlanner.isbn_norm(isbn):
+        keys.append(("ISBN", isbn))
+    if title:
+        keys.append(("title, author and publisher", (title, author, publisher)))
+    return keys
+
+def duplicate_groups(conn):
+    "Groups of duplicate books: list of (kind, key, [numerals]). The same books are not grouped twice."
+    first = {}      # key hash --> first numeral with it
+    repeated = {}   # key hash --> numerals, when more than one
+    for numeral, isbn, title, author, publisher in conn.execute(SCAN_QUERY):
+        for key in book_keys(isbn, title, author, publisher):
+            h = hash(key)
+            other = first.setdefault(h, numeral)
+            if other != numeral:
+                repeated.setdefault(h, [other]).append(numeral)
+    if not repeated:
+        return []
+    candidates = sorted({n for numerals in repeated.values() for n in numerals})
+    groups = {}     # real key --> numerals
+    for row in conn.execute(SCAN_QUERY + " WHERE numeral IN (SELECT value FROM json_each(?))", (str(candidates),)):
+        for key in book_keys(*row[1:]):
+            if hash(key) in repeated:
+                groups.setdefault(key, []).append(row[0])
+    found, seen = [], set()
+    for (kind, value), numerals in groups.items():     # ISBN groups first
+        if len(numerals) > 1 and tuple(sorted(numerals)) not in seen:
+            seen.add(tuple(sorted(numerals)))
+            found.append((kind, value, sorted(numerals)))
+    return found
+
+def write_report(conn, f):
+    "Write the duplicate books report to an open text file. Returns the number of groups."
+    groups = duplicate_groups(conn)
+    numerals = sorted({n for kind, key, group in groups for n in group})
+    books = {row[0]: row for row in conn.execute(DETAIL_QUERY, (str(numerals),))}
+
+    numeral = "Numeral".ljust(9)
+    book_title = "Book title".ljust(34)
+    author = "Author".ljust(26)
+    year = "Year".ljust(6)
+    publisher = "Publisher".ljust(24)
+    isbn = "ISBN".ljust(18)
+    f.write(numeral + book_title + author + year + publisher + isbn + CR + LF + "-" * 125 + CR + LF)
+    for kind, key, group in sorted(groups, key=lambda g: (g[0], books[g[2][0]][1])):
+        f.write("Same " + kind + ":" + CR + LF)
+        for n in group:
+            row = books[n]
+            numeral = str(row[0]).ljust(9)
+            book_title = row[1][:33].ljust(34)
+            author = (row[2] or "")[:25].ljust(26)
+            year = str(row[3])[:6].ljust(6)
+            publisher = (row[4] or "")[:23].ljust(24)
+            isbn = row[5][:17].ljust(18)
+            f.write(numeral + book_title + author + year + publisher + isbn + CR + LF)
+        f.write(CR + LF)
+    f.write("-" * 125 + CR + LF)   # final line
+    f.write(str(len(groups)) + " groups of duplicate books" + CR + LF)
+    return len(groups)
+
+def show_report(conn):
+    "Write the report in the Reports folder and open it with the text viewer."
+    filename = config.dataPath + "Reports/duplicate_books-" + datetime.now().strftime('%Y%m%d%H%M%S.%f')[2:-7] + ".txt"
+    with open(filename, 'w') as f, database.snapshot(conn) as snapshot:
+        write_report(snapshot, f)
+    subprocess.run([config.textViewer, filename])      # waits for completion (closing)
+    if not config.SAVE_REPORTS:
+        try:
+            os.remove(filename)
+        except FileNotFoundError:   # whatever
+            pass
+
+
+if __name__ == "__main__":
+    filename = sys.argv[1] if len(sys.argv) > 1 else config.dataPath + config.dbname
+    CR, LF = "", "\n"   # the standard output translates the line ends already
+    write_report(database.connect(filename), sys.stdout)
@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     eventLog.py - Timing spans and SQL trace, written to the event log
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Switched on with config.EVENT_LOG. Every line in the log is a JSON object:
+#   {"t": "2023-05-02 10:31:07.418", "ev": "sql", "form": "BOOKSELECTOR", "ms": 12.7, "sql": "SELECT ...", "stmts": 1}
+#   {"t": ..., "ev": "span", "form": ..., "name": "fillGrid", "obj": "BookSelectForm", "ms": 48.1}
+#   {"t": ..., "ev": "switchForm", "form": "BOOK", "from": "BOOKSELECTOR", "ms": 131.0}
+# Lines are buffered in memory and written in blocks to a size-rotated file.
+# SQL parameters are never logged: there are passwords in the user table.
+
+import contextlib
+import functools
+import json
+import logging
+import logging.handlers
+import sqlite3
+import time
+from datetime import datetime
+
+import config
+
+SQL_MAX_LENGTH = 300    # statement text is truncated in the log
+
+_logger = None
+_transition = None      # pending form switch: (from form, to form, start time)
+
+
+class BufferedHandler(logging.handlers.MemoryHandler):
+    "Memory buffer that also writes out when its oldest line gets too old."
+
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or \
+            (self.buffer and record.created - self.buffer[0].created >= config.eventLogFlushSeconds)
+
+
+def setup():
+    "Open the event log if it's switched on in config.py."
+    global _logger
+    if not config.EVENT_LOG or _logger is not None:
+        return
+    fileHandler = logging.handlers.RotatingFileHandler(config.eventLogFile, maxBytes=config.eventLogMaxBytes, \
+        backupCount=config.eventLogBackups, encoding="utf-8")
+    fileHandler.setFormatter(logging.Formatter("%(message)s"))
+    handler = BufferedHandler(config.eventLogBuffer, flushLevel=logging.ERROR, target=fileHandler)
+    logger = logging.getLogger(config.pname + ".events")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    logger.addHandler(handler)
+    _logger = logger
+
+def enabled():
+    return _logger is not None
+
+def current_form():
+    "Name of the form being edited, if any."
+    return getattr(config.parentApp, "ACTIVE_FORM_NAME", None)
+
+def event(ev, **fields):
+    "Write a structured line to the event log."
+    if _logger is None:
+        return
+    line = {"t": datetime.now().isoformat(sep=" ", timespec="milliseconds"), "ev": ev, "form": current_form()}
+    line.update(fields)
+    _logger.info(json.dumps(line, ensure_ascii=False, default=str))
+
+def flush():
+    if _logger is not None:
+        for handler in _logger.handlers:
+            handler.flush()
+
+@contextlib.contextmanager
+def span(name, **fields):
+    "Time the enclosed block as a named span."
+    if _logger is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        event("span", name=name, ms=round((time.perf_counter() - start) * 1000, 3), **fields)
+
+def timed(name):
+    "Method decorator: time every call as a span, tagged with the object class."
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            if _logger is None:
+                return method(self, *args, **kwargs)
+            with span(name, obj=type(self).__name__):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+# Form transitions: from the switch request to the first paint of the new form.
+
+def begin_transition(fromForm, toForm):
+    global _transition
+    if _logger is not None:
+        _transition = (fromForm, toForm, time.perf_counter())
+
+def end_transition(formId):
+    global _transition
+    if _transition is not None and _transition[1] == formId:
+        fromForm, toForm, start = _transition
+        _transition = None
+        event("switchForm", **{"from": fromForm, "to": toForm, "ms": round((time.perf_counter() - start) * 1000, 3)})
+
+def watch_form(formId, form):
+    "Close the pending transition span when the form gets displayed."
+    if _logger is None:
+        return
+    display = form.display
+    def timed_display(*args, **kwargs):
+        result = display(*args, **kwargs)
+        end_transition(formId)
+        return result
+    form.display = timed_display
+
+# SQL trace: the trace callback counts the statements SQLite actually runs (implicit BEGIN,
+# triggers...); the connection and cursor classes time each call as seen by the program.
+
+def _log_sql(conn, sql, start):
+    ms = round((time.perf_counter() - start) * 1000, 3)
+    event("sql", ms=ms, sql=" ".join(sql.split())[:SQL_MAX_LENGTH], stmts=conn.traced_statements)
+    conn.traced_statements = 0
+
+class TracedCursor(sqlite3.Cursor):
+    def execute(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, *args)
+        finally:
+            _log_sql(self.connection, sql, start)
+
+    def executemany(self, sql, *args):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, *args)
+        finally:
+            _log_sql(self.connection, sql, start)
+
+class TracedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.traced_statements = 0
+        self.set_trace_callback(self._trace)
+
+    def _trace(self, statement):
+        self.traced_statements += 1
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+    def commit(self):
+        if not self.in_transaction:     # nothing to commit, nothing to log
+            return super().commit()
+        start = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            _log_sql(self, "COMMIT", start)
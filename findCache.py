@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     findCache.py - LRU cache of the selectors Find results
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# The same finds get repeated all day long. Their rows are kept here, keyed by the query
+# built from the literal (field and comparator included), with the literal case-folded as
+# SQLite LIKE and NOCASE compare it. The whole cache is dropped as soon as the database
+# changes: PRAGMA data_version tells about commits by other connections (other clerks),
+# and the connection total_changes about our own ones.
+# Limited by number of entries (config.findCacheEntries) and memory (config.findCacheBytes).
+
+import collections
+import string
+import sys
+
+import config
+import eventLog
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def fold(value):
+    "ASCII-only case folding, as LIKE and COLLATE NOCASE do."
+    return value.translate(_ASCII_LOWER) if isinstance(value, str) else value
+
+def rows_size(filerows):
+    "Approximate memory taken by a list of rows, in bytes."
+    size = sys.getsizeof(filerows)
+    for row in filerows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+    return size
+
+
+class FindCache():
+    "Least-recently-used Find results, valid while the database doesn't change."
+
+    def __init__(self, maxEntries, maxBytes):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.entries = collections.OrderedDict()    # key --> (filerows, size), oldest first
+        self.bytes = 0
+        self.stamp = None       # database state the entries belong to
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def database_stamp(self, conn):
+        return (id(conn), conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+
+    def clear(self):
+        self.entries.clear()
+        self.bytes = 0
+
+    def fetch(self, conn, sqlQuery, values):
+        "Rows of a Find query, from the cache or from the database."
+        stamp = self.database_stamp(conn)
+        if stamp != self.stamp:
+            if self.entries:
+                self.invalidations += 1
+                self.clear()
+            self.stamp = stamp
+        key = (fold(sqlQuery), tuple(fold(value) for value in values))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            eventLog.event("findCache", hit=True, entries=len(self.entries))
+            return list(entry[0])
+        self.misses += 1
+        filerows = conn.execute(sqlQuery, values).fetchall()
+        self.store(key, filerows)
+        eventLog.event("findCache", hit=False, entries=len(self.entries), bytes=self.bytes)
+        return filerows
+
+    def store(self, key, filerows):
+        size = rows_size(filerows)
+        if size > self.maxBytes:
+            return      # too big to be worth it
+        self.entries[key] = (list(filerows), size)
+        self.bytes += size
+        while len(self.entries) > self.maxEntries or self.bytes > self.maxBytes:
+            oldKey, (oldRows, oldSize) = self.entries.popitem(last=False)
+            self.bytes -= oldSize
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+            "entries": len(self.entries), "bytes": self.bytes, "evictions": self.evictions,
+            "invalidations": self.invalidations}
+
+
+cache = FindCache(config.findCacheEntries, config.findCacheBytes)
+
+def fetch(conn, sqlQuery, values):
+    "Rows of a Find query. Cached unless config.FIND_CACHE is off."
+    if not config.FIND_CACHE:
+        return conn.execute(sqlQuery, values).fetchall()
+    return cache.fetch(conn, sqlQuery, values)
+
+def stats():
+    "Hit and miss statistics of the Find cache."
+    return cache.stats()
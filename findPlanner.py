@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     findPlanner.py - Exact-match shapes of the Find literals
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Some Find literals clearly ask for one row: a whole ISBN (10 or 13 digits, with or
+# without hyphens), numeral:123, year:1999. The selectors look those up first with an
+# indexed equality, and do the usual LIKE '%literal%' search only if it finds nothing.
+# FindError lives here too, so the Find queries can be built without the screen (bookQueries).
+
+import re
+
+_INTEGER = re.compile("-?[0-9]+")
+
+
+class FindError(Exception):
+    "Wrong Find literal. The message says why."
+    pass
+
+
+
+def isbn_norm(literal):
+    "The literal as stored in book.isbn_norm, if it's a whole ISBN-10 or ISBN-13. Else None."
+    norm = literal.replace("-", "").replace(" ", "").upper()
+    if len(norm) == 13 and norm.isascii() and norm.isdigit():
+        return norm
+    if len(norm) == 10 and norm.isascii() and norm[:9].isdigit() and (norm[9].isdigit() or norm[9] == "X"):
+        return norm
+    return None
+
+def exact_shape(find_literal, fields):
+    "(field, value) if the literal asks for an exact match on one of fields, else None."
+    if ":" in find_literal:
+        field, literal = find_literal.split(":", 1)
+        field, literal = field.strip().lower(), literal.strip()
+        if field not in fields:
+            return None
+    else:   # without field, only an ISBN is unmistakable
+        field, literal = None, find_literal.strip()
+    if field in (None, "isbn") and "isbn" in fields:
+        norm = isbn_norm(literal)
+        return ("isbn", norm) if norm else None
+    if field == "numeral" and literal.isascii() and literal.isdigit():
+        return ("numeral", int(literal))
+    if field == "year" and _INTEGER.fullmatch(literal):
+        return ("year", int(literal))
+    return None
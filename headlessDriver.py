@@ -0,0 +1,337 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     headlessDriver.py - Headless form driver for keystroke latency checks
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# The application runs in a child process attached to a pseudo-terminal, over a
+# scratch copy of the Data directory, so the real database is never touched.
+# Scripted keystrokes are written to the terminal as an xterm would send them.
+# In the child, every widget _get_ch() is wrapped to time the handling of each
+# key: from the moment the key is returned to the widget, until the program
+# asks again for the next one. The parent counts the bytes painted per key.
+#
+#   python headlessDriver.py                    --> all scenarios, summary table
+#   python headlessDriver.py book_selector --max-ms 50    --> exit code 1 if p95 > 50 ms
+
+import argparse
+import curses
+import fcntl
+import json
+import os
+import pty
+import select
+import shutil
+import signal
+import struct
+import sys
+import tempfile
+import termios
+import time
+
+ROWS, COLUMNS = 25, 81      # terminal size, as recommended in README.md
+TERM = "xterm"
+KEY_TIMEOUT = 5.0       # seconds to wait for a key to be handled
+SETTLE_TIME = 0.03      # seconds of output silence after a key is handled
+
+# Key names --> terminfo capability of the key
+KEYCAPS = { "UP": "kcuu1", "DOWN": "kcud1", "LEFT": "kcub1", "RIGHT": "kcuf1",
+            "PGUP": "kpp", "PGDN": "knp", "HOME": "khome", "END": "kend",
+            "BTAB": "kcbt", "F1": "kf1", "BACKSPACE": "kbs", "DEL": "kdch1" }
+KEYCHARS = { "TAB": "\t", "ENTER": "\r", "ESC": "\x1b", "SPACE": " " }
+
+_repoPath = os.path.dirname(os.path.abspath(__file__))
+
+
+def key_sequence(name):
+    "Bytes sent by the terminal for a key name, or for a literal character."
+    if name in KEYCHARS:
+        return KEYCHARS[name].encode()
+    if name in KEYCAPS:
+        curses.setupterm(TERM, sys.__stdout__.fileno())
+        return curses.tigetstr(KEYCAPS[name])
+    return name.encode("utf-8")
+
+def press(name, times=1):
+    "Script step: a named key pressed some times."
+    return [name] * times
+
+def write(text):
+    "Script step: a literal text typed char by char."
+    return list(text)
+
+# Scenarios: list of key names/literals, to be run from the main menu.
+SCENARIOS = {
+    "book_selector":    # open selector, find all, page down, open record, type an author prefix
+        press("1") + press("f") + press("ENTER") + press("PGDN", 100) +
+        press("u") + press("ENTER") + press("TAB", 2) + press("BACKSPACE", 30) + write("Garc"),
+    "book_find":        # open selector, find a literal
+        press("1") + press("f") + write("the") + press("ENTER") + press("PGDN", 20),
+    "author_selector":
+        press("2") + press("f") + press("ENTER") + press("PGDN", 50) + press("PGUP", 50),
+}
+
+
+def install_key_timers(timingsFile):
+    "Wrap every _get_ch() so each keystroke handling time gets written to timingsFile. Child side."
+    import npyscreen
+    import bsWidgets as bs
+
+    state = {"key": None, "start": None, "widget": None, "form": None}
+
+    def record():
+        line = {"key": state["key"], "ms": round((time.perf_counter() - state["start"]) * 1000, 3),
+                "widget": state["widget"], "form": state["form"]}
+        timingsFile.write(json.dumps(line) + "\n")
+        timingsFile.flush()
+
+    def timed(getch):
+        def _get_ch(self):
+            if state["start"] is not None:
+                record()
+                state["start"] = None
+            ch = getch(self)
+            if ch == -1:    # keypress_timeout expired: not a key
+                return ch
+            state["start"] = time.perf_counter()
+            state["key"] = ch if isinstance(ch, str) else curses.keyname(ch).decode()
+            state["widget"] = type(self).__name__
+            state["form"] = type(self.parent).__name__
+            return ch
+        return _get_ch
+
+    for cls in (npyscreen.wgwidget.Widget, bs.MyTextfield, bs.MyMultiLineEdit, bs.MyAutocomplete):
+        cls._get_ch = timed(cls.__dict__["_get_ch"])
+
+
+class HeadlessDriver():
+    "Runs the application on a pseudo-terminal and feeds it scripted keystrokes."
+
+    def __init__(self, authenticate=False, dataPath=None, command=None):
+        self.authenticate = authenticate
+        self.command = command      # e.g. ["main.py"]: run the program as is, with no key timing
+        self.sourceDataPath = dataPath or os.path.join(_repoPath, "Data")
+        self.pid = None
+        self.fd = None
+        self.output = b""
+        self.results = []
+
+    def start(self):
+        "Copy the data, fork the application and wait for its first screen."
+        self.tempdir = tempfile.mkdtemp(prefix="bookstore-headless-")
+        dataPath = os.path.join(self.tempdir, "Data")
+        shutil.copytree(self.sourceDataPath, dataPath, ignore=shutil.ignore_patterns("Reports"))
+        self.timingsPath = os.path.join(self.tempdir, "timings.jsonl")
+        self.startTime = time.perf_counter()
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0:
+            if self.command:
+                self._exec_child()
+            self._run_child(dataPath + "/")
+        fcntl.ioctl(self.fd, termios.TIOCSWINSZ, struct.pack("HHHH", ROWS, COLUMNS, 0, 0))
+        self.firstPaint = self.wait_for_paint()
+        return self.firstPaint
+
+    def _run_child(self, dataPath):
+        "Child process: the application itself, with timed keyboard reads."
+        status = 0
+        try:
+            fcntl.ioctl(0, termios.TIOCSWINSZ, struct.pack("HHHH", ROWS, COLUMNS, 0, 0))
+            os.environ["TERM"] = TERM
+            os.environ["ESCDELAY"] = "25"
+            os.chdir(_repoPath)
+            sys.path.insert(0, _repoPath)
+            import config
+            config.dataPath = dataPath
+            config.AUTHENTICATE = self.authenticate
+            config.CONFIRMEXIT = False
+            install_key_timers(open(self.timingsPath, "w"))
+            import npyscreen
+            import mainMenu
+            npyscreen.disableColor()
+            mainMenu.bookstoreApp().run()
+        except SystemExit:
+            pass
+        except BaseException:
+            import traceback
+            with open(os.path.join(self.tempdir, "child_error.txt"), "w") as f:
+                traceback.print_exc(file=f)
+            status = 1
+        os._exit(status)
+
+    def _exec_child(self):
+        "Child process: a fresh interpreter running the command from the scratch directory."
+        fcntl.ioctl(0, termios.TIOCSWINSZ, struct.pack("HHHH", ROWS, COLUMNS, 0, 0))
+        os.environ["TERM"] = TERM
+        os.chdir(self.tempdir)      # config.dataPath is taken from the current directory
+        script = os.path.join(_repoPath, self.command[0])
+        try:
+            os.execv(sys.executable, [sys.executable, script] + list(self.command[1:]))
+        finally:
+            os._exit(1)
+
+    def child_rss(self):
+        "Resident memory of the application process, in KiB."
+        try:
+            with open("/proc/%d/status" % self.pid) as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return None
+
+    def _read(self, timeout):
+        "Read any available terminal output. Returns the number of bytes read, or None at EOF."
+        r, _, _ = select.select([self.fd], [], [], timeout)
+        if not r:
+            return 0
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError:
+            return None
+        if not data:
+            return None
+        self.output += data
+        return len(data)
+
+    def _records(self):
+        try:
+            with open(self.timingsPath) as f:
+                return [json.loads(line) for line in f if line.endswith("\n")]
+        except FileNotFoundError:
+            return []
+
+    def wait_for_paint(self, timeout=10.0):
+        "Wait until the screen stops changing. Returns seconds from start()."
+        end = time.perf_counter() + timeout
+        lastData = None
+        while time.perf_counter() < end:
+            n = self._read(SETTLE_TIME)
+            if n is None:
+                break
+            if n:
+                lastData = time.perf_counter()
+            elif lastData is not None:
+                break
+        return (lastData or time.perf_counter()) - self.startTime
+
+    def press(self, key):
+        "Send a key and wait for the program to handle it. Returns a result dict."
+        done = len(self._records())
+        before = len(self.output)
+        os.write(self.fd, key_sequence(key))
+        end = time.perf_counter() + KEY_TIMEOUT
+        record = None
+        while time.perf_counter() < end:
+            if self._read(0.005) is None:
+                break
+            records = self._records()
+            if len(records) > done:
+                record = records[done]
+                break
+        while self._read(SETTLE_TIME):    # let the screen settle
+            pass
+        result = {"step": key, "bytes": len(self.output) - before}
+        if record:
+            result.update(record)
+        else:
+            result["ms"] = None     # key never handled (flushed input, hung form...)
+        self.results.append(result)
+        return result
+
+    def run_script(self, keys):
+        for key in keys:
+            self.press(key)
+        return self.results
+
+    def stop(self):
+        if self.pid:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+                os.waitpid(self.pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+            self.pid = None
+        errorFile = os.path.join(self.tempdir, "child_error.txt")
+        if os.path.exists(errorFile):
+            with open(errorFile) as f:
+                self.childError = f.read()
+        else:
+            self.childError = None
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+def summarize(results):
+    "Group results by key step. Returns {step: dict of stats}."
+    summary = {}
+    for r in results:
+        s = summary.setdefault(r["step"], {"count": 0, "lost": 0, "ms": [], "bytes": 0})
+        s["count"] += 1
+        s["bytes"] += r["bytes"]
+        if r["ms"] is None:
+            s["lost"] += 1
+        else:
+            s["ms"].append(r["ms"])
+    for s in summary.values():
+        ms = s.pop("ms")
+        s["p50"] = percentile(ms, 50)
+        s["p95"] = percentile(ms, 95)
+        s["max"] = max(ms) if ms else 0.0
+        s["bytes"] = s["bytes"] // max(s["count"], 1)
+    return summary
+
+def run_scenario(name, keys=None):
+    "Run a scenario on a fresh application. Returns (first paint seconds, results)."
+    driver = HeadlessDriver()
+    try:
+        firstPaint = driver.start()
+        results = driver.run_script(keys or SCENARIOS[name])
+    finally:
+        driver.stop()
+    if driver.childError:
+        print(driver.childError, file=sys.stderr)
+    return firstPaint, results
+
+def print_summary(name, firstPaint, results):
+    print("\n%s  (first paint %.0f ms)" % (name, firstPaint * 1000))
+    print("  %-10s %6s %5s %9s %9s %9s %10s" % ("key", "count", "lost", "p50 ms", "p95 ms", "max ms", "bytes/key"))
+    for step, s in summarize(results).items():
+        print("  %-10s %6d %5d %9.2f %9.2f %9.2f %10d" % (step, s["count"], s["lost"], s["p50"], s["p95"], s["max"], s["bytes"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drive the bookstore forms headless and time each keystroke.")
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help="scenario names: " + ", ".join(SCENARIOS))
+    parser.add_argument("--max-ms", type=float, help="fail (exit code 1) if any key p95 exceeds this budget")
+    parser.add_argument("--json", metavar="FILE", help="write every keystroke result to FILE as JSON lines")
+    args = parser.parse_args()
+
+    failed = False
+    allResults = []
+    for name in args.scenarios:
+        firstPaint, results = run_scenario(name)
+        print_summary(name, firstPaint, results)
+        allResults += [dict(r, scenario=name) for r in results]
+        for step, s in summarize(results).items():
+            if s["lost"] or (args.max_ms is not None and s["p95"] > args.max_ms):
+                print("  >>> over budget or lost keys: " + step)
+                failed = True
+    if args.json:
+        with open(args.json, "w") as f:
+            for r in allResults:
+                f.write(json.dumps(r) + "\n")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,298 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     httpApi.py - Read-only JSON over HTTP for the web storefront
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# The storefront used to copy bookstore.db to read the catalogue. This small server (standard
+# library only) reads the very database the terminals are working on:
+#   GET /books, /authors, /publishers, /warehouses     ?after=<numeral>&limit=<rows>
+#   GET /books/<numeral>        with its authors and its stock by warehouse
+#   GET /authors/<numeral>, /publishers/<numeral>, /warehouses/<numeral>
+#   GET /find?q=<Find literal>&after=<numeral>&limit=<books>   as the book selector finds
+# The lists are pages in numeral order: "next" is the URL of the following page, which starts
+# after the last numeral of this one (keyset pagination: an index range, however deep the page).
+# Every request is served by one of config.apiWorkers threads, with a read-only connection
+# of the pool, inside a read transaction: the whole answer comes from the same snapshot. With
+# config.API_WAL on (off by default) the database is put in WAL mode at startup, for good, and
+# the readers never hold the terminals' writes back. Not on a network drive, where WAL is not
+# safe: there it is left in rollback journal mode, with a message.
+# The ETag is the number of the last change in the changelog (changeFeed.py), read in the same
+# snapshot; a connection only looks it up again when its PRAGMA data_version says somebody
+# wrote. A request with If-None-Match of the current ETag gets a 304 without any other read.
+#   python httpApi.py [--db file] [--host h] [--port n] [--workers n] [--verbose]
+
+import argparse
+import http.server
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import bookQueries
+import bookstore
+import changeFeed
+import config
+import database
+import dbMigrations
+import eventLog
+from findPlanner import FindError
+
+# resource --> table
+RESOURCES = {
+    "books": "book",
+    "authors": "author",
+    "publishers": "publisher",
+    "warehouses": "warehouse",
+}
+
+BOOK_AUTHORS = "SELECT 'bookstore.author'.numeral, 'bookstore.author'.name, 'bookstore.book_author'.is_main_author " \
+    "FROM 'bookstore.book_author' INNER JOIN 'bookstore.author' ON 'bookstore.author'.numeral = 'bookstore.book_author'.author_num " \
+    "WHERE 'bookstore.book_author'.book_num = ? ORDER BY 'bookstore.book_author'.is_main_author DESC, 'bookstore.author'.name"
+BOOK_STOCK = "SELECT 'bookstore.warehouse'.numeral, 'bookstore.warehouse'.code, 'bookstore.book_warehouse'.bookshelf, " \
+    "'bookstore.book_warehouse'.stock FROM 'bookstore.book_warehouse' INNER JOIN 'bookstore.warehouse' " \
+    "ON 'bookstore.warehouse'.numeral = 'bookstore.book_warehouse'.warehouse_num " \
+    "WHERE 'bookstore.book_warehouse'.book_num = ? ORDER BY 'bookstore.warehouse'.code"
+
+
+class ApiError(Exception):
+    "Answered with an HTTP error status: ApiError(status, message)."
+    pass
+
+
+class ConnectionPool():
+    "Read-only connections to the database, each one used by a single worker at a time."
+
+    def __init__(self, filename, size):
+        self.filename = filename
+        self.size = size
+        self.idle = queue.LifoQueue()   # the most recently used first: its page cache is warm
+        self.opened = 0
+        self.lock = threading.Lock()
+        self.versions = {}      # connection --> (data_version, changelog version) when last looked
+
+    @contextmanager
+    def connection(self):
+        "A connection of the pool, inside a read transaction: one snapshot for the whole request."
+        conn = None
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                if self.opened < self.size:
+                    self.opened += 1
+                    conn = database.connect("file:" + self.filename + "?mode=ro", uri=True, check_same_thread=False)
+            if conn is None:
+                conn = self.idle.get()      # all of them busy: wait for one
+        try:
+            conn.execute("BEGIN")
+            conn.execute("SELECT count(*) FROM sqlite_schema").fetchone()     # the snapshot starts with the first read
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    def version(self, conn):
+        "Changelog version seen by the snapshot of conn: looked up only if somebody wrote since last time."
+        dataVersion = conn.execute("PRAGMA data_version").fetchone()[0]
+        seen = self.versions.get(conn)
+        if seen is None or seen[0] != dataVersion:
+            seen = self.versions[conn] = (dataVersion, changeFeed.version(conn))
+        return seen[1]
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+
+def page_limit(params):
+    "Rows per page asked for, within bounds."
+    try:
+        limit = int(params.get("limit", config.apiPageSize))
+    except ValueError:
+        raise ApiError(400, "limit must be a number")
+    return max(1, min(limit, config.apiMaxPageSize))
+
+def page_after(params):
+    "Last numeral of the previous page."
+    try:
+        return int(params.get("after", 0))
+    except ValueError:
+        raise ApiError(400, "after must be a numeral")
+
+def next_url(path, params, items, limit):
+    "URL of the following page, or None if this one is the last."
+    if len(items) < limit:
+        return None
+    return path + "?" + urllib.parse.urlencode(dict(params, after=items[-1]["numeral"], limit=limit))
+
+def list_page(conn, resource, params):
+    "A page of a table, in numeral order."
+    table = RESOURCES[resource]
+    columns = [name for name, notnull in bookstore.table_columns(conn, table)]
+    limit = page_limit(params)
+    rows = conn.execute("SELECT " + ", ".join(columns) + " FROM 'bookstore." + table + "' WHERE numeral > ? " \
+        "ORDER BY numeral LIMIT ?", (page_after(params), limit)).fetchall()
+    items = [dict(zip(columns, row)) for row in rows]
+    return {"items": items, "next": next_url("/" + resource, params, items, limit)}
+
+def record(conn, resource, numeral):
+    "One record by its numeral; a book with its authors and stock."
+    table = RESOURCES[resource]
+    columns = [name for name, notnull in bookstore.table_columns(conn, table)]
+    row = conn.execute("SELECT " + ", ".join(columns) + " FROM 'bookstore." + table + "' WHERE numeral = ?", (numeral,)).fetchone()
+    if row is None:
+        raise ApiError(404, resource[:-1] + " " + str(numeral) + " not found")
+    item = dict(zip(columns, row))
+    if table == "book":
+        item["genre"] = bookQueries.genre_name(item["genre_id"])
+        item["authors"] = [{"numeral": n, "name": name, "main": bool(main)} for n, name, main in conn.execute(BOOK_AUTHORS, (numeral,))]
+        item["stock"] = [{"warehouse_numeral": n, "warehouse": code, "bookshelf": shelf, "stock": stock} \
+            for n, code, shelf, stock in conn.execute(BOOK_STOCK, (numeral,))]
+    return item
+
+def find(conn, params):
+    "A page of the books of a Find literal: the exact match if there's one, else the substring search."
+    literal = params.get("q", "").strip()
+    if not literal:
+        raise ApiError(400, "q: a Find literal is needed")
+    limit = page_limit(params)
+    try:
+        sqlQuery, values, likeColumns = bookQueries.find_query(literal)
+    except FindError as e:
+        raise ApiError(400, str(e).strip())
+    query = bookQueries.exact_query(literal)
+    if query is None or conn.execute("SELECT 1 FROM (" + query[0] + ") LIMIT 1", query[1]).fetchone() is None:
+        query = (sqlQuery, values)      # no exact match: the substring search
+    # a book with several authors comes in several rows: the page is of limit books, whole
+    rows = conn.execute("WITH found AS (" + query[0] + ") SELECT * FROM found WHERE numeral IN " \
+        "(SELECT DISTINCT numeral FROM found WHERE numeral > ? ORDER BY numeral LIMIT ?) ORDER BY numeral", \
+        tuple(query[1]) + (page_after(params), limit)).fetchall()
+    items = [dict(zip(bookQueries.FIND_COLUMNS, row)) for row in rows]
+    books = len({item["numeral"] for item in items})
+    return {"items": items, "next": next_url("/find", params, items, limit) if books == limit else None}
+
+
+class ApiHandler(http.server.BaseHTTPRequestHandler):
+    "GET requests of the read API."
+    server_version = "bookstore-api"
+    timeout = 10    # seconds a client may take to send its request, holding a worker
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        params = dict(urllib.parse.parse_qsl(url.query))
+        parts = [part for part in url.path.split("/") if part]
+        try:
+            with eventLog.span("api", path=url.path), self.server.pool.connection() as conn:
+                etag = '"%d"' % self.server.pool.version(conn)
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_json(304, None, etag)
+                    return
+                if len(parts) == 1 and parts[0] in RESOURCES:
+                    body = list_page(conn, parts[0], params)
+                elif len(parts) == 2 and parts[0] in RESOURCES and parts[1].isdigit():
+                    body = record(conn, parts[0], int(parts[1]))
+                elif parts == ["find"]:
+                    body = find(conn, params)
+                else:
+                    raise ApiError(404, "unknown resource: " + url.path)
+            self.send_json(200, body, etag)
+        except ApiError as e:
+            status, message = e.args
+            self.send_json(status, {"error": message})
+        except sqlite3.Error as e:
+            self.send_json(503, {"error": type(e).__name__ + ": " + str(e)})
+
+    def send_json(self, status, body, etag=None):
+        data = b"" if body is None else json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        if etag is not None:
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")   # may be kept, but asked again with If-None-Match
+        if body is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ApiServer(http.server.HTTPServer):
+    "HTTP server whose requests are served by a fixed set of worker threads, and the connection pool."
+    request_queue_size = 128    # connections waiting to be accepted
+
+    def __init__(self, address, filename, workers, verbose=False):
+        super().__init__(address, ApiHandler)
+        self.pool = ConnectionPool(filename, workers)
+        self.workers = ThreadPoolExecutor(workers, thread_name_prefix="api")
+        self.verbose = verbose
+
+    def process_request(self, request, client_address):
+        self.workers.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.workers.shutdown(wait=True)
+        self.pool.close()
+
+def prepare(filename):
+    "Migrations pending, as the program does at startup, and WAL mode if config.API_WAL."
+    conn = database.connect(filename)
+    try:
+        dbMigrations.migrate(conn)
+        if config.API_WAL and conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            if database.on_network_drive(filename):
+                print("API_WAL: " + filename + " is on a network drive, where WAL mode is not safe; " \
+                    "left in rollback journal mode", file=sys.stderr)
+            else:
+                conn.execute("PRAGMA journal_mode = WAL")
+                print("API_WAL: " + filename + " switched to WAL mode, for good " \
+                    "(back with  PRAGMA journal_mode = DELETE)", file=sys.stderr)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read-only JSON over HTTP of the bookstore database.")
+    parser.add_argument("--db", default=config.dataPath + config.dbname, help="database file")
+    parser.add_argument("--host", default=config.apiHost)
+    parser.add_argument("--port", type=int, default=config.apiPort)
+    parser.add_argument("--workers", type=int, default=config.apiWorkers)
+    parser.add_argument("--verbose", action="store_true", help="log every request to the standard error")
+    args = parser.parse_args()
+    eventLog.setup()
+    try:
+        prepare(args.db)
+    except sqlite3.Error as e:
+        print("Database " + args.db + ": " + str(e), file=sys.stderr)
+        sys.exit(1)
+    server = ApiServer((args.host, args.port), args.db, args.workers, args.verbose)
+    print("Serving " + args.db + " on http://%s:%d/" % server.server_address[:2], flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,188 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     liveFind.py - Search-as-you-type for the selectors Find field
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# While a Find literal is being typed, every pause in the typing (config.liveFindDelay)
+# starts a search in a background thread, with its own database connection. The grid
+# shows the first rows found as soon as they arrive, and the whole set when it's complete.
+# Keystrokes never wait for the database: a newer literal interrupts the running query.
+# When the new literal contains the previous one and the query is otherwise the same, the
+# previous complete result is refined in memory, without going to the database, folding the
+# text as the Find queries do (textSearch.normalize).
+# Enter still runs the normal Find, unless the grid already shows its complete result.
+
+import queue
+import sqlite3
+import threading
+import time
+
+import bsWidgets as bs
+import config
+import database
+import textSearch
+
+TICK = 1    # keypress_timeout of the selector while its Find literal is live, in tenths of a second
+
+
+def like_fold(value):
+    "Folding as the Find queries do it: no accents, no case."
+    return textSearch.normalize(str(value))
+
+def contained_literal(values):
+    "The literal of a '%literal%' search in all the parameters, or None if it's another kind of query."
+    if not values or len(set(values)) != 1 or not isinstance(values[0], str):
+        return None
+    literal = values[0]
+    if len(literal) < 2 or literal[0] != "%" or literal[-1] != "%":
+        return None
+    literal = literal[1:-1]
+    if "%" in literal or "_" in literal:    # more wildcards: leave it to SQLite
+        return None
+    return literal
+
+def refine(filerows, likeColumns, literal):
+    "Rows of a previous result that also match a longer literal."
+    folded = like_fold(literal)
+    return [row for row in filerows if any(row[c] is not None and folded in like_fold(row[c]) for c in likeColumns)]
+
+
+class LiveFind():
+    "Background searches for a selector form, fed by the keystrokes in its Find field."
+
+    def __init__(self, selector):
+        self.selector = selector    # form with find_query() and show_found_rows()
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.generation = 0     # of the latest literal typed: results for older ones are discarded
+        self.literal = None     # latest literal typed
+        self.due = None         # time to search for it
+        self.shown = None       # (literal, complete, number of rows) in the grid
+        self.active = False
+        self.savedTimeout = None
+        self.thread = None
+        self.conn = None        # owned by the background thread
+
+    def start(self):
+        "The Find literal is being typed."
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._worker, name="liveFind", daemon=True)
+            self.thread.start()
+        self.generation += 1
+        self.requests.put((self.generation, None))  # forget the last result: the table may have changed since
+        self.literal = self.due = self.shown = None
+        self.savedTimeout = self.selector.keypress_timeout
+        self.selector.keypress_timeout = TICK   # so tick() gets called while no key is pressed
+        self.active = True
+
+    def stop(self):
+        "The Find field is left. Results still to come are discarded."
+        if not self.active:
+            return
+        self.active = False
+        self.generation += 1
+        self.due = None
+        self._interrupt()
+        self.selector.keypress_timeout = self.savedTimeout
+
+    def key(self, literal):
+        "The Find literal has changed."
+        if literal == self.literal:
+            return
+        self.generation += 1
+        self.literal = literal
+        self.shown = None
+        self.due = time.monotonic() + config.liveFindDelay
+        self._interrupt()   # whatever is running is stale already
+
+    def tick(self):
+        "Called while no key is pressed: start the due search and show the rows arrived."
+        if self.due is not None and time.monotonic() >= self.due:
+            self.due = None
+            self._submit()
+        self._show_results()
+
+    def finish(self, literal):
+        "Enter pressed. Returns the rows shown if they are the complete result for literal, else None."
+        shown = self.shown if self.due is None else None
+        self.stop()
+        if self.selector.exact_query(literal) is not None:
+            return None     # Find looks it up as an exact value first
+        if shown is not None and shown[:2] == (literal, True):
+            return shown[2]
+        return None
+
+    def _interrupt(self):
+        if self.conn is not None:
+            self.conn.interrupt()
+
+    def _submit(self):
+        if self.literal.strip() == "":
+            return      # the full set comes with Enter
+        try:
+            query = self.selector.find_query(self.literal)
+        except (bs.FindError, IndexError, ValueError):
+            return      # not a valid literal (yet): nothing to search
+        database.reader()   # the memory mirror, if any, up to date before the thread reads it
+        self.requests.put((self.generation, query))
+
+    def _show_results(self):
+        result = None
+        while True:
+            try:
+                r = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if r[0] == self.generation:
+                result = r
+        if result is None:
+            return
+        generation, filerows, complete = result
+        if filerows is None:    # SQL error: Enter will tell
+            return
+        selector = self.selector
+        if filerows:
+            selector.show_found_rows(filerows)
+            selector.grid.set_highlight_row(None)   # select the first one
+        else:
+            selector.grid.empty_the_grid()
+        self.shown = (self.literal, complete, len(filerows))
+        selector.formTitle.display()
+        selector.grid.display()
+
+    def _worker(self):
+        "Background thread: runs the queries, or refines the last complete result."
+        self.conn = database.thread_reader()
+        last = None     # last complete result: (sqlQuery, likeColumns, literal, filerows)
+        while True:
+            generation, query = self.requests.get()
+            if query is None:
+                last = None
+                continue
+            if generation != self.generation:
+                continue    # superseded while waiting
+            sqlQuery, values, likeColumns = query
+            literal = contained_literal(values) if likeColumns else None
+            if last is not None and literal is not None and last[:2] == (sqlQuery, likeColumns) \
+                    and like_fold(last[2]) in like_fold(literal):
+                filerows = refine(last[3], likeColumns, literal)
+            else:
+                try:
+                    cur = self.conn.execute(sqlQuery, values)
+                    filerows = cur.fetchmany(config.liveFindRows)   # the first rows go to the grid at once
+                    if len(filerows) == config.liveFindRows and generation == self.generation:
+                        self.results.put((generation, filerows, False))
+                        filerows = filerows + cur.fetchall()
+                except sqlite3.Error:   # interrupted by a newer literal, or a wrong one
+                    if generation == self.generation:
+                        self.results.put((generation, None, True))
+                    continue
+            last = (sqlQuery, likeColumns, literal, filerows) if literal is not None else None
+            self.results.put((generation, filerows, True))
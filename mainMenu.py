@@ -11,6 +11,7 @@
 ##############################################################################
 
 import datetime
+import importlib
 import os.path
 import sqlite3
 import sys
@@ -21,24 +22,14 @@ import linecache
 import npyscreen
 from npyscreen import util_viewhelp
 
-import author
-import authorSelector
-import book
-import bookListing
-import bookSelector
 import bsWidgets as bs
 
 import config
+import database
+import dbMigrations
+import dbSchema
+import eventLog
 import identification
-import publisher
-import publisherSelector
-import user
-import userSelector
-import utilities
-import warehouse
-import warehouseSelector
-import dbIntegrityCheck
-import deleteMultipleRecords
 from config import SCREENWIDTH as WIDTH
 
 AUTHENTICATE = config.AUTHENTICATE
@@ -51,77 +42,94 @@ helpText =  "\nA simple menu form.\n\n\n" +\
     "* Menu '6.Utilities' leads to another submenu.\n\n" +\
     "* The main purpose of this program is to share my experience with the npyscreen terminal user interface and of course to learn some Python." 
 
+# Forms are built the first time they are needed:  form id --> (module, form class, form name)
+FORMS = {
+    "IDENTIFICATION":           ("identification", "ID_Form", "Identification"),
+    "BOOKSELECTOR":             ("bookSelector", "BookSelectForm", "BookSelector"),
+    "BOOK":                     ("book", "BookForm", "BookForm"),
+    "AUTHORSELECTOR":           ("authorSelector", "AuthorSelectForm", "AuthorSelector"),
+    "AUTHOR":                   ("author", "AuthorForm", "AuthorForm"),
+    "PUBLISHERSELECTOR":        ("publisherSelector", "PublisherSelectForm", "PublisherSelector"),
+    "PUBLISHER":                ("publisher", "PublisherForm", "PublisherForm"),
+    "WAREHOUSESELECTOR":        ("warehouseSelector", "WarehouseSelectForm", "WarehouseSelector"),
+    "WAREHOUSE":                ("warehouse", "WarehouseForm", "WarehouseForm"),
+    "BOOKLISTING":              ("bookListing", "BookListingForm", "BookListingForm"),
+    "UTILITIES":                ("utilities", "UtilitiesMenuForm", "UtilitiesForm"),
+    "USERSELECTOR":             ("userSelector", "UserSelectForm", "UserSelector"),
+    "USER":                     ("user", "UserForm", "UserForm"),
+    "DB_INTEGRITY_CHECK":       ("dbIntegrityCheck", "DBintegrityCheckForm", "DBintegrityCheckForm"),
+    "DELETE_MULTIPLE_RECORDS":  ("deleteMultipleRecords", "DeleteMultipleRecordsForm", "DeleteMultipleRecordsForm"),
+    "DUPLICATE_AUTHORS":        ("duplicateAuthors", "DuplicateAuthorsForm", "DuplicateAuthorsForm"),
+    "DB_MAINTENANCE":           ("dbMaintenance", "MaintenanceForm", "MaintenanceForm"),
+}
+
+
+class LazyForms(dict):
+    "The application form register: a missing form gets built when it's first asked for."
+
+    def __init__(self, build_form):
+        super().__init__()
+        self.build_form = build_form
+
+    def __missing__(self, f_id):
+        if f_id not in FORMS:
+            raise KeyError(f_id)
+        return self.build_form(f_id)
+
 
 class bookstoreApp(npyscreen.NPSAppManaged):
     def onStart(self):
         "Override this method to perform any initialization."
         
+        config.parentApp = self
+        eventLog.setup()
         self.connect_database()
 
-        # check tables' existence:
-        cur = config.conn.cursor()
-        DBprefix = "bookstore."
-        table_list = [  "author",
-                        "book",
-                        "book_author",
-                        "publisher",
-                        "user",
-                        "warehouse",
-                        "book_warehouse"
-                        ]
-
+        # bring the database schema up to date, and check it: tables, columns and indexes
         while True: # locking the SQLite single user DB
-            for tname in table_list:
-                tname = DBprefix + tname
-                sqlQuery = "SELECT EXISTS ( SELECT name FROM sqlite_schema WHERE type='table' AND name=? )"
-                try:
-                    cur.execute(sqlQuery, (tname,) )
-                    if cur.fetchone()[0] != 1 : 
-                        bs.notify_OK("\n Database: Table does not exist: '" + tname + "'","Error")
-                        sys.exit()                
-                except sqlite3.OperationalError:    # default timeout is 5 sec
-                    bs.notify_OK("\n    Database is locked, please wait.", "Bookstore")
-                    continue    # to the loop
-            break   # go on
+            try:
+                dbMigrations.migrate(config.conn)
+                differences = dbSchema.check_schema(config.conn)
+                break   # go on
+            except sqlite3.OperationalError:    # default timeout is 5 sec
+                bs.notify_OK("\n    Database is locked, please wait.", "Bookstore")
+        if differences:
+            message = "\n Database schema is not the expected one:\n\n " + "\n ".join(differences[:10])
+            if len(differences) > 10:
+                message += "\n ...and " + str(len(differences) - 10) + " more. Run dbSchema.py for details."
+            bs.notify_OK(message, "Error", wide=True)
+            sys.exit()
 
         npyscreen.setTheme(npyscreen.Themes.DefaultTheme)
 
-        # Forms __inits__() are executed now:
+        # Only the main menu is built now; the rest, when first switched to (see FORMS).
+        self._Forms = LazyForms(self.build_form)
         self.registerForm("MAIN", MainMenuForm(name="MainMenu", parentApp=self, help=helpText, \
             lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH, maximum_columns=WIDTH))
-        self.registerForm("IDENTIFICATION", identification.ID_Form(name="Identification", parentApp=self, \
-            help=identification.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("BOOKSELECTOR", bookSelector.BookSelectForm(name="BookSelector", parentApp=self, \
-            help=bookSelector.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("BOOK", book.BookForm(name="BookForm", parentApp=self, \
-            help=book.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("AUTHORSELECTOR", authorSelector.AuthorSelectForm(name="AuthorSelector", parentApp=self, \
-            help=authorSelector.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("AUTHOR", author.AuthorForm(name="AuthorForm", parentApp=self, \
-            help=author.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("PUBLISHERSELECTOR", publisherSelector.PublisherSelectForm(name="PublisherSelector", parentApp=self, \
-            help=publisherSelector.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("PUBLISHER", publisher.PublisherForm(name="PublisherForm", parentApp=self, \
-            help=publisher.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("WAREHOUSESELECTOR", warehouseSelector.WarehouseSelectForm(name="WarehouseSelector", parentApp=self, \
-            help=warehouseSelector.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("WAREHOUSE", warehouse.WarehouseForm(name="WarehouseForm", parentApp=self, \
-            help=warehouse.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("BOOKLISTING", bookListing.BookListingForm(name="BookListingForm", parentApp=self, \
-            help=bookListing.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("UTILITIES", utilities.UtilitiesMenuForm(name="UtilitiesForm", parentApp=self, \
-            help=utilities.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("USERSELECTOR", userSelector.UserSelectForm(name="UserSelector", parentApp=self, \
-            help=userSelector.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("USER", user.UserForm(name="UserForm", parentApp=self, \
-            help=user.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("DB_INTEGRITY_CHECK", dbIntegrityCheck.DBintegrityCheckForm(name="DBintegrityCheckForm", parentApp=self, \
-            help=dbIntegrityCheck.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
-        self.registerForm("DELETE_MULTIPLE_RECORDS", deleteMultipleRecords.DeleteMultipleRecordsForm(name="DeleteMultipleRecordsForm", parentApp=self, \
-            help=deleteMultipleRecords.helpText, lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH))
+
+    def build_form(self, f_id):
+        "Import the form module, create the form and register it."
+        moduleName, className, formName = FORMS[f_id]
+        module = importlib.import_module(moduleName)
+        form = getattr(module, className)(name=formName, parentApp=self, help=module.helpText, \
+            lines=0, columns=0, minimum_lines=25, minimum_columns=WIDTH)
+        self.registerForm(f_id, form)
+        return form
+
+    def registerForm(self, f_id, fm):
+        super().registerForm(f_id, fm)
+        eventLog.watch_form(f_id, fm)  # times the switch to this form
+
+    def setNextForm(self, fmid):
+        eventLog.begin_transition(getattr(self, "ACTIVE_FORM_NAME", None), fmid)
+        if fmid in FORMS:
+            self._Forms[fmid]   # built now: the set_xxxMode() functions use it right after switching
+        super().setNextForm(fmid)
 
     def onInMainLoop(self):
         """Called between each screen while the application is running. Not called before the first screen. Override at will"""
+        # the next form repaints the whole screen: a message still pending is drawn again over it
+        bs.feedback.carry_over(self._Forms[self.NEXT_ACTIVE_FORM] if self.NEXT_ACTIVE_FORM else None)
         if self.NEXT_ACTIVE_FORM == 'IDENTIFICATION':
             form = self._Forms["IDENTIFICATION"]
             form.editw = 1  # focus to widget 1 (grid) so InputOpt field lose it.
@@ -156,11 +164,18 @@ class bookstoreApp(npyscreen.NPSAppManaged):
         # DB Connection creation
         conn = None
         try:
-            conn = sqlite3.connect(self.DBfilename)
+            conn = database.shared(self.DBfilename)
         except sqlite3.Error as e:
+            if config.DB_DAEMON:    # not running, or serving another file
+                bs.notify_OK("\n  " + str(e), "Error", wide=True)
+                sys.exit()
             print(e)
         config.conn = conn      # connection for this instance of bookstore
 
+    def while_waiting(self):
+        "Called by the form widgets while no key is pressed, if the form has a keypress_timeout."
+        bs.feedback.tick()
+
     def onCleanExit(self):
         """Override this method to perform any cleanup when application is exiting without error."""
         
@@ -208,6 +223,7 @@ class MainMenuForm(npyscreen.FormBaseNew):
     def pre_edit_loop(self):
         if AUTHENTICATE and not self.password_entered:
             self.password_entered = True
+            self.parentApp._Forms["IDENTIFICATION"]    # built now, set_ID() uses it
             identification.ID_Form.set_ID()
 
     def post_edit_loop(self):
@@ -245,37 +261,37 @@ class MainMenuForm(npyscreen.FormBaseNew):
             case 49:    # menu 1
                 self.selector.cursor_line=0
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.menuBookSelector()
             case 50:    # menu 2
                 self.selector.cursor_line=1
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.menuAuthorSelector()
             case 51:    # menu 3
                 self.selector.cursor_line=2
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.menuPublisherSelector()
             case 52:    # menu 4
                 self.selector.cursor_line=3
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.menuWarehouseSelector()
             case 53:    # menu 5
                 self.selector.cursor_line=4
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.menuBookListing()
             case 54:    # menu 6
                 self.selector.cursor_line=5
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.menuUtilities()
             case ( 81 | 113 ):    # menu Q/q
                 self.selector.cursor_line=9
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.exitApplication()
 
     def menuBookSelector(self):
@@ -0,0 +1,80 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     numeralSequence.py - Unique numerals for new records, without locking
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# The numeral of a new record used to be the table's highest one plus one, so the Create
+# form had to lock the whole database while it was open, or two terminals would propose the
+# same one. Now the next numeral of each table is kept in the sequence table and reserved
+# with a single UPDATE ... RETURNING: a write transaction of a few microseconds, and no two
+# processes ever get the same numeral. It's never below the table's highest numeral plus one,
+# so numerals typed by hand are skipped.
+# Each session may reserve a block of numerals at once (config.numeralBlock) and hand them
+# out from memory. A numeral proposed but not used (Create cancelled) goes back to the block.
+
+import config
+
+SEQUENCE_TABLE = "'bookstore.sequence'"
+
+# tables whose numerals come from the sequence
+TABLES = ["bookstore.author", "bookstore.book", "bookstore.publisher", "bookstore.user", "bookstore.warehouse"]
+
+RESERVE_QUERY = "UPDATE " + SEQUENCE_TABLE + " SET next_numeral = " \
+    "max(next_numeral, (SELECT ifnull(max(numeral), 0) + 1 FROM '{0}')) + ? WHERE name = ? RETURNING next_numeral - ?"
+
+_blocks = {}    # table --> [next numeral, end of the block], reserved by this session
+
+
+def table_key(table):
+    "Sequence name of a table, as written anywhere in the program: \"'bookstore.Author'\" --> 'bookstore.author'."
+    return table.strip("'").lower()
+
+def migration_statements():
+    "The sequence table, starting after the highest numeral of every table."
+    statements = ["CREATE TABLE " + SEQUENCE_TABLE + " (name TEXT NOT NULL PRIMARY KEY, next_numeral INTEGER NOT NULL)"]
+    for table in TABLES:
+        statements.append("INSERT INTO " + SEQUENCE_TABLE + " (name, next_numeral) " \
+            "SELECT '" + table + "', ifnull(max(numeral), 0) + 1 FROM '" + table + "'")
+    return statements
+
+def reserve(conn, table, count=1):
+    "Reserve count consecutive numerals of a table for good. Returns the first one."
+    key = table_key(table)
+    own = not conn.in_transaction   # else it goes in the caller's transaction, and the caller commits
+    if own:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = conn.execute(RESERVE_QUERY.format(key), (count, key, count)).fetchall()
+        if own:
+            conn.commit()
+    except Exception:
+        if own:
+            conn.rollback()
+        raise
+    return rows[0][0]
+
+def next_numeral(conn, table):
+    "A free numeral for a new record of the table, from the block reserved by this session."
+    key = table_key(table)
+    while True:
+        block = _blocks.get(key)
+        if block is None or block[0] >= block[1]:
+            first = reserve(conn, key, config.numeralBlock)
+            block = _blocks[key] = [first, first + config.numeralBlock]
+        numeral = block[0]
+        block[0] += 1
+        if conn.execute("SELECT 1 FROM '" + key + "' WHERE numeral = ?", (numeral,)).fetchone() is None:
+            return numeral      # else somebody typed it by hand: skip it
+
+def release(table, numeral):
+    "Give back a numeral proposed but maybe not used. If it was used after all, next_numeral() skips it."
+    block = _blocks.get(table_key(table))
+    if block is not None and block[0] == numeral + 1:
+        block[0] = numeral
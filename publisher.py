@@ -12,12 +12,14 @@
 
 import curses
 import sqlite3
-import time
 
 import npyscreen
 
 import bsWidgets as bs
 import config
+import eventLog
+import numeralSequence
+import textSearch
 
 DATEFORMAT = config.dateFormat
 DBTABLENAME = "'bookstore.Publisher'"
@@ -94,47 +96,35 @@ class PublisherForm(npyscreen.FormBaseNew):
 
     def exitPublisher(self, modified):
         "Exit record form."
+        if self.current_option == "Create":
+            numeralSequence.release(DBTABLENAME, self.newNumeral)   # back to the block if it wasn't used
         if modified:    # modify grid if needed
             self.update_fileRow()
             self.selectorForm.update_grid()
             self.backup_fields()
         self.selectorForm.grid.update()
 
-        # To unlock the database (for Create) we must disconnect and re-connect:
+        # To end the transaction left open by Update or Delete, we disconnect and re-connect:
         config.conn.close()
         self.parentApp.connect_database()
 
         config.parentApp.setNextForm("PUBLISHERSELECTOR")
         config.parentApp.switchFormNow()
 
-    def get_last_numeral(self):
-        "Get the last numeral from the database."
-        cur = config.conn.cursor()
-        sqlQuery = "SELECT Numeral FROM " + DBTABLENAME + " ORDER BY Numeral DESC LIMIT 1"
-        cur.execute(sqlQuery)
-        try:
-            numeral = cur.fetchone()[0]
-        except TypeError:   # there are no rows
-            numeral = 0
-        config.conn.commit()
-        return numeral
-
     def set_createMode():
         "Setting the publisher form to create a new record."
         global form
         conn = config.conn
-        while True:     # for Creation, we must set the locking here
+        while True:     # a numeral nobody else gets: no need to lock the database while the form is open
             try:
-                conn.isolation_level = 'EXCLUSIVE'  # Database locking: SQLite only allows a single writer per database
-                conn.execute('PRAGMA locking_mode = EXCLUSIVE')
-                conn.execute('BEGIN EXCLUSIVE TRANSACTION')     # exclusive access starts here. Nothing else can r/w the DB.
+                form.newNumeral = numeralSequence.next_numeral(conn, DBTABLENAME)
                 break
             except sqlite3.OperationalError:
                 bs.notify_OK("\n    Database is locked, please wait.", "Message")
         form.current_option = "Create"
         form.numeralFld.editable = True
         form.numeralFld.maximum_string_length = 3
-        form.numeralFld.value = str(form.get_last_numeral() + 1)
+        form.numeralFld.value = str(form.newNumeral)
         form.nameFld.editable = True
         form.nameFld.value = ""
         form.addressFld.editable = True
@@ -271,6 +261,7 @@ class PublisherForm(npyscreen.FormBaseNew):
         self.selectorForm.grid.set_highlight_row(int(self.numeralFld.value))
         self.exitPublisher(modified=False)
 
+    @eventLog.timed("delete")
     def delete_publisher(self):
         "Button based Delete function for D=Delete."
         conn = config.conn
@@ -330,7 +321,7 @@ class PublisherForm(npyscreen.FormBaseNew):
     def deleteCancelbtn_function(self):
         "Cancel button function under Delete mode."
         bs.notify("\n   Record was NOT deleted", title="Message", form_color='STANDOUT', wrap=True, wide=False)
-        time.sleep(0.4)     # let it be seen
+        bs.pause(0.4)     # let it be seen
         self.exitPublisher(modified=False)
 
     def while_editing(self, *args, **keywords):
@@ -403,15 +394,16 @@ class PublisherForm(npyscreen.FormBaseNew):
         self.statusLine.display()
         curses.beep()
 
+    @eventLog.timed("saveCreated")
     def save_created_publisher(self):
         "Button based Save function for C=Create."
         conn = config.conn
         cur = conn.cursor()
-        sqlQuery = "INSERT INTO " + DBTABLENAME + " (numeral,name,address,phone,url) VALUES (?,?,?,?,?)"
-        values = (self.numeralFld.value, self.nameFld.value, self.addressFld.value, self.phoneFld.value, self.urlFld.value)
+        sqlQuery = "INSERT INTO " + DBTABLENAME + " (numeral,name,name_norm,address,phone,url) VALUES (?,?,?,?,?,?)"
+        values = (self.numeralFld.value, self.nameFld.value, textSearch.normalize(self.nameFld.value), self.addressFld.value, \
+            self.phoneFld.value, self.urlFld.value)
         cur.execute(sqlQuery, values)
         conn.commit()
-        conn.isolation_level = None     # free the multiuser lock
         config.fileRow[0] = cur.lastrowid
         bs.notify("\n       Record created", title="Message", form_color='STANDOUT', wrap=True, wide=False)
         # update config.fileRows:
@@ -425,6 +417,7 @@ class PublisherForm(npyscreen.FormBaseNew):
         config.fileRows.append(new_record)
         self.exitPublisher(modified=True)
 
+    @eventLog.timed("saveUpdated")
     def save_updated_publisher(self):
         "Button based Save function for U=Update."
 
@@ -438,8 +431,9 @@ class PublisherForm(npyscreen.FormBaseNew):
             config.conn.commit()
 
         # Update publisher record
-        sqlQuery = "UPDATE " + DBTABLENAME + " SET numeral=?, name=?, address=?, phone=?, url=? WHERE id=?"
-        values = (self.numeralFld.value, self.nameFld.value, self.addressFld.value, self.phoneFld.value, self.urlFld.value, config.fileRow[0])
+        sqlQuery = "UPDATE " + DBTABLENAME + " SET numeral=?, name=?, name_norm=?, address=?, phone=?, url=? WHERE id=?"
+        values = (self.numeralFld.value, self.nameFld.value, textSearch.normalize(self.nameFld.value), self.addressFld.value, \
+            self.phoneFld.value, self.urlFld.value, config.fileRow[0])
         try:
             cur.execute(sqlQuery, values)
             config.conn.commit()
@@ -0,0 +1,42 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     stampVersion.py - Writes the program version into Data/program.json
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# Run it once at release/install time, from the program directory:
+#   python stampVersion.py          --> version from "git describe", e.g. "v1.0"
+#   python stampVersion.py v1.1     --> explicit version
+# The program itself only reads the file, lazily (config.program_version).
+
+import json
+import subprocess
+import sys
+
+import config
+
+
+def git_version():
+    "Last git tag, or '' if this is not a git repository."
+    try:
+        return subprocess.run(["git", "describe", "--tags", "--abbrev=0"], \
+            capture_output=True, text=True).stdout.strip('\n')[:4]
+    except FileNotFoundError:
+        return ""
+
+if __name__ == "__main__":
+    version = sys.argv[1] if len(sys.argv) > 1 else git_version()
+    if version == "":
+        print("\n " + config.pname + ": no version given and no git tag found.\n")
+        sys.exit(1)
+    filename = config.dataPath + "program.json"
+    data = {'program': [ {'version' : version} ] }
+    with open(filename, 'w') as outfile:
+        outfile.write(json.dumps(data))
+    print(filename + ": " + version)
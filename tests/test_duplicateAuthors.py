@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     test_duplicateAuthors.py - Duplicate author clusters
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+#   python -m pytest tests
+
+import sqlite3
+
+import duplicateAuthors
+import textSearch
+
+
+def author_table(names):
+    "In-memory author table with the given names, as find_clusters() reads it."
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE 'bookstore.author' (numeral INTEGER, name TEXT, name_norm TEXT)")
+    conn.execute("CREATE TABLE 'bookstore.book_author' (author_num INTEGER)")
+    conn.executemany("INSERT INTO 'bookstore.author' VALUES (?,?,?)", \
+        ((n, name, textSearch.normalize(name)) for n, name in enumerate(names, start=1)))
+    return conn
+
+def clusters(names):
+    return [{author[1] for author in cluster} for cluster in duplicateAuthors.find_clusters(author_table(names))]
+
+
+def test_same_surname_and_initial_are_not_the_same_author():
+    found = clusters(["Smith, John", "Smith, Jane", "García Márquez, Gabriel", "Garcia Marquez, G."])
+    assert found == [{"García Márquez, Gabriel", "Garcia Marquez, G."}]
+
+def test_an_initial_never_joins_two_different_names():
+    found = clusters(["Smith, John", "Smith, J.", "Smith, Jane"])
+    assert len(found) == 1
+    assert "Smith, J." in found[0]
+    assert {"Smith, John", "Smith, Jane"} - found[0]
+
+def test_same_words_in_another_order():
+    assert clusters(["Gabriel García Márquez", "GARCIA MARQUEZ, Gabriel"]) == \
+        [{"Gabriel García Márquez", "GARCIA MARQUEZ, Gabriel"}]
+
+def test_given_names():
+    assert duplicateAuthors.same_author("smith, j", "smith, john")
+    assert duplicateAuthors.same_author("smith, john paul", "smith, john")
+    assert not duplicateAuthors.same_author("smith, john", "smith, jane")
+    assert not duplicateAuthors.same_author("smith, j", "smith, p")
@@ -0,0 +1,43 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     test_headlessDriver.py - Keystroke latency budget of the forms
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# headlessDriver.py runs on a scratch copy of the Data directory, in a child process
+# attached to a pseudo-terminal, so these tests are skipped where pty is not available.
+#   python -m pytest tests
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pty")
+
+SCENARIO = "book_find"
+MAX_MS = 500        # generous: the budget of a slow test machine, not of a clerk's terminal
+
+_repoPath = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_driver(maxMs):
+    "Run the scenario with a p95 budget. Returns the finished process."
+    return subprocess.run([sys.executable, "headlessDriver.py", SCENARIO, "--max-ms", str(maxMs)],
+        cwd=_repoPath, capture_output=True, text=True, timeout=120)
+
+def test_within_budget():
+    process = run_driver(MAX_MS)
+    assert process.returncode == 0, process.stdout + process.stderr
+
+def test_over_budget_fails():
+    process = run_driver(0)
+    assert process.returncode == 1, process.stdout + process.stderr
+    assert "over budget" in process.stdout
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     textSearch.py - Accent- and case-insensitive text matching
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# COLLATE NOCASE only folds ASCII, so "garcia" doesn't find "García". Book title, author
+# name, publisher name and warehouse code have a normalised shadow column (*_norm): no
+# accents, case-folded. The program fills them in when it saves (normalize(), with_shadows());
+# there are no triggers for it, so other tools (the sqlite3 shell) can still write those tables
+# without the program's SQL function NORM_FUNCTION. What they change is found again after the
+# "search" step of dbMaintenance (refill()). The columns are indexed with COLLATE NOCASE, so
+# LIKE 'prefix%' on them is an index range, not a full scan.
+# The ICU collator of the listings' ordering is here too (get_collator).
+
+import locale
+import re
+import unicodedata
+
+NORM_FUNCTION = "bs_norm"
+
+# table --> [(column, shadow column)]
+NORM_COLUMNS = {
+    "bookstore.book": [("book_title", "title_norm")],
+    "bookstore.author": [("name", "name_norm")],
+    "bookstore.publisher": [("name", "name_norm")],
+    "bookstore.warehouse": [("code", "code_norm")],
+}
+
+# Combining Diacritical Marks blocks: the accents left apart by the NFKD decomposition
+_ACCENTS = re.compile("[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]")
+
+
+def normalize(text):
+    "Text without accents and case-folded: 'Pérez Galdós' --> 'perez galdos'. LIKE wildcards are kept."
+    if not isinstance(text, str):
+        return text
+    if text.isascii():
+        return text.lower()
+    return _ACCENTS.sub("", unicodedata.normalize("NFKD", text)).casefold()
+
+def register(conn):
+    "Make the normalising SQL function available on a connection."
+    conn.create_function(NORM_FUNCTION, 1, normalize, deterministic=True)
+
+def migration_statements():
+    "Shadow columns and their indexes."
+    statements = []
+    for table, columns in NORM_COLUMNS.items():
+        shortName = table.split(".")[1]
+        for column, shadow in columns:
+            statements += [
+                "ALTER TABLE '" + table + "' ADD COLUMN " + shadow + " TEXT COLLATE NOCASE",
+                "UPDATE '" + table + "' SET " + shadow + " = " + NORM_FUNCTION + "(" + column + ")",
+                "CREATE INDEX " + shortName + "_" + shadow + " ON '" + table + "' (" + shadow + ")",
+            ]
+    return statements
+
+def drop_trigger_statements():
+    "The triggers that used to maintain the shadow columns, which only this program could fire."
+    statements = []
+    for table, columns in NORM_COLUMNS.items():
+        shortName = table.split(".")[1]
+        for column, shadow in columns:
+            statements += ["DROP TRIGGER IF EXISTS " + shortName + "_" + shadow + "_" + event for event in ("insert", "update")]
+    return statements
+
+def with_shadows(table, row):
+    "A row to be written (a dict by column) with the shadow columns of the ones it has."
+    for column, shadow in NORM_COLUMNS.get(table, []):
+        if column in row:
+            row[shadow] = normalize(row[column])
+    return row
+
+def refill(conn):
+    "Shadow columns brought up to date where another tool changed the row. Returns the rows fixed."
+    count = 0
+    for table, columns in NORM_COLUMNS.items():
+        for column, shadow in columns:
+            count += conn.execute("UPDATE '" + table + "' SET " + shadow + " = " + NORM_FUNCTION + "(" + column + ") " \
+                "WHERE " + shadow + " IS NOT " + NORM_FUNCTION + "(" + column + ")").rowcount
+    conn.commit()
+    return count
+
+
+_collator = None   # see get_collator()
+
+def get_collator():
+    "ICU collator for the current locale, created on first use."
+    # We need PyICU (=icu) to order unicode strings in Spanish, Catalan, French...
+    global _collator
+    if _collator is None:
+        import icu
+        _collator = icu.Collator.createInstance(icu.Locale(locale.getlocale()[0]))
+    return _collator
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# encoding: utf-8
+##############################################################################
+#     trigramIndex.py - Typo-tolerant lookup of author and publisher names
+#
+##############################################################################
+# Copyright (c) 2022, 2023 David Villena
+# All rights reserved.
+# Licensed under the New BSD License
+# (http://www.freebsd.org/copyright/freebsd-license.html)
+##############################################################################
+
+# "Garcia Marquez, G." and "García Márquez, Gabriel" are the same author, but an exact
+# name=? lookup misses it and a new author gets created. Names are split into trigrams
+# (as PostgreSQL pg_trgm does: per word, normalised, padded) and kept in an inverted index
+# in memory; the similarity of two names is the Jaccard index of their trigram sets.
+# Only the names sharing a trigram with the one searched are scored, so a lookup among
+# thousands of names takes a millisecond. The index of a table is built on first use and
+# rebuilt when the database has changed since.
+
+import collections
+import re
+
+import textSearch
+
+SIMILARITY = 0.3    # minimum to be suggested, as pg_trgm's default threshold
+SUGGESTIONS = 5
+
+# table --> (key column, name column)
+TABLES = {
+    "bookstore.author": ("numeral", "name"),
+    "bookstore.publisher": ("numeral", "name"),
+}
+
+_WORD = re.compile(r"\w+")
+
+
+def trigrams(name):
+    "Set of trigrams of a name: each normalised word padded with two spaces before and one after."
+    grams = set()
+    for word in _WORD.findall(textSearch.normalize(name)):
+        padded = "  " + word + " "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i+3])
+    return grams
+
+
+class TrigramIndex():
+    "Inverted trigram index over a set of names."
+
+    def __init__(self, names=()):
+        self.names = {}     # key --> name
+        self.grams = {}     # key --> set of trigrams
+        self.postings = collections.defaultdict(set)    # trigram --> keys
+        for key, name in names:
+            self.add(key, name)
+
+    def add(self, key, name):
+        grams = trigrams(name)
+        self.names[key] = name
+        self.grams[key] = grams
+        for gram in grams:
+            self.postings[gram].add(key)
+
+    def search(self, name, limit=SUGGESTIONS, threshold=SIMILARITY):
+        "Most similar names: list of (similarity, key, name), best first."
+        grams = trigrams(name)
+        if not grams:
+            return []
+        shared = collections.Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        found = []
+        for key, count in shared.items():
+            similarity = count / (len(grams) + len(self.grams[key]) - count)
+            if similarity >= threshold:
+                found.append((similarity, key, self.names[key]))
+        found.sort(key=lambda f: (-f[0], f[2]))
+        return found[:limit]
+
+
+_indexes = {}   # table --> (database stamp, TrigramIndex)
+
+def index(conn, table):
+    "The trigram index of a table's names, up to date with the database."
+    stamp = (id(conn), conn.execute("PRAGMA data_version").fetchone()[0], conn.total_changes)
+    cached = _indexes.get(table)
+    if cached is None or cached[0] != stamp:
+        keyColumn, nameColumn = TABLES[table]
+        rows = conn.execute("SELECT " + keyColumn + ", " + nameColumn + " FROM '" + table + "'")
+        cached = (stamp, TrigramIndex(rows))
+        _indexes[table] = cached
+    return cached[1]
+
+def suggest(conn, table, name, limit=SUGGESTIONS):
+    "Existing names of a table similar to name: list of (similarity, key, name), best first."
+    return index(conn, table).search(name, limit)
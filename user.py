@@ -13,13 +13,14 @@
 import base64
 import curses
 import sqlite3
-import time
 
 import npyscreen
 from npyscreen import wgwidget as widget
 
 import bsWidgets as bs
 import config
+import eventLog
+import numeralSequence
 
 DATEFORMAT = config.dateFormat
 DBTABLENAME = "'bookstore.User'"
@@ -98,6 +99,8 @@ class UserForm(npyscreen.FormBaseNew):
 
     def exitUser(self, modified):
         "Exit record form."
+        if self.current_option == "Create":
+            numeralSequence.release(DBTABLENAME, self.newNumeral)   # back to the block if it wasn't used
         self.passwordFld.label_widget.value = "Encrypted password:"
         if modified:    # modify grid if needed
             self.update_fileRow()
@@ -106,40 +109,27 @@ class UserForm(npyscreen.FormBaseNew):
             self.backup_fields()
         self.selectorForm.grid.update()
 
-        # To unlock the database (for Create) we must disconnect and re-connect:
+        # To end the transaction left open by Update or Delete, we disconnect and re-connect:
         config.conn.close()
         self.parentApp.connect_database()
 
         config.parentApp.setNextForm("USERSELECTOR")
         config.parentApp.switchFormNow()
 
-    def get_last_numeral(self):
-        cur = config.conn.cursor()
-        sqlQuery = "SELECT Numeral FROM " + DBTABLENAME + " ORDER BY Numeral DESC LIMIT 1"
-        cur.execute(sqlQuery)
-        try:
-            numeral = cur.fetchone()[0]
-        except TypeError:   # there are no rows
-            numeral = 0
-        config.conn.commit()
-        return numeral
-
     def set_createMode():
         "Setting the user form to create a new record."
         global form
         conn = config.conn
-        while True:     # for Creation, we must set the locking here
+        while True:     # a numeral nobody else gets: no need to lock the database while the form is open
             try:
-                conn.isolation_level = 'EXCLUSIVE'  # Database locking: SQLite only allows a single writer per database
-                conn.execute('PRAGMA locking_mode = EXCLUSIVE')
-                conn.execute('BEGIN EXCLUSIVE TRANSACTION')     # exclusive access starts here. Nothing else can r/w the DB.
+                form.newNumeral = numeralSequence.next_numeral(conn, DBTABLENAME)
                 break
             except sqlite3.OperationalError:
                 bs.notify_OK("\n    Database is locked, please wait.", "Message")
         form.current_option = "Create"
         form.numeralFld.editable = True
         form.numeralFld.maximum_string_length = 3
-        form.numeralFld.value = str(form.get_last_numeral() + 1)
+        form.numeralFld.value = str(form.newNumeral)
         form.userFld.editable = True
         form.userFld.value = ""
         form.usernameFld.editable = True
@@ -291,6 +281,7 @@ class UserForm(npyscreen.FormBaseNew):
         self.selectorForm.grid.set_highlight_row(int(self.numeralFld.value))
         self.exitUser(modified=False)
 
+    @eventLog.timed("delete")
     def delete_user(self):
         "Button based Delete function for D=Delete."
         conn = config.conn
@@ -333,7 +324,7 @@ class UserForm(npyscreen.FormBaseNew):
     def deleteCancelbtn_function(self):
         "Cancel button function under Delete mode."
         bs.notify("\n   Record was NOT deleted", title="Message", form_color='STANDOUT', wrap=True, wide=False)
-        time.sleep(0.4)     # let it be seen
+        bs.pause(0.4)     # let it be seen
         self.exitUser(modified=False)
 
     def while_editing(self, *args, **keywords):
@@ -461,6 +452,7 @@ class UserForm(npyscreen.FormBaseNew):
         self.passwordFld.value = repr(dataBytes)[2:-1]
         form.editw = form.get_editw_number("Encrypted password:") - 1
     
+    @eventLog.timed("saveCreated")
     def save_created_user(self):
         "Button based Save function for C=Create."
         conn = config.conn
@@ -470,7 +462,6 @@ class UserForm(npyscreen.FormBaseNew):
         values = (self.numeralFld.value, self.userFld.value, self.usernameFld.value, self.userlevelFld.value, DBcreationDate, self.passwordFld.value)
         cur.execute(sqlQuery, values)
         conn.commit()
-        conn.isolation_level = None     # free the multiuser lock
         config.fileRow[0] = cur.lastrowid
         bs.notify("\n       Record created", title="Message", form_color='STANDOUT', wrap=True, wide=False)
         # update config.fileRows:
@@ -485,6 +476,7 @@ class UserForm(npyscreen.FormBaseNew):
         config.fileRows.append(new_record)
         self.exitUser(modified=True)
 
+    @eventLog.timed("saveUpdated")
     def save_updated_user(self):
         "Button based Save function for U=Update."
         if self.password_changed:   # we've changed the password
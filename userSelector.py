@@ -22,10 +22,15 @@ import sqlite3
 import time
 
 import npyscreen
-import numpy
 
 import bsWidgets as bs
+import changeFeed
 import config
+import database
+import eventLog
+import findCache
+import findPlanner
+import textSearch
 from config import SCREENWIDTH as WIDTH
 from user import UserForm
 
@@ -34,6 +39,8 @@ REMEMBER_SUBSET = config.REMEMBER_SUBSET  # remember the last found subset
 DATEFORMAT = config.dateFormat  # program-wide
 FIELD_LIST = ["numeral", "user", "name", "level", "date", "password"] # only screen fields
 DBTABLENAME = "'bookstore.User'"
+# Find columns searched ignoring accents and case, normalised on the fly (textSearch)
+FIND_COLUMNS = {"user": "bs_norm(user)", "user_name": "bs_norm(user_name)"}
 
 helpText =  "The final user selector.\n\n" +\
     "* This grid has no specified column widths, they are set by default. And there's an extra column to the right " \
@@ -55,6 +62,8 @@ class UserSelectForm(npyscreen.FormBaseNew):
     def create(self):
         "The standard constructor will call the method .create(), which you should override to create the Form widgets."
         self.framed = False   # frameless form
+        self.changeFeed = changeFeed.GridFeed(self, DBTABLENAME)    # the other terminals' changes
+        self.keypress_timeout = changeFeed.TICK     # so while_waiting() gets called
         self.how_exited_handers[npyscreen.wgwidget.EXITED_ESCAPE]  = self.exitUserSelector   # Escape exit
         
         # Form title - Screen title line
@@ -115,6 +124,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
     def getRowListForScreen(self, filerows):
         "Memory row list to screen row list for grid."
         if len(filerows) > 0:
+            import numpy    # heavy import, only when there are rows to show
             self.screenFileRows = numpy.array(filerows)  # I need numpy to...
             self.screenFileRows = self.screenFileRows[:, 1:]  # ...cut the first field ("id")
             return self.screenFileRows.tolist()          # and again to list
@@ -124,7 +134,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
 
     def readDBTable(self):
         "Reads the full table and returns a list of list-rows."
-        cur = config.conn.cursor()
+        cur = database.reader().cursor()
         while True:     # multiuser DB locking loop
             try:
                 cur.execute("SELECT * FROM " + DBTABLENAME + " ORDER BY numeral")
@@ -132,16 +142,27 @@ class UserSelectForm(npyscreen.FormBaseNew):
             except sqlite3.OperationalError:
                 bs.notify_OK("\n    Database is locked, please wait.", "Message")
         filerows = cur.fetchall()
+        rows = self.convert_rows(filerows)
+        self.set_up_title(filerows, full_set=True)
+        return rows # it's a list of lists
+
+    def convert_rows(self, filerows):
+        "Table rows to grid rows, the id included."
         rows = []        
         for row in filerows:
             creationDate   = self.DBtoScreenDate(row[5],DATEFORMAT)
             cRow = [row[0], row[1], row[2], row[3], row[4], creationDate, row[6]]     # cRow="Converted row"
             rows.append(cRow)    # including User.id
-        self.set_up_title(filerows, full_set=True)
-        return rows # it's a list of lists
+        return rows
+
+    def while_waiting(self):
+        "Called while no key is pressed."
+        self.changeFeed.tick()
 
+    @eventLog.timed("fillGrid")
     def fill_grid(self):
         "Read the DB table and put it into the grid."
+        self.changeFeed.reset(database.reader())   # the other terminals' changes, from now on
         config.fileRows = self.readDBTable()        # full row set: it's a list of lists
         self.screenFileRows = self.getRowListForScreen(config.fileRows)     # it's a list of lists
         self.grid.values = self.screenFileRows
@@ -176,7 +197,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Create"
         self.inputOpt.value = "C"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the C
+        bs.pause(0.1)     # shows the C
         # Disable options input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -195,7 +216,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Read"
         self.inputOpt.value = "R"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the R
+        bs.pause(0.1)     # shows the R
         # Disable options input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -233,7 +254,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Update"
         self.inputOpt.value = "U"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the U
+        bs.pause(0.1)     # shows the U
         # Disable options input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -271,7 +292,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Find"
         self.inputOpt.value = "F"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the F
+        bs.pause(0.1)     # shows the F
         # Disable options input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -309,7 +330,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
         self.inputDetail.option = "Delete"
         self.inputOpt.value = "D"
         self.inputOpt.display()
-        time.sleep(0.1)     # shows the D
+        bs.pause(0.1)     # shows the D
         # Disable options input field
         self.inputOpt.editing = False
         self.inputOpt.editable = False
@@ -474,7 +495,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
             else:
                 if literal[2] in ["-","/"] and literal[5] in ["-", "/"]:    # Wrong separators
                     bs.notify("\n    Error in date separators.", "Message")
-                    time.sleep(0.3)     # let it be seen
+                    bs.pause(0.3)     # let it be seen
         if isDate:
             return True
         else:
@@ -499,8 +520,8 @@ class UserSelectForm(npyscreen.FormBaseNew):
         DBdate = year+"-"+month+"-"+day+" 00:00:00.000"
         return DBdate
 
-    def find_DB_rows(self, find_literal):
-        "SQL-Based Find function: Executes SQL query for Find option."
+    def find_query(self, find_literal):
+        "SQL query for a Find literal: (sqlQuery, values, likeColumns). Raises bs.FindError if it's wrong."
         # Accepting:
         #   - A literal without ":" (searches in all the field/columns).
         #   - A literal with ":" like in field:searched_literal.
@@ -513,8 +534,7 @@ class UserSelectForm(npyscreen.FormBaseNew):
             field = find_literal[:pos]
             literal = find_literal[pos+1:]
             if field.lower() not in field_list or literal == "":
-                bs.notify_OK(" Find: Wrong field or literal", "Message")
-                return False
+                raise bs.FindError(" Find: Wrong field or literal")
             if field == "name": # Small fixing to simplify searches
                 field = "user_name"
             elif field == "level":
@@ -529,17 +549,17 @@ class UserSelectForm(npyscreen.FormBaseNew):
             comparator = literal[0]
             literal = literal[1:]
         if comparator and not field:
-            bs.notify_OK(" Find: Must specify 'field:' when using a comparator", "Message")
-            return False
+            raise bs.FindError(" Find: Must specify 'field:' when using a comparator")
 
         date_literal = None
         if self.looks_like_a_date(literal, DATEFORMAT):    # Date check
             date_literal = self.screenToDBdate(literal, DATEFORMAT)
         else:
             if field in ["creation_date",]:
-                bs.notify_OK("Find: Error in date literal", "Message")
-                return False
+                raise bs.FindError("Find: Error in date literal")
 
+        normalized = not comparator and (not field or field.lower() in FIND_COLUMNS)
+        likeColumns = None  # result columns searched with LIKE %literal%: a longer literal can be refined from them
         sqlQuery = "SELECT * FROM " + DBTABLENAME 
         
         if not comparator:
@@ -551,13 +571,16 @@ class UserSelectForm(npyscreen.FormBaseNew):
                     whereStr = "WHERE 'bookstore.user'.creation_date LIKE ?" \
                         " COLLATE NOCASE ORDER BY 'bookstore.book'.numeral"
                     literal = date_literal
+                    likeColumns = (5,)
                 else:
-                    whereStr = " WHERE numeral LIKE ? OR user LIKE ? OR user_name LIKE ?" +\
+                    whereStr = " WHERE numeral LIKE ? OR bs_norm(user) LIKE ? OR bs_norm(user_name) LIKE ?" +\
                         " OR user_level LIKE ? OR creation_date LIKE ? COLLATE NOCASE ORDER BY numeral"
+                    likeColumns = (1, 2, 3, 4, 5)
             else:
                 if date_literal:
                     literal = date_literal
-                whereStr = " WHERE " + field + " LIKE ? COLLATE NOCASE ORDER BY numeral"
+                whereStr = " WHERE " + FIND_COLUMNS.get(field.lower(), field) + " LIKE ? COLLATE NOCASE ORDER BY numeral"
+                likeColumns = (FIELD_LIST.index(find_literal[:find_literal.find(":")].lower()) + 1,)
         
         elif comparator:
             if date_literal:
@@ -566,24 +589,50 @@ class UserSelectForm(npyscreen.FormBaseNew):
 
         sqlQuery += whereStr
 
-        cur = config.conn.cursor()
+        if normalized:
+            literal = textSearch.normalize(literal)
+        if comparator:
+            pass    # leave literal without percents
+        else:
+            literal = "%" + literal + "%"
+        values = ()
+        for i in range(sqlQuery.count("?")):    # setting the parameters for SQL
+            values += (literal,)
+        return sqlQuery, values, likeColumns
+
+    def exact_query(self, find_literal):
+        "Indexed equality lookup if the literal is a whole numeral: (sqlQuery, values), else None."
+        shape = findPlanner.exact_shape(find_literal, ("numeral",))
+        if shape is None:
+            return None
+        return "SELECT * FROM " + DBTABLENAME + " WHERE numeral = ?", (shape[1],)
+
+    @eventLog.timed("findRows")
+    def find_DB_rows(self, find_literal):
+        "SQL-Based Find function: Executes SQL query for Find option."
         try:
-            if comparator:
-                pass    # leave literal without percents
-            else:
-                literal = "%" + literal + "%"
-            values = ()
-            for i in range(sqlQuery.count("?")):    # setting the parameters for SQL
-                values += (literal,)
-            cur.execute(sqlQuery, values)
-
+            sqlQuery, values, likeColumns = self.find_query(find_literal)
+        except bs.FindError as e:
+            bs.notify_OK(str(e), "Message")
+            return False
+        exact = self.exact_query(find_literal)
+        try:
+            conn = database.reader()
+            filerows = findCache.fetch(conn, *exact) if exact is not None else []
+            if not filerows:    # no exact match: the substring search
+                filerows = findCache.fetch(conn, sqlQuery, values)
         except sqlite3.OperationalError as e:   # some inputs like '\' 
             bs.notify_OK("\n    sqlite3.OperationalError: \n"+str(e),"Message", form_color='STANDOUT', wrap=True, wide=False)
-            return False            
-        filerows = cur.fetchall()
+            return False
         if len(filerows) == 0:
             bs.notify("\n    No matching records found","Message", form_color='STANDOUT', wrap=True, wide=False)
             return False
+        self.show_found_rows(filerows)
+        return True
+
+    def show_found_rows(self, filerows):
+        "Rows found by a Find query, to the grid."
+        self.changeFeed.fullSet = False
         rows = []        
         for row in filerows:
             creationDate   = self.DBtoScreenDate(row[5],DATEFORMAT)
@@ -593,7 +642,6 @@ class UserSelectForm(npyscreen.FormBaseNew):
         self.screenFileRows = self.getRowListForScreen(config.fileRows)     # it's a list of lists
         self.grid.values = self.screenFileRows
         self.set_up_title(filerows, full_set=False)
-        return True
 
     def textfield_exit(self):
         "Exit from Detail field with Escape"
@@ -10,11 +10,10 @@
 # (http://www.freebsd.org/copyright/freebsd-license.html)
 ##############################################################################
 
-import time
-
 import npyscreen
 from npyscreen import util_viewhelp
 
+import bsWidgets as bs
 import config
 
 helpText =  "  Utilities submenu.\n\n" +\
@@ -51,6 +50,10 @@ class UtilitiesMenuForm(npyscreen.FormBaseNew):
         self.add_handlers({"1": self.keyHandler})  # menu 1
         self.add_handlers({"2": self.keyHandler})  # menu 2
         self.add_handlers({"3": self.keyHandler})  # menu 3
+        self.add_handlers({"4": self.keyHandler})  # menu 4
+        self.add_handlers({"5": self.keyHandler})  # menu 5
+        self.add_handlers({"6": self.keyHandler})  # menu 6
+        self.add_handlers({"7": self.keyHandler})  # menu 7
         self.add_handlers({"q": self.keyHandler})  # exit with "q"
         self.add_handlers({"Q": self.keyHandler})  # exit with "Q"
    
@@ -59,22 +62,42 @@ class UtilitiesMenuForm(npyscreen.FormBaseNew):
             case 49:    # menu 1
                 self.selector.cursor_line=0
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.userSelector()
             case 50:    # menu 2
                 self.selector.cursor_line=1
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.dbIntegrityCheck()
             case 51:    # menu 3
                 self.selector.cursor_line=2
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.deleteMultipleRecords()
+            case 52:    # menu 4
+                self.selector.cursor_line=3
+                self.display()
+                bs.pause(0.2)
+                self.duplicateAuthors()
+            case 53:    # menu 5
+                self.selector.cursor_line=4
+                self.display()
+                bs.pause(0.2)
+                self.duplicateBooks()
+            case 54:    # menu 6
+                self.selector.cursor_line=5
+                self.display()
+                bs.pause(0.2)
+                self.backupDatabase()
+            case 55:    # menu 7
+                self.selector.cursor_line=6
+                self.display()
+                bs.pause(0.2)
+                self.dbMaintenance()
             case ( 81 | 113 ):    # menu Q/q
-                self.selector.cursor_line=2
+                self.selector.cursor_line=7
                 self.display()
-                time.sleep(0.2)
+                bs.pause(0.2)
                 self.exitUtilities()
 
     def pre_edit_loop(self):
@@ -91,11 +114,15 @@ class UtilitiesMenuForm(npyscreen.FormBaseNew):
            "1. User edition",
            "2. Check database referential integrity",
            "3. Delete multiple records",
+           "4. Merge duplicate authors",
+           "5. Duplicate books report",
+           "6. Backup database",
+           "7. Database maintenance",
            "Q. Quit utilities" ]
 
         self.selector = self.add(VerticalMenu,
                         w_id=None,
-                        max_height=7,
+                        max_height=9,
                         rely=9,
                         relx=28,
                         name="UtilitiesMenu",
@@ -134,6 +161,38 @@ class UtilitiesMenuForm(npyscreen.FormBaseNew):
         App = config.parentApp
         App.switchForm("DELETE_MULTIPLE_RECORDS")
 
+    def duplicateAuthors(self):
+        "Find and merge duplicate authors."
+        App = config.parentApp
+        App.switchForm("DUPLICATE_AUTHORS")
+
+    def duplicateBooks(self):
+        "Report of the books entered twice."
+        import duplicateBooks
+        bs.notify("\n    Looking for duplicate books...", title="Message", form_color='STANDOUT', wrap=True, wide=False)
+        try:
+            duplicateBooks.show_report(config.conn)
+        except FileNotFoundError as e:  # no report directory, or no text viewer
+            bs.notify_OK("\n    " + str(e), "Message", wrap=True)
+        config.parentApp.getForm("UTILITIES").display(clear=True)     # also called from the menu class
+
+    def dbMaintenance(self):
+        "Statistics, vacuum and space report of the database."
+        App = config.parentApp
+        App.switchForm("DB_MAINTENANCE")
+
+    def backupDatabase(self):
+        "Online backup of the database, while the other terminals keep working."
+        import dbBackup
+        bs.notify("\n    Backing up the database...", title="Message", form_color='STANDOUT', wrap=True, wide=False)
+        try:
+            result = dbBackup.backup()
+        except (dbBackup.BackupError, OSError) as e:
+            bs.notify_OK("\n    " + str(e), "Message", wrap=True)
+        else:
+            bs.notify_OK("\n" + dbBackup.summary(result), "Backup", wrap=True)
+        config.parentApp.getForm("UTILITIES").display(clear=True)
+
     def h_display_help(self, input):
         "Adaptation from FormBase to redraw the menu screen."
         if self.help == None: return
@@ -159,3 +218,11 @@ class VerticalMenu(npyscreen.MultiLineAction):
             UtilitiesMenuForm.dbIntegrityCheck(UtilitiesMenuForm)
         elif act_on_this[0] == "3": # Delete multiple records
             UtilitiesMenuForm.deleteMultipleRecords(UtilitiesMenuForm)
+        elif act_on_this[0] == "4": # Merge duplicate authors
+            UtilitiesMenuForm.duplicateAuthors(UtilitiesMenuForm)
+        elif act_on_this[0] == "5": # Duplicate books report
+            UtilitiesMenuForm.duplicateBooks(UtilitiesMenuForm)
+        elif act_on_this[0] == "6": # Backup database
+            UtilitiesMenuForm.backupDatabase(UtilitiesMenuForm)
+        elif act_on_this[0] == "7": # Database maintenance
+            UtilitiesMenuForm.dbMaintenance(UtilitiesMenuForm)
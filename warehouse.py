@@ -12,12 +12,14 @@
 
 import curses
 import sqlite3
-import time
 
 import npyscreen
 
 import bsWidgets as bs
 import config
+import eventLog
+import numeralSequence
+import textSearch
 
 DATEFORMAT = config.dateFormat
 DBTABLENAME = "'bookstore.Warehouse'"
@@ -93,47 +95,35 @@ class WarehouseForm(npyscreen.FormBaseNew):
 
     def exitWarehouse(self, modified):
         "Exit record form."
+        if self.current_option == "Create":
+            numeralSequence.release(DBTABLENAME, self.newNumeral)   # back to the block if it wasn't used
         if modified:    # modify grid if needed
             self.update_fileRow()
             self.selectorForm.update_grid()
             self.backup_fields()
         self.selectorForm.grid.update()
 
-        # To unlock the database (for Create) we must disconnect and re-connect:
+        # To end the transaction left open by Update or Delete, we disconnect and re-connect:
         config.conn.close()
         self.parentApp.connect_database()
 
         config.parentApp.setNextForm("WAREHOUSESELECTOR")
         config.parentApp.switchFormNow()
 
-    def get_last_numeral(self):
-        "Get the last numeral from the database."
-        cur = config.conn.cursor()
-        sqlQuery = "SELECT Numeral FROM " + DBTABLENAME + " ORDER BY Numeral DESC LIMIT 1"
-        cur.execute(sqlQuery)
-        try:
-            numeral = cur.fetchone()[0]
-        except TypeError:   # there are no rows
-            numeral = 0
-        config.conn.commit()
-        return numeral
-
     def set_createMode():
         "Setting the warehouse form to create a new record."
         global form
         conn = config.conn
-        while True:     # for Creation, we must set the locking here
+        while True:     # a numeral nobody else gets: no need to lock the database while the form is open
             try:
-                conn.isolation_level = 'EXCLUSIVE'  # Database locking: SQLite only allows a single writer per database
-                conn.execute('PRAGMA locking_mode = EXCLUSIVE')
-                conn.execute('BEGIN EXCLUSIVE TRANSACTION')     # exclusive access starts here. Nothing else can r/w the DB.
+                form.newNumeral = numeralSequence.next_numeral(conn, DBTABLENAME)
                 break
             except sqlite3.OperationalError:
                 bs.notify_OK("\n    Database is locked, please wait.", "Message")
         form.current_option = "Create"
         form.numeralFld.editable = True
         form.numeralFld.maximum_string_length = 3
-        form.numeralFld.value = str(form.get_last_numeral() + 1)
+        form.numeralFld.value = str(form.newNumeral)
         form.codeFld.editable = True
         form.codeFld.value = ""
         form.addressFld.editable = True
@@ -262,6 +252,7 @@ class WarehouseForm(npyscreen.FormBaseNew):
         self.selectorForm.grid.set_highlight_row(int(self.numeralFld.value))
         self.exitWarehouse(modified=False)
 
+    @eventLog.timed("delete")
     def delete_warehouse(self):
         "Button based Delete function for D=Delete."
 
@@ -305,7 +296,7 @@ class WarehouseForm(npyscreen.FormBaseNew):
     def deleteCancelbtn_function(self):
         "Cancel button function under Delete mode."
         bs.notify("\n   Record was NOT deleted", title="Message", form_color='STANDOUT', wrap=True, wide=False)
-        time.sleep(0.4)     # let it be seen
+        bs.pause(0.4)     # let it be seen
         self.exitWarehouse(modified=False)
 
     def while_editing(self, *args, **keywords):
@@ -380,16 +371,16 @@ class WarehouseForm(npyscreen.FormBaseNew):
         self.statusLine.display()
         curses.beep()
 
+    @eventLog.timed("saveCreated")
     def save_created_warehouse(self):
         "Button based Save function for C=Create."
 
         conn = config.conn
         cur = conn.cursor()
-        sqlQuery = "INSERT INTO " + DBTABLENAME + " (numeral,code,address,phone) VALUES (?,?,?,?)"
-        values = (self.numeralFld.value, self.codeFld.value, self.addressFld.value, self.phoneFld.value)
+        sqlQuery = "INSERT INTO " + DBTABLENAME + " (numeral,code,code_norm,address,phone) VALUES (?,?,?,?,?)"
+        values = (self.numeralFld.value, self.codeFld.value, textSearch.normalize(self.codeFld.value), self.addressFld.value, self.phoneFld.value)
         cur.execute(sqlQuery, values)
         conn.commit()
-        conn.isolation_level = None     # free the multiuser lock
         config.fileRow[0] = cur.lastrowid
         bs.notify("\n       Record created", title="Message", form_color='STANDOUT', wrap=True, wide=False)
         # update config.fileRows:
@@ -402,6 +393,7 @@ class WarehouseForm(npyscreen.FormBaseNew):
         config.fileRows.append(new_record)
         self.exitWarehouse(modified=True)
 
+    @eventLog.timed("saveUpdated")
     def save_updated_warehouse(self):
         "Button based Save function for U=Update."
         if self.numeralFld.value != self.bu_numeral:
@@ -413,8 +405,9 @@ class WarehouseForm(npyscreen.FormBaseNew):
             config.conn.commit()
         # Update the warehouse record
         cur = config.conn.cursor()
-        sqlQuery = "UPDATE " + DBTABLENAME + " SET numeral=?, code=?, address=?, phone=? WHERE id=?"
-        values = (self.numeralFld.value, self.codeFld.value, self.addressFld.value, self.phoneFld.value, config.fileRow[0])
+        sqlQuery = "UPDATE " + DBTABLENAME + " SET numeral=?, code=?, code_norm=?, address=?, phone=? WHERE id=?"
+        values = (self.numeralFld.value, self.codeFld.value, textSearch.normalize(self.codeFld.value), self.addressFld.value, \
+            self.phoneFld.value, config.fileRow[0])
         try:
             cur.execute(sqlQuery, values)
             config.conn.commit()